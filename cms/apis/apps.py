@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ApisConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apis'
+
+    def ready(self):
+        from . import signals # noqa: F401 - registers the cache invalidation receivers
+        from . import shared_state # noqa: F401 - registers the shared state check
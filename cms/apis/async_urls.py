@@ -0,0 +1,21 @@
+"""
+URLconf used under ASGI (settings.ASYNC_READ_VIEWS): the routes and names of apis/urls.py,
+with the busiest reads answered by apis/async_views.py.
+"""
+from django.urls import path
+
+from . import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+async_reads = {
+    'article-list-create': async_views.ArticleListView,
+    'article-detail-update-delete': async_views.ArticleDetailView,
+    'comment-list-create': async_views.CommentListView,
+    'article-search': async_views.ArticleSearchView,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), async_reads[pattern.name].as_view(fallback=pattern.callback), name=pattern.name)
+    if pattern.name in async_reads else pattern
+    for pattern in sync_urlpatterns
+]
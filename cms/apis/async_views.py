@@ -0,0 +1,203 @@
+"""
+Async-native read path for the busiest GET endpoints, served when the project runs under
+ASGI (settings.ASYNC_READ_VIEWS, routed by apis/async_urls.py).
+
+Each view wraps the DRF view that owns the endpoint and reuses its rules rather than restating
+them: the sync view's initial() runs its authentication classes, permission and throttle
+checks (on a thread, since they may block), its get_queryset() applies the visibility
+filters, and its paginator, serializers and renderers shape the response. Only the reads
+change: every query for the payload goes through Django's async ORM, so the event loop keeps
+serving other requests while one waits on the database. The validators and the response
+cache read version stamps from the shared-state file (apis/shared_state.py), so each view
+bundles those reads into one sync lookup and runs it on a thread as well.
+Other methods on the same URL (POST, PUT, ...) are handed to the sync view.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.template.response import SimpleTemplateResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.response import Response
+
+from articles import threads
+
+from . import conditional, replicas, response_cache, views
+from .query_budget import query_budget
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+async def embed_comments(view, articles):
+    # ArticleViewSet.embed_comments, through the async ORM
+    limit = threads.embed_limit(view.request.query_params.get('comments'))
+    if limit:
+        await threads.aattach_latest_comments(articles, limit)
+
+
+def validate(request, make_validators, *args):
+    """
+    Build the validators and the 304 they allow, if any.
+    """
+    validators = make_validators(request, *args)
+    return validators, conditional.not_modified(request, validators)
+
+
+def rendered(response):
+    """
+    Render a DRF response here; Django would render a deferred response on a thread.
+    """
+    if not isinstance(response, SimpleTemplateResponse):
+        return response
+    response.render()
+    plain = HttpResponse(response.content, status=response.status_code)
+    for header, value in response.items():
+        plain[header] = value
+    return plain
+
+
+class AsyncReadView:
+    """
+    Async GET/HEAD for an endpoint owned by the DRF view `view_class`; `action` names the
+    viewset action it stands in for. Subclasses implement `read(view, request, **kwargs)`.
+    """
+    view_class = None
+    action = None
+
+    @classmethod
+    def as_view(cls, fallback):
+        """
+        `fallback` is the sync view callable answering every other method.
+        """
+        async def view(request, *args, **kwargs):
+            if request.method not in READ_METHODS:
+                return await sync_to_async(fallback)(request, *args, **kwargs)
+            return await cls().dispatch(request, *args, **kwargs)
+        view.view_class = cls
+        return csrf_exempt(view) # As APIView.as_view; session-authenticated writes get DRF's own CSRF check
+
+    async def dispatch(self, request, *args, **kwargs):
+        view = self.view_class()
+        if self.action is not None:
+            view.action_map = {'get': self.action, 'head': self.action}
+        view.args, view.kwargs = args, kwargs
+        view.request = drf_request = view.initialize_request(request, *args, **kwargs)
+        view.headers = view.default_response_headers
+        try:
+            # The sync view's authentication classes, permissions and throttles. Session and
+            # token lookups on a cache miss and the throttle file's write lock can all block,
+            # so they run on a thread rather than on the event loop.
+            await sync_to_async(view.initial)(drf_request, *args, **kwargs)
+            response = await self.read(view, drf_request, **kwargs)
+        except Exception as exc:
+            response = view.handle_exception(exc)
+        return rendered(view.finalize_response(drf_request, response, *args, **kwargs))
+
+    async def read(self, view, request, **kwargs):
+        raise NotImplementedError
+
+
+# GET /articles/
+class ArticleListView(AsyncReadView):
+    view_class = views.ArticleViewSet
+    action = 'list'
+
+    @query_budget(2) # As ArticleViewSet.list
+    async def read(self, view, request):
+        validators, response, key = await sync_to_async(self.lookup)(view, request)
+        if response is not None:
+            return response
+
+        with replicas.primary(): # As ResponseCacheMixin.list
+            page = await view.paginator.apaginate_queryset(view.filter_queryset(view.get_queryset()), request, view)
+            await embed_comments(view, page)
+        response = view.get_paginated_response(view.get_serializer(page, many=True).data)
+        await sync_to_async(response_cache.set_list)(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return conditional.set_headers(response, validators)
+
+    def lookup(self, view, request):
+        """
+        Validators, the 304 or cached page to answer with (if any), and the cache key.
+        """
+        validators = conditional.article_list_validators(request)
+        unchanged = conditional.not_modified(request, validators)
+        if unchanged is not None:
+            return validators, unchanged, None
+        key, data = response_cache.get_list(request)
+        response_cache.record(hit=data is not None)
+        if data is None:
+            return validators, None, key
+        return validators, conditional.set_headers(view.cached_response(data, 'HIT'), validators), key
+
+
+# GET /articles/<slug>/
+class ArticleDetailView(AsyncReadView):
+    view_class = views.ArticleViewSet
+    action = 'retrieve'
+
+    @query_budget(3) # As ArticleViewSet.retrieve
+    async def read(self, view, request, slug):
+        article = await self.article(view, request, slug)
+        validators, response, keys = await sync_to_async(self.lookup)(view, request, article)
+        if response is not None:
+            return response
+
+        with replicas.primary(): # As ResponseCacheMixin.retrieve
+            if replicas.from_replica(article):
+                article = await self.article(view, request, slug)
+            await embed_comments(view, [article])
+        response = Response(view.get_serializer(article).data)
+        await sync_to_async(response_cache.store_detail)(keys, article, response.data)
+        response['X-Cache'] = 'MISS'
+        return conditional.set_headers(response, validators)
+
+    def lookup(self, view, request, article):
+        """
+        As ArticleListView.lookup, for one article; returns the cache keys last.
+        """
+        validators = conditional.article_validators(request, article)
+        unchanged = conditional.not_modified(request, validators)
+        if unchanged is not None:
+            return validators, unchanged, None
+        keys, data = response_cache.get_detail(request, article.slug)
+        response_cache.record(hit=data is not None)
+        if data is None:
+            return validators, None, keys
+        return validators, conditional.set_headers(view.cached_response(data, 'HIT'), validators), keys
+
+    async def article(self, view, request, slug):
+        # ArticleViewSet.get_object, through the async ORM
+        article = await view.filter_queryset(view.get_queryset()).filter(slug=slug).afirst()
+        if article is None or not views.can_read_article(request.user, article):
+            raise Http404()
+        view.check_object_permissions(request, article)
+        view.object = article
+        return article
+
+
+# GET /articles/<slug>/comments/
+class CommentListView(AsyncReadView):
+    view_class = views.CommentListCreateAPIView
+
+    @query_budget(3) # As ThreadListMixin.list
+    async def read(self, view, request, slug):
+        activity = await threads.athread_activity(slug)
+        if activity is None:
+            raise Http404() # Missing or unpublished article
+        validators, unchanged = await sync_to_async(validate)(request, conditional.thread_validators, slug, activity)
+        if unchanged is not None:
+            return unchanged
+
+        page = await view.paginator.apaginate_queryset(view.get_queryset(), request, view)
+        await threads.aattach_reply_previews(page)
+        response = view.get_paginated_response(view.get_serializer(page, many=True).data)
+        return conditional.set_headers(response, validators)
+
+
+# GET /articles/search/?q=keyword
+class ArticleSearchView(AsyncReadView):
+    view_class = views.ArticleSearchView
+
+    @query_budget(1) # As views.ArticleSearchView.get
+    async def read(self, view, request):
+        page = await view.paginator.apaginate_queryset(view.filter_queryset(view.get_queryset()), request, view)
+        return view.get_paginated_response(view.get_serializer(page, many=True).data)
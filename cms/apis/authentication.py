@@ -0,0 +1,223 @@
+"""
+Token and session authentication that resolve credentials to a cached user snapshot.
+
+DRF's TokenAuthentication joins authtoken_token to users_customuser on every request, and
+SessionAuthentication reads the session row and then fetches the user. These classes keep
+the resolved token and user in the 'auth' cache (a bounded LocMemCache, see settings.CACHES)
+for AUTH_CACHE_TIMEOUT seconds; sessions are read through the cached_db engine, so a repeat
+request needs no authentication queries at all.
+
+apis/signals.py drops a user's entries when one of their tokens is deleted or the user is
+saved or deleted, which covers password changes and is_active/is_verified flips. Changes
+that bypass signals (QuerySet.update) show up once the entry expires. LocMemCache is private
+to each worker process, so with it the drop alone would only reach the process that made the
+change. Each entry therefore also records the user's revision stamp (apis/shared_state.py),
+which every drop replaces and every cache hit compares, so revocation reaches all workers at
+once. With a shared 'auth' backend (REDIS_URL) the drop is enough and hits skip the stamp.
+
+AccessTokenAuthentication accepts the signed access tokens from users/tokens.py, which need
+no lookup at all on reads.
+"""
+from hashlib import sha256
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user, get_user_model
+from django.core import checks, signing
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.crypto import constant_time_compare
+from rest_framework import authentication, exceptions, permissions
+from rest_framework.authtoken.models import Token
+
+from users import tokens
+
+from . import replicas, shared_state
+
+CustomUser = get_user_model()
+
+PREFIX = 'auth'
+
+# Saves that only touch these fields leave cached snapshots alone (e.g. last_login on login)
+IGNORED_FIELDS = {'last_login'}
+
+
+def auth_alias():
+    return 'auth' if 'auth' in settings.CACHES else 'default'
+
+
+def auth_cache():
+    return caches[auth_alias()]
+
+
+def timeout():
+    return getattr(settings, 'AUTH_CACHE_TIMEOUT', 60)
+
+
+def token_key(key):
+    # Hashed, so raw tokens never appear in cache keys
+    return f'{PREFIX}:token:{sha256(key.encode("utf-8")).hexdigest()}'
+
+
+def session_key(user_id):
+    return f'{PREFIX}:session:{user_id}'
+
+
+def revision_key(user_id):
+    return f'{PREFIX}:revision:{user_id}'
+
+
+def revision(user_id):
+    """
+    The user's revision stamp, or None when the auth cache is shared and needs none.
+    """
+    if shared_state.cache_is_shared(auth_alias()):
+        return None
+    return shared_state.get_versions(revision_key(user_id))[0]
+
+
+def cached_token(key):
+    """
+    The Token (with its user) for `key` if it is cached, else None.
+    """
+    entry = auth_cache().get(token_key(key))
+    if entry is None or entry['revision'] != revision(entry['token'].user_id):
+        return None
+    return entry['token']
+
+
+def remember_token(token):
+    entry = {'token': token, 'revision': revision(token.user_id)}
+    auth_cache().set(token_key(token.key), entry, timeout())
+
+
+def session_credentials(session):
+    """
+    (user id, backend, session hash) stored by login(), or None for an anonymous session.
+    """
+    user_id = session.get(SESSION_KEY)
+    if user_id is None:
+        return None
+    return str(user_id), session.get(BACKEND_SESSION_KEY), session.get(HASH_SESSION_KEY)
+
+
+def cached_session_user(credentials):
+    """
+    The cached user for session credentials, if the session hash still matches the one the
+    entry was verified with; a changed password or secret gives a miss.
+    """
+    user_id, backend, session_hash = credentials
+    entry = auth_cache().get(session_key(user_id))
+    if entry is None or not session_hash or entry['backend'] != backend:
+        return None
+    if entry['revision'] != revision(user_id):
+        return None
+    if not constant_time_compare(entry['hash'], session_hash):
+        return None
+    return entry['user']
+
+
+def remember_session_user(credentials, user):
+    """
+    Cache a user Django's get_user() has just verified against these session credentials.
+    """
+    user_id, backend, session_hash = credentials
+    if str(user.pk) == user_id and session_hash:
+        entry = {'user': user, 'backend': backend, 'hash': session_hash, 'revision': revision(user_id)}
+        auth_cache().set(session_key(user_id), entry, timeout())
+
+
+def _drop(user_id, *keys):
+    def drop():
+        auth_cache().delete_many(keys)
+        if user_id is not None:
+            shared_state.drop(revision_key(user_id)) # Other workers' entries for the user
+    drop()
+    # A request may cache pre-commit rows in between, so drop again once committed
+    transaction.on_commit(drop)
+
+
+def forget_token(key, user_id=None):
+    _drop(user_id, token_key(key))
+
+
+def forget_user(user_id):
+    keys = [token_key(key) for key in Token.objects.filter(user_id=user_id).values_list('key', flat=True)]
+    _drop(user_id, session_key(user_id), *keys)
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_sessions(app_configs, **kwargs):
+    """
+    Sessions cached per process outlive logout() in every other worker.
+    """
+    engine = settings.SESSION_ENGINE.rsplit('.', 1)[-1]
+    alias = getattr(settings, 'SESSION_CACHE_ALIAS', 'default')
+    if engine in ('cache', 'cached_db') and not shared_state.cache_is_shared(alias):
+        return [checks.Warning(
+            f"SESSION_ENGINE {settings.SESSION_ENGINE} keeps sessions in the per-process '{alias}' cache, "
+            "so a logout only ends the session in the worker that served it.",
+            hint="Use django.contrib.sessions.backends.db, or set REDIS_URL so the cache is shared.",
+            id='apis.W001',
+        )]
+    return []
+
+
+class CachedTokenAuthentication(authentication.TokenAuthentication):
+    """
+    TokenAuthentication answering repeat requests from the auth cache.
+    """
+    def authenticate_credentials(self, key):
+        token = cached_token(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key) # Raises for unknown keys and inactive users
+            remember_token(token)
+        return token.user, token
+
+
+class CachedSessionAuthentication(authentication.SessionAuthentication):
+    """
+    SessionAuthentication answering repeat requests from the auth cache.
+    """
+    def authenticate(self, request):
+        credentials = session_credentials(request._request.session)
+        if credentials is None:
+            return None
+        user = cached_session_user(credentials)
+        if user is None:
+            with replicas.primary(): # A replica's copy of the user would be cached for every worker
+                user = get_user(request._request) # Verifies the session hash; flushes the session if it fails
+            if not user.is_authenticated:
+                return None
+            remember_session_user(session_credentials(request._request.session), user)
+        if not user.is_active:
+            return None
+        self.enforce_csrf(request)
+        return user, None
+
+
+class AccessTokenAuthentication(authentication.TokenAuthentication):
+    """
+    `Authorization: Bearer <access token>`. Reads trust the signed claims and touch no table;
+    writes load the user, so a deactivated account cannot change anything even while its
+    access token is still valid.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is None or request.method in permissions.SAFE_METHODS:
+            return result
+        user, claims = result
+        user = CustomUser.objects.filter(pk=user.pk, is_active=True).first()
+        if user is None:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        return user, claims
+
+    def authenticate_credentials(self, key):
+        try:
+            claims = tokens.read_access_token(key)
+        except signing.SignatureExpired:
+            raise exceptions.AuthenticationFailed('Access token expired.')
+        except signing.BadSignature:
+            raise exceptions.AuthenticationFailed('Invalid access token.')
+        return tokens.token_user(claims), claims
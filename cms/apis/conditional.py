@@ -0,0 +1,87 @@
+"""
+Conditional GET (ETag / Last-Modified / 304) for article and comment reads.
+
+Validators cost at most one small query. Details use the row the view loads anyway, and
+comment lists an aggregate (MAX(updated_at), COUNT) over the article's comments, fetched
+before the full page. Article lists need no query: they are built from the response cache's
+list stamp. The cache's version stamps are folded into every validator, so writes that leave
+updated_at alone (an edited comment, a renamed author) still change them.
+If-None-Match / If-Modified-Since are evaluated by Django's get_conditional_response,
+and a match returns 304 without fetching the page or serializing anything.
+"""
+import time
+from datetime import datetime, timezone
+from hashlib import sha256
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from . import response_cache, shared_state
+
+
+def build(request, parts, timestamps, *version_keys):
+    """
+    (etag, last_modified) for a payload identified by the request URL, the given data
+    `parts`, the datetimes it was last changed at and the cache version stamps it depends on.
+    """
+    versions = shared_state.get_versions(response_cache.EPOCH_KEY, *version_keys)
+    digest = sha256(repr((response_cache.normalize(request), parts, versions)).encode('utf-8')).hexdigest()
+    # A stamp is (re)created at or after the write that dropped it, so it can only move forward
+    seconds = [moment.timestamp() for moment in timestamps if moment is not None]
+    seconds += [version / 1e9 for version in versions]
+    return f'"{digest[:32]}"', int(max(seconds))
+
+
+def not_modified(request, validators):
+    """
+    The 304 to send instead of the full response, or None when the client's copy is stale.
+    """
+    etag, last_modified = validators
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_headers(response, validators)
+    return response
+
+
+def set_headers(response, validators):
+    if response.status_code in (200, 304): # Errors carry no validators
+        etag, last_modified = validators
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def article_list_validators(request):
+    """
+    Lists come from the list generation stamp alone, which every article, comment or author
+    write drops, so an unchanged list (and a response-cache hit) costs no query. Scheduled
+    articles appear without a write; the validators also roll over once per cache timeout,
+    the same bound the cached lists have.
+    """
+    period = max(response_cache.timeout(), 1)
+    window = datetime.fromtimestamp(time.time() // period * period, tz=timezone.utc)
+    return build(request, (response_cache.viewer_class(request.user), window), [window], response_cache.LIST_KEY)
+
+
+def article_validators(request, article):
+    parts = (
+        article.pk, article.updated_at, article.author_id, article.picture.name, article.picture_variants,
+        article.comment_count, article.approved_comment_count, article.pending_comment_count,
+    )
+    return build(
+        request, parts, [article.updated_at],
+        response_cache.article_version_key(article.slug), response_cache.author_version_key(article.author_id),
+    )
+
+
+def thread_validators(request, slug, activity):
+    """
+    For comment listings; `activity` is threads.thread_activity(slug).
+    """
+    latest, total = activity
+    return build(request, (latest, total), [latest], response_cache.article_version_key(slug), response_cache.AUTHORS_KEY)
+
+
+def comment_validators(request, comment):
+    parts = (comment.pk, comment.updated_at, comment.author_id, comment.parent_id)
+    return build(request, parts, [comment.updated_at], response_cache.author_version_key(comment.author_id))
@@ -0,0 +1,178 @@
+"""
+Small HTTP load generator behind the benchmark commands.
+
+Requests go out from a pool of client threads over urllib (standard library only), each
+timed on its own; a run is summarised as requests per second and latency percentiles.
+Queries per request come from the server's own /metrics (apis/metrics.py), read before and
+after a run.
+Keep the client on the same host as the server and check it is not the one short of CPU,
+or the numbers describe the client rather than the server.
+"""
+import json
+import math
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+TIMEOUT = 30 # Seconds before a single request counts as failed
+
+
+def fetch(url, headers=None, data=None):
+    """
+    (status, seconds) for one GET, or a JSON POST when `data` is given; status is 0 when
+    no response came back.
+    """
+    headers = dict(headers or {})
+    body = None
+    if data is not None:
+        body = json.dumps(data).encode('utf-8')
+        headers['Content-Type'] = 'application/json'
+    request = Request(url, data=body, headers=headers)
+    started = time.perf_counter()
+    try:
+        with urlopen(request, timeout=TIMEOUT) as response:
+            response.read()
+            code = response.status
+    except HTTPError as e:
+        code = e.code
+    except (URLError, OSError):
+        code = 0
+    return code, time.perf_counter() - started
+
+
+def percentile(ordered, fraction):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(results, elapsed):
+    """
+    Throughput, latency percentiles (milliseconds) and error count for a list of
+    (status, seconds) results collected over `elapsed` seconds.
+    """
+    latencies = sorted(seconds for _, seconds in results)
+    return {
+        'requests': len(results),
+        'errors': sum(1 for code, _ in results if not 200 <= code < 400),
+        'rps': round(len(results) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def run(targets, concurrency, headers=None):
+    """
+    Request every target with `concurrency` requests in flight and summarize the run.
+    A target is a URL to GET or a (url, data) pair to POST as JSON.
+    """
+    def send(target):
+        url, data = (target, None) if isinstance(target, str) else target
+        return fetch(url, headers, data)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        results = list(pool.map(send, targets))
+        elapsed = time.perf_counter() - started
+    return summarize(results, elapsed)
+
+
+METRIC_LINE = re.compile(r'^cms_db_queries_(sum|count)\{(.*)\} (\S+)$')
+ROUTE_LABEL = re.compile(r'route="((?:[^"\\]|\\.)*)"')
+
+
+def query_totals(text):
+    """
+    {route: [queries, requests]} from a /metrics page, over all methods.
+    """
+    totals = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match is None:
+            continue
+        kind, labels, value = match.groups()
+        route = ROUTE_LABEL.search(labels).group(1)
+        totals.setdefault(route, [0.0, 0.0])[0 if kind == 'sum' else 1] += float(value)
+    return totals
+
+
+def queries_per_request(before, after, route):
+    """
+    Average queries per request on `route` between two query_totals() readings.
+    """
+    queries, requests = after.get(route, [0.0, 0.0])
+    queries -= before.get(route, [0.0, 0.0])[0]
+    requests -= before.get(route, [0.0, 0.0])[1]
+    return round(queries / requests, 2) if requests else None
+
+
+def scrape_metrics(url, token):
+    with urlopen(Request(url, headers={'Authorization': f'Bearer {token}'}), timeout=TIMEOUT) as response:
+        return query_totals(response.read().decode('utf-8'))
+
+
+def server_command(server, port, workers, threads):
+    """
+    Command line for gunicorn (server='wsgi') or uvicorn (server='asgi') serving the project.
+    """
+    if server == 'wsgi':
+        return [
+            sys.executable, '-m', 'gunicorn', 'cms.wsgi:application', '--bind', f'127.0.0.1:{port}',
+            '--workers', str(workers), '--threads', str(threads),
+        ]
+    return [
+        sys.executable, '-m', 'uvicorn', 'cms.asgi:application', '--host', '127.0.0.1',
+        '--port', str(port), '--workers', str(workers),
+        '--no-access-log', '--log-level', 'warning',
+    ]
+
+
+def start_server(command, env=None, cwd=None):
+    # Logs go to a file rather than a pipe nobody drains, which would eventually block the server
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        command, cwd=cwd, env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL, stderr=log,
+    )
+    process.log = log
+    return process
+
+
+def server_log(process):
+    process.log.seek(0)
+    return process.log.read().decode(errors='replace')
+
+
+def wait_until_up(process, url, timeout=30):
+    """
+    Poll `url` until the server answers; raise RuntimeError if it exits or never does.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(server_log(process) or 'Server exited')
+        code, _ = fetch(url)
+        if code:
+            return
+        time.sleep(0.2)
+    raise RuntimeError(f"No response from {url} after {timeout}s")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    process.log.close()
@@ -0,0 +1,169 @@
+import json
+import os
+import random
+import secrets
+import tempfile
+import time
+from itertools import count, cycle, islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import resolve
+from django.utils import timezone
+
+from apis import loadtest, response_cache
+from articles import seeding
+from articles.models import Article, Comment
+
+CustomUser = get_user_model()
+
+DATASETS = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+ROUTES = ('list', 'detail', 'search', 'search-by-email', 'comments', 'login', 'registration')
+SAMPLE_SIZE = 200 # Distinct articles and authors the read routes cycle through
+
+# The user the login route signs in as
+LOGIN_EMAIL = 'loadtest@example.invalid'
+LOGIN_PASSWORD = 'loadtest-password'
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a 10k/100k/1m article dataset into the configured database if it is empty, then measure "
+        "throughput, latency percentiles and queries per request for every API route."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', choices=DATASETS, default='10k', help="Articles to seed into an empty database.")
+        parser.add_argument('--seed', type=int, default=1, help="Random seed for the dataset and the request mix.")
+        parser.add_argument('--routes', default=','.join(ROUTES), help="Comma-separated routes to drive.")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per route.")
+        parser.add_argument('--concurrency', type=int, default=8, help="Requests in flight at once.")
+        parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi', help="gunicorn (wsgi) or uvicorn (asgi).")
+        parser.add_argument('--workers', type=int, default=2, help="Server worker processes.")
+        parser.add_argument('--threads', type=int, default=4, help="Threads per gunicorn worker (WSGI only).")
+        parser.add_argument('--port', type=int, default=8766, help="Port the server listens on.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        routes = [name.strip() for name in options['routes'].split(',') if name.strip()]
+        unknown = set(routes) - set(ROUTES)
+        if unknown:
+            raise CommandError(f"Unknown routes: {', '.join(sorted(unknown))}")
+
+        self.seed(DATASETS[options['dataset']], options['seed'])
+        if not CustomUser.objects.filter(email=LOGIN_EMAIL).exists():
+            CustomUser.objects.create_user(username='loadtest', email=LOGIN_EMAIL, password=LOGIN_PASSWORD)
+        targets = self.targets(options['requests'], random.Random(options['seed']))
+
+        base = f"http://127.0.0.1:{options['port']}"
+        token = secrets.token_urlsafe(16)
+        with tempfile.TemporaryDirectory() as scratch:
+            env = {
+                'DISABLE_THROTTLING': 'True',
+                'ASYNC_READ_VIEWS': 'True' if options['server'] == 'asgi' else 'False',
+                # A private metrics file, flushed often, to read queries per request from
+                'METRICS_DATABASE': os.path.join(scratch, 'metrics.sqlite3'),
+                'METRICS_FLUSH_INTERVAL': '0.2',
+                'METRICS_TOKEN': token,
+            }
+            command = loadtest.server_command(options['server'], options['port'], options['workers'], options['threads'])
+            process = loadtest.start_server(command, env=env, cwd=settings.BASE_DIR)
+            try:
+                results = self.drive(process, base, token, routes, targets, options['concurrency'])
+            except RuntimeError as e:
+                raise CommandError(f"{options['server']} server failed: {e}")
+            finally:
+                loadtest.stop_server(process)
+
+        report = {
+            'dataset': {
+                'name': options['dataset'],
+                'seed': options['seed'],
+                'articles': Article.objects.count(),
+                'comments': Comment.objects.count(),
+                'users': CustomUser.objects.count(),
+                'database': settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1],
+            },
+            'server': options['server'],
+            'workers': options['workers'],
+            'concurrency': options['concurrency'],
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        for result in results:
+            queries = result['queries_per_request']
+            self.stdout.write(
+                f"{result['route']:16} {result['rps']:9.1f} req/s  p50 {result['p50_ms']:8.2f}  p95 {result['p95_ms']:8.2f}"
+                f"  p99 {result['p99_ms']:8.2f} ms  {'-' if queries is None else queries:>5} queries/req  errors {result['errors']}"
+            )
+
+    def seed(self, size, seed):
+        """
+        Generate a dataset (articles/10 users, three comments per article) when the database
+        has no articles yet; a non-empty one is benchmarked as it is.
+        """
+        if Article.objects.exists():
+            self.stdout.write(f"Database already has {Article.objects.count()} articles; not seeding.")
+            return
+        self.stdout.write(f"Seeding {size} articles...")
+        run = seeding.Seeder(seed=seed)
+        run.run(max(1, size // 10), size, 3 * size)
+        response_cache.invalidate_all() # Bulk writes skip the model signals
+        self.stdout.write(f"Seeded {run.stats['articles']} articles, {run.stats['comments']} comments, {run.stats['users']} users.")
+
+    def targets(self, requests, rng):
+        """
+        Request targets per route. Reads cycle through a sample of published articles and
+        their authors; each registration uses a new email.
+        """
+        published = Article.objects.filter(is_published='published', created_at__lte=timezone.now())
+        bounds = list(published.order_by('id').values_list('id', flat=True)[:1]) + list(published.order_by('-id').values_list('id', flat=True)[:1])
+        if not bounds:
+            raise CommandError("No published articles to read.")
+        ids = rng.sample(range(bounds[0], bounds[1] + 1), min(SAMPLE_SIZE, bounds[1] - bounds[0] + 1))
+        sample = list(published.filter(id__in=ids).values_list('slug', 'title', 'author__email'))
+        if not sample:
+            sample = list(published.values_list('slug', 'title', 'author__email')[:SAMPLE_SIZE])
+        rng.shuffle(sample)
+
+        def repeat(make):
+            return [make(entry) for entry in islice(cycle(sample), requests)]
+
+        nonce = count()
+        return {
+            'list': ['/api/v1/articles/?page_size=20'] * requests,
+            'detail': repeat(lambda entry: f'/api/v1/articles/{entry[0]}/'),
+            'search': repeat(lambda entry: f'/api/v1/articles/search/?q={entry[1].split()[0]}'),
+            'search-by-email': repeat(lambda entry: f'/api/v1/articles/search/{entry[2]}/'),
+            'comments': repeat(lambda entry: f'/api/v1/articles/{entry[0]}/comments/'),
+            'login': [('/api/v1/auth/login/', {'email': LOGIN_EMAIL, 'password': LOGIN_PASSWORD})] * requests,
+            'registration': [
+                ('/api/v1/user/create/', {
+                    'username': f'loadtest-{tag}', 'email': f'loadtest-{tag}@example.invalid',
+                    'password': LOGIN_PASSWORD, 'password2': LOGIN_PASSWORD,
+                })
+                for tag in (f'{rng.getrandbits(48):012x}-{next(nonce)}' for _ in range(requests))
+            ],
+        }
+
+    def drive(self, process, base, token, routes, targets, concurrency):
+        loadtest.wait_until_up(process, base + '/api/v1/articles/')
+        metrics_url = base + '/metrics'
+        results = []
+        for route in routes:
+            first = targets[route][0]
+            pattern = resolve((first if isinstance(first, str) else first[0]).split('?')[0]).route
+            full = [base + target if isinstance(target, str) else (base + target[0], target[1]) for target in targets[route]]
+            before = self.settled_metrics(metrics_url, token)
+            summary = loadtest.run(full, concurrency)
+            after = self.settled_metrics(metrics_url, token)
+            results.append({'route': route, **summary, 'queries_per_request': loadtest.queries_per_request(before, after, pattern)})
+        return results
+
+    def settled_metrics(self, url, token):
+        # Give every worker a flush interval to add its counts to the shared file
+        time.sleep(0.5)
+        return loadtest.scrape_metrics(url, token)
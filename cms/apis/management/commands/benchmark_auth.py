@@ -0,0 +1,64 @@
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from apis.authentication import AccessTokenAuthentication, CachedTokenAuthentication, forget_token
+from users import tokens
+
+CustomUser = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Compare the per-request cost of authenticating with a token table lookup, the cached token and a signed access token."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000, help="Authentications timed per scheme.")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        # The benchmark user and its tokens are rolled back afterwards
+        with transaction.atomic():
+            user = CustomUser.objects.create_user(username='benchmark-auth', email='benchmark-auth@example.invalid', password=None)
+            key = Token.objects.create(user=user).key
+            access = tokens.access_token(user)
+            schemes = [
+                ('token table', TokenAuthentication(), f'Token {key}'),
+                ('cached token', CachedTokenAuthentication(), f'Token {key}'),
+                ('access token', AccessTokenAuthentication(), f'Bearer {access}'),
+            ]
+            results = [self.measure(name, backend, header, options['iterations']) for name, backend, header in schemes]
+            forget_token(key) # The rollback sends no delete signal
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            self.stdout.write(
+                f"{result['scheme']:13} {result['us_per_request']:9.1f} us/request"
+                f"  {result['queries_per_request']:.0f} queries/request"
+            )
+
+    def measure(self, name, backend, header, iterations):
+        request = Request(APIRequestFactory().get('/api/v1/articles/', HTTP_AUTHORIZATION=header))
+        backend.authenticate(request) # Warm up, filling the auth cache
+        with CaptureQueriesContext(connection) as ctx:
+            backend.authenticate(request)
+        started = time.perf_counter()
+        for _ in range(iterations):
+            backend.authenticate(request)
+        elapsed = time.perf_counter() - started
+        return {
+            'scheme': name,
+            'iterations': iterations,
+            'us_per_request': round(elapsed / iterations * 1e6, 2) if iterations else 0.0,
+            'queries_per_request': len(ctx.captured_queries),
+        }
@@ -0,0 +1,85 @@
+import json
+from itertools import count
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apis import loadtest
+from articles.models import Article
+
+SERVERS = ('wsgi', 'asgi')
+
+
+class Command(BaseCommand):
+    help = "Compare requests per second and latency of the read endpoints under gunicorn (WSGI) and uvicorn (ASGI)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', default=','.join(SERVERS), help="Comma-separated servers to run: wsgi, asgi.")
+        parser.add_argument('--requests', type=int, default=500, help="Requests per endpoint.")
+        parser.add_argument('--concurrency', type=int, default=16, help="Requests in flight at once.")
+        parser.add_argument('--workers', type=int, default=2, help="Server worker processes.")
+        parser.add_argument('--threads', type=int, default=4, help="Threads per gunicorn worker (WSGI only).")
+        parser.add_argument('--port', type=int, default=8765, help="Port the servers listen on, one at a time.")
+        parser.add_argument('--no-cache', action='store_true', help="Vary every URL so the response cache never hits.")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        servers = [name.strip() for name in options['servers'].split(',') if name.strip()]
+        unknown = set(servers) - set(SERVERS)
+        if unknown:
+            raise CommandError(f"Unknown servers: {', '.join(sorted(unknown))}")
+
+        base = f"http://127.0.0.1:{options['port']}"
+        paths = self.endpoints()
+        results = []
+        for server in servers:
+            process = loadtest.start_server(
+                loadtest.server_command(server, options['port'], options['workers'], options['threads']),
+                env=self.environment(server), cwd=settings.BASE_DIR,
+            )
+            try:
+                loadtest.wait_until_up(process, base + paths['list'])
+                loadtest.run([base + paths['list']] * min(50, options['requests']), options['concurrency']) # Warm up
+                for endpoint, path in paths.items():
+                    urls = self.urls(base + path, options['requests'], options['no_cache'])
+                    summary = loadtest.run(urls, options['concurrency'])
+                    results.append({'server': server, 'endpoint': endpoint, **summary})
+                    if not options['json']:
+                        self.stdout.write(
+                            f"{server:5} {endpoint:9} {summary['rps']:9.1f} req/s  p50 {summary['p50_ms']:8.2f} ms"
+                            f"  p99 {summary['p99_ms']:8.2f} ms  errors {summary['errors']}"
+                        )
+            except RuntimeError as e:
+                raise CommandError(f"{server} server failed: {e}")
+            finally:
+                loadtest.stop_server(process)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+
+    def endpoints(self):
+        """
+        Paths for each read endpoint, using the visible article with the most comments.
+        """
+        article = Article.objects.filter(is_published='published', created_at__lte=timezone.now()).order_by('-comment_count', 'id').first()
+        if article is None:
+            raise CommandError("No published articles to read; load some first (import_content).")
+        term = article.title.split()[0] if article.title.split() else article.slug
+        return {
+            'list': '/api/v1/articles/?page_size=20',
+            'detail': f'/api/v1/articles/{article.slug}/',
+            'comments': f'/api/v1/articles/{article.slug}/comments/',
+            'search': f'/api/v1/articles/search/?q={term}',
+        }
+
+    def urls(self, url, requests, no_cache):
+        if not no_cache:
+            return [url] * requests
+        separator = '&' if '?' in url else '?'
+        nonce = count()
+        return [f'{url}{separator}_={next(nonce)}' for _ in range(requests)] # Distinct query strings miss the cache
+
+    def environment(self, server):
+        # Same settings and database for both; only the read views differ
+        return {'DISABLE_THROTTLING': 'True', 'ASYNC_READ_VIEWS': 'True' if server == 'asgi' else 'False'}
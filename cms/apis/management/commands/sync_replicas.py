@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apis import replicas
+
+
+class Command(BaseCommand):
+    help = "Copy a SQLite primary database over its SQLite read replicas, for trying replica routing locally."
+
+    def handle(self, *args, **options):
+        aliases = replicas.replicas()
+        if not aliases:
+            raise CommandError("No replicas configured; set DATABASE_REPLICA_URLS.")
+        for alias in aliases:
+            try:
+                replicas.copy_sqlite('default', alias)
+            except ValueError as e:
+                raise CommandError(f"{e} sync_replicas only copies SQLite files; use the database's own replication.")
+            self.stdout.write(f"Copied the primary to {alias} ({settings.DATABASES[alias]['NAME']}).")
@@ -0,0 +1,328 @@
+"""
+Prometheus metrics for every request, added up across worker processes.
+
+MetricsMiddleware records, per route (the URL pattern, so slugs and ids do not multiply the
+series), request counts by status, latency, response size, queries run and time spent in
+the database; the throttles (apis/throttling.py) record denials by scope, and connection
+pools (apis/pooling.py) what they handed out and how long requests waited. Each process adds
+these up in memory, so a request costs a few dictionary updates, and a background thread
+adds the totals into a SQLite file that all workers share (settings.METRICS_DATABASE, WAL
+mode) every METRICS_FLUSH_INTERVAL seconds. GET /metrics serves the file in the Prometheus
+text format; counters only ever grow, including across restarts.
+"""
+import atexit
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from .pooling import pool_counters
+from .query_budget import QueryCounter
+
+logger = logging.getLogger(__name__)
+
+BUSY_TIMEOUT = 5 # Seconds a flush waits for another process's write before giving up
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+# name: (type, help, histogram buckets)
+FAMILIES = {
+    'cms_http_requests_total': ('counter', 'Requests answered, by route, method and status.', None),
+    'cms_http_request_duration_seconds': ('histogram', 'Time to answer a request.', LATENCY_BUCKETS),
+    'cms_http_response_size_bytes': ('histogram', 'Size of response bodies (streamed ones excluded).', SIZE_BUCKETS),
+    'cms_db_queries': ('histogram', 'Database queries run per request.', QUERY_BUCKETS),
+    'cms_db_duration_seconds': ('histogram', 'Time per request spent waiting on the database.', LATENCY_BUCKETS),
+    'cms_throttle_denials_total': ('counter', 'Requests refused by a rate limit, by throttle scope.', None),
+    'cms_db_pool_requests_total': ('counter', 'Connections handed out by the pool, by database.', None),
+    'cms_db_pool_waits_total': ('counter', 'Connection requests that had to wait for a free connection.', None),
+    'cms_db_pool_wait_seconds_total': ('counter', 'Time spent waiting for a free pooled connection.', None),
+    'cms_db_pool_timeouts_total': ('counter', 'Connection requests that gave up waiting.', None),
+    'cms_db_pool_connections_opened_total': ('counter', 'Connections the pool opened to the database.', None),
+    'cms_db_pool_connect_errors_total': ('counter', 'Failed attempts to open a pooled connection.', None),
+    'cms_db_pool_connections_lost_total': ('counter', 'Pooled connections found broken and replaced.', None),
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS metrics (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    le TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels, le)
+) WITHOUT ROWID
+'''
+
+
+def database_path():
+    return str(getattr(settings, 'METRICS_DATABASE', settings.BASE_DIR / 'metrics.sqlite3'))
+
+
+def flush_interval():
+    return getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+
+
+def label_text(**labels):
+    escaped = {name: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for name, value in labels.items()}
+    return ','.join(f'{name}="{escaped[name]}"' for name in sorted(escaped))
+
+
+def bucket_for(value, buckets):
+    for bound in buckets:
+        if value <= bound:
+            return format_value(bound)
+    return '+Inf'
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# Series added up since the last flush: (name, labels, le) -> value. Histogram buckets are
+# kept per bucket here and in the file; render() makes them cumulative.
+_pending = {}
+_pending_lock = threading.Lock()
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+def add(name, labels, value, le=''):
+    key = (name, labels, le)
+    with _pending_lock:
+        _pending[key] = _pending.get(key, 0) + value
+    start_flusher()
+
+
+def observe(family, labels, value):
+    buckets = FAMILIES[family][2]
+    with _pending_lock:
+        for key, amount in (
+            ((f'{family}_bucket', labels, bucket_for(value, buckets)), 1),
+            ((f'{family}_sum', labels, ''), value),
+            ((f'{family}_count', labels, ''), 1),
+        ):
+            _pending[key] = _pending.get(key, 0) + amount
+    start_flusher()
+
+
+def record_request(request, response, duration, counter):
+    match = getattr(request, 'resolver_match', None)
+    route = match.route if match is not None else 'unmatched'
+    method = request.method if request.method in METHODS else 'other'
+    labels = label_text(route=route, method=method)
+    add('cms_http_requests_total', label_text(route=route, method=method, status=response.status_code), 1)
+    observe('cms_http_request_duration_seconds', labels, duration)
+    if not response.streaming:
+        observe('cms_http_response_size_bytes', labels, len(response.content))
+    observe('cms_db_queries', labels, counter.count)
+    observe('cms_db_duration_seconds', labels, counter.duration)
+
+
+def record_throttle(scope):
+    add('cms_throttle_denials_total', label_text(scope=scope), 1)
+
+
+class MetricStore:
+    """
+    Metric totals in one SQLite file; one connection per thread and process.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None and self.local.pid == os.getpid():
+            return conn
+        # A connection inherited over fork belongs to the parent
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(SCHEMA)
+        self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def add(self, series):
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT INTO metrics (name, labels, le, value) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(name, labels, le) DO UPDATE SET value = value + excluded.value',
+                [(name, labels, le, value) for (name, labels, le), value in series.items()],
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def rows(self):
+        return self.connect().execute('SELECT name, labels, le, value FROM metrics').fetchall()
+
+    def clear(self):
+        self.connect().execute('DELETE FROM metrics')
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def store():
+    path = database_path()
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = MetricStore(path)
+        return _stores[path]
+
+
+def flush():
+    """
+    Add this process's pending series into the shared file.
+    """
+    global _pending
+    for family, alias, value in pool_counters():
+        add(family, label_text(database=alias), value)
+    with _pending_lock:
+        series, _pending = _pending, {}
+    if not series:
+        return
+    try:
+        store().add(series)
+    except sqlite3.Error:
+        # Keep the counts for the next attempt rather than losing them
+        with _pending_lock:
+            for key, value in series.items():
+                _pending[key] = _pending.get(key, 0) + value
+        raise
+
+
+def flush_forever():
+    while True:
+        time.sleep(flush_interval())
+        try:
+            flush()
+        except sqlite3.Error:
+            logger.warning("Flushing request metrics failed; retrying later", exc_info=True)
+
+
+def flush_at_exit():
+    try:
+        flush()
+    except sqlite3.Error:
+        logger.warning("Flushing request metrics at exit failed", exc_info=True)
+
+
+def start_flusher():
+    """
+    Start this process's flush thread on its first recorded series (again after a fork).
+    """
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+        threading.Thread(target=flush_forever, name='metrics-flush', daemon=True).start()
+        atexit.register(flush_at_exit)
+
+
+def reset():
+    """
+    Forget every recorded series, pending and flushed, e.g. between tests.
+    """
+    global _pending
+    with _pending_lock:
+        _pending = {}
+    store().clear()
+
+
+def render():
+    """
+    The shared totals in the Prometheus text exposition format.
+    """
+    series = {}
+    for name, labels, le, value in store().rows():
+        series[(name, labels, le)] = value
+    lines = []
+    for family, (kind, help_text, buckets) in FAMILIES.items():
+        lines += [f'# HELP {family} {help_text}', f'# TYPE {family} {kind}']
+        if buckets is None:
+            for (name, labels, _), value in sorted(series.items()):
+                if name == family:
+                    lines.append(f'{family}{{{labels}}} {format_value(value)}')
+            continue
+        label_sets = sorted({labels for name, labels, _ in series if name == f'{family}_count'})
+        for labels in label_sets:
+            total = 0
+            for bound in (*buckets, math.inf):
+                le = format_value(bound)
+                total += series.get((f'{family}_bucket', labels, le), 0)
+                lines.append(f'{family}_bucket{{{labels},le="{le}"}} {format_value(total)}')
+            lines.append(f'{family}_sum{{{labels}}} {format_value(series.get((f"{family}_sum", labels, ""), 0))}')
+            lines.append(f'{family}_count{{{labels}}} {format_value(series.get((f"{family}_count", labels, ""), 0))}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    GET /metrics. Needs `Authorization: Bearer <METRICS_TOKEN>` when METRICS_TOKEN is set,
+    otherwise a signed-in staff user.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorized = bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not (authorized or request.user.is_staff):
+        return HttpResponseForbidden()
+    try:
+        flush() # This process's latest counts; other workers' arrive within METRICS_FLUSH_INTERVAL
+    except sqlite3.Error:
+        # Busy or locked: serve the totals already in the file, the counts stay pending
+        logger.warning("Flushing request metrics for a scrape failed", exc_info=True)
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    """
+    Time each request and count its queries; keep it first in MIDDLEWARE so the whole
+    stack is measured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with QueryCounter() as counter:
+            response = self.get_response(request)
+        record_request(request, response, time.perf_counter() - started, counter)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        # The async ORM runs queries on the request's sync thread; count them there
+        counter = QueryCounter()
+        await sync_to_async(counter.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(counter.__exit__)(None, None, None)
+        record_request(request, response, time.perf_counter() - started, counter)
+        return response
@@ -0,0 +1,111 @@
+"""
+PostgreSQL connection pools: warmup at worker boot and pool metrics.
+
+With DATABASE_POOL=True, settings give every PostgreSQL alias Django's psycopg 3 pool
+(OPTIONS['pool']). Each process then keeps DATABASE_POOL_MIN_SIZE to DATABASE_POOL_MAX_SIZE
+connections, shared by its threads. Connections go back to the pool at the end of each request
+instead of being closed. Before handing a connection out, the pool checks it with an empty
+statement (CONN_HEALTH_CHECKS), so a connection broken by a failover or a database restart is
+replaced instead of failing a request.
+
+cms/wsgi.py and cms/asgi.py call warm_up() as each worker loads the application, so the
+minimum number of connections is open before the first request arrives. A server that loads
+the application once and then forks its workers (gunicorn --preload) runs that in the master
+instead. A forked child must never use the master's sockets, so it drops the pools it
+inherited (without closing them, which would end the master's sessions) and opens its own:
+gunicorn.conf.py warms each worker up after the fork and closes the master's pools before the
+first fork. pool_counters() feeds the pool's own statistics into the request metrics
+(apis/metrics.py), including how often and how long requests waited for a free connection.
+"""
+import logging
+import os
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_warmed_pid = None # The process whose pools warm_up() opened
+
+# Metric family -> psycopg_pool statistics it adds up (counters since the last pop_stats())
+COUNTERS = {
+    'cms_db_pool_requests_total': ('requests_num',),
+    'cms_db_pool_waits_total': ('requests_queued',),
+    'cms_db_pool_timeouts_total': ('requests_errors',),
+    'cms_db_pool_connections_opened_total': ('connections_num',),
+    'cms_db_pool_connect_errors_total': ('connections_errors',),
+    'cms_db_pool_connections_lost_total': ('connections_lost', 'returns_bad'),
+}
+
+
+def warmup_timeout():
+    return float(os.getenv('DATABASE_POOL_WARMUP_TIMEOUT', '30'))
+
+
+def pools():
+    """
+    (alias, pool) for every database configured with a pool.
+    """
+    found = []
+    for alias in connections:
+        if connections.settings[alias].get('OPTIONS', {}).get('pool'):
+            found.append((alias, connections[alias].pool))
+    return found
+
+
+def warm_up():
+    """
+    Open every pool and wait until its minimum number of connections is ready. A database
+    that is down is logged rather than raised, so the worker still starts and retries later.
+    """
+    global _warmed_pid
+    if _warmed_pid == os.getpid():
+        return # Loaded the application and then ran a post-fork hook in the same process
+    _warmed_pid = os.getpid()
+    for alias, pool in pools():
+        try:
+            pool.open(wait=True, timeout=warmup_timeout())
+        except Exception:
+            logger.warning("Could not open the %s connection pool at startup", alias, exc_info=True)
+
+
+def close_pools():
+    """
+    Close this process's pools, e.g. in a preloading master before it forks its workers.
+    A process that never warmed up (a master without --preload) has nothing to close.
+    """
+    global _warmed_pid
+    if _warmed_pid != os.getpid():
+        return
+    for alias, _ in pools():
+        connections[alias].close_pool()
+    _warmed_pid = None
+
+
+def forget_inherited_pools():
+    # After fork: the pools' sockets and threads belong to the parent; the child builds its own
+    global _warmed_pid
+    for alias in connections:
+        if connections.settings[alias].get('OPTIONS', {}).get('pool'):
+            type(connections[alias])._connection_pools.pop(alias, None)
+    _warmed_pid = None
+
+
+os.register_at_fork(after_in_child=forget_inherited_pools)
+
+
+def pool_counters():
+    """
+    (metric family, database alias, value) for what each pool counted since the last call.
+    The counts are process-wide, not per request, so they are read when metrics are flushed.
+    """
+    counters = []
+    for alias, pool in pools():
+        stats = pool.pop_stats()
+        wait_ms = stats.get('requests_wait_ms', 0)
+        if wait_ms:
+            counters.append(('cms_db_pool_wait_seconds_total', alias, wait_ms / 1000))
+        for family, keys in COUNTERS.items():
+            value = sum(stats.get(key, 0) for key in keys)
+            if value:
+                counters.append((family, alias, value))
+    return counters
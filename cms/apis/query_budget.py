@@ -0,0 +1,96 @@
+"""
+Per-endpoint query budgets.
+
+Decorate a view handler with @query_budget(n) to declare the most queries it may run,
+whatever the number of rows involved; async handlers work too. Authentication and
+throttling run before the handler and are not counted. When settings.QUERY_BUDGET_ENFORCE
+is true (default: DEBUG) going over budget raises QueryBudgetExceeded, otherwise it is
+logged as a warning.
+"""
+import functools
+import inspect
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """
+    Context manager counting the queries run on every database connection, and the
+    seconds spent in them. Works with DEBUG off, unlike connection.queries.
+    """
+    def __init__(self):
+        self.queries = []
+        self.duration = 0.0
+        self._stack = ExitStack()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+
+    def __enter__(self):
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+
+def check_budget(counter, limit, label):
+    if counter.count <= limit:
+        return
+    message = f"{label} ran {counter.count} queries, budget is {limit}:\n" + "\n".join(counter.queries)
+    if getattr(settings, 'QUERY_BUDGET_ENFORCE', settings.DEBUG):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+def query_budget(limit):
+    """
+    Decorator declaring the maximum number of queries a view handler may run.
+    The limit is kept on the wrapper as `query_budget` so tests can read it back.
+    """
+    def decorator(handler):
+        if inspect.iscoroutinefunction(handler):
+            @functools.wraps(handler)
+            async def async_wrapper(self, request, *args, **kwargs):
+                # The async ORM runs queries on the request's sync thread; count them there
+                counter = QueryCounter()
+                await sync_to_async(counter.__enter__)()
+                try:
+                    response = await handler(self, request, *args, **kwargs)
+                finally:
+                    await sync_to_async(counter.__exit__)(None, None, None)
+                check_budget(counter, limit, f"{type(self).__name__}.{handler.__name__}")
+                return response
+            async_wrapper.query_budget = limit
+            return async_wrapper
+
+        @functools.wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            with QueryCounter() as counter:
+                response = handler(self, request, *args, **kwargs)
+            check_budget(counter, limit, f"{type(self).__name__}.{handler.__name__}")
+            return response
+        wrapper.query_budget = limit
+        return wrapper
+    return decorator
@@ -0,0 +1,118 @@
+"""
+Query plan checks for tests.
+
+Wrap requests in `expect_indexed()` to capture every SELECT they run, EXPLAIN each one
+afterwards and fail with QueryPlanError when a plan reads a whole table or sorts rows in a
+temporary structure instead of walking an index in order:
+
+  * SQLite (EXPLAIN QUERY PLAN): a `SCAN <table>` step that uses no index, or a
+    `USE TEMP B-TREE FOR ORDER BY` step;
+  * PostgreSQL (EXPLAIN (FORMAT JSON)): a Seq Scan node or a Sort node. Test tables are tiny,
+    so sequential scans and sorts are switched off while explaining (enable_seqscan,
+    enable_sort); the planner only picks them then when no index can do the job.
+
+Only tables in `tables` are watched, so lookups on small fixed tables do not get in the way.
+Statements containing one of the `allow` fragments are not checked; use it for queries whose
+sort is bounded by design (e.g. the windowed reply previews, at most a page of threads).
+"""
+import re
+from contextlib import contextmanager
+
+from django.db import connections
+
+from .query_budget import QueryCounter
+
+SQLITE_TABLE_SCAN = re.compile(r'^SCAN (?P<table>\w+)(?: AS \w+)?$')
+SQLITE_TEMP_SORT = 'USE TEMP B-TREE FOR'
+
+
+class QueryPlanError(AssertionError):
+    pass
+
+
+class StatementCapture(QueryCounter):
+    """
+    QueryCounter that also keeps each statement's connection alias and parameters.
+    """
+    def __init__(self):
+        super().__init__()
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many:
+            self.statements.append((context['connection'].alias, sql, params))
+        return super().__call__(execute, sql, params, many, context)
+
+
+def explain(sql, params, using='default'):
+    """
+    The plan for one statement: SQLite's EXPLAIN QUERY PLAN detail lines, or PostgreSQL's
+    plan tree as JSON.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET enable_seqscan = off')
+            cursor.execute('SET enable_sort = off')
+            try:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                return cursor.fetchone()[0][0]['Plan']
+            finally:
+                cursor.execute('RESET enable_seqscan')
+                cursor.execute('RESET enable_sort')
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(plan, vendor, tables):
+    """
+    Steps of an explained plan that read a whole watched table or sort in a temporary structure.
+    """
+    if vendor == 'postgresql':
+        problems = []
+        nodes = [plan]
+        while nodes:
+            node = nodes.pop()
+            if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') in tables:
+                problems.append(f"Seq Scan on {node['Relation Name']}")
+            elif node['Node Type'] in ('Sort', 'Incremental Sort'):
+                problems.append(f"{node['Node Type']} on {', '.join(node.get('Sort Key', []))}")
+            nodes += node.get('Plans', [])
+        return problems
+    problems = []
+    for detail in plan:
+        scan = SQLITE_TABLE_SCAN.match(detail)
+        if (scan and scan['table'] in tables) or (detail.startswith(SQLITE_TEMP_SORT) and 'ORDER BY' in detail):
+            problems.append(detail)
+    return problems
+
+
+def check_plans(statements, tables, allow=()):
+    """
+    Explain every captured SELECT; returns (sql, problems) for those with bad plans.
+    """
+    failures = []
+    for using, sql, params in statements:
+        if not sql.lstrip().upper().startswith('SELECT') or any(fragment in sql for fragment in allow):
+            continue
+        connection = connections[using]
+        problems = plan_problems(explain(sql, params, using), connection.vendor, tables)
+        if problems:
+            failures.append((sql, problems))
+    return failures
+
+
+@contextmanager
+def expect_indexed(tables, allow=()):
+    """
+    Fail when a SELECT run inside the block reads one of `tables` in full or sorts rows
+    without an index, unless it contains one of the `allow` fragments.
+    """
+    capture = StatementCapture()
+    with capture:
+        yield capture
+    failures = check_plans(capture.statements, set(tables), allow)
+    if failures:
+        raise QueryPlanError("Queries not served by an index:\n" + "\n".join(
+            f"{sql}\n    " + "\n    ".join(problems) for sql, problems in failures
+        ))
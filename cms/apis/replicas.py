@@ -0,0 +1,209 @@
+"""
+Read replicas for API reads, with read-your-writes stickiness.
+
+settings.DATABASE_REPLICAS lists database aliases holding copies of 'default'. For each
+GET, HEAD or OPTIONS request, ReplicaMiddleware picks one of them at random, and
+ReplicaRouter sends that request's reads there. Everything else reads from the primary:
+
+  * requests with other methods, and code outside requests (commands, jobs, the shell);
+  * reads after the request has written anything, so it sees its own writes;
+  * reads inside a transaction on the primary (select_for_update counts as a write);
+  * clients that wrote in the last REPLICA_PIN_SECONDS, so a replica that lags behind
+    cannot hide what they just wrote;
+  * reads inside a primary() block: rows that go into a shared cache (response cache
+    misses, the authentication cache) would otherwise serve a lagging copy to every client
+    until the entry expires, the writer included, since the cache is checked first;
+  * sessions and API tokens, so a logout or a deleted token takes effect at once.
+
+A request that writes pins its client to the primary in two ways. Browsers get a cookie.
+API clients get an entry in the shared state (apis/shared_state.py), keyed on a hash of
+their Authorization header, which every worker process sees.
+
+`sync_replicas` copies a SQLite primary into SQLite replicas, so the routing can be tried
+locally. Between syncs the copies are stale, as a lagging replica would be.
+"""
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from hashlib import sha256
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from . import shared_state
+
+SAFE_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+PIN_COOKIE = 'primary_pin'
+PREFIX = 'replicas'
+
+# Models always read from the primary
+PRIMARY_MODELS = {'sessions.session', 'authtoken.token'}
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+class RoutingState:
+    """
+    Where the current request may read from; `replica` is None for the primary.
+    """
+    def __init__(self, replica):
+        self.replica = replica
+        self.wrote = False
+
+
+# Set for the length of each request; sync_to_async copies it into the ORM's thread
+_state = ContextVar('replica_routing', default=None)
+
+
+def pin_key(request):
+    authorization = request.headers.get('Authorization')
+    if not authorization:
+        return None
+    return f'{PREFIX}:pin:{sha256(authorization.encode("utf-8")).hexdigest()}'
+
+
+def pinned(request):
+    """
+    Whether the client wrote recently enough that its reads must see the primary.
+    """
+    try:
+        if float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+    key = pin_key(request)
+    return key is not None and shared_state.get(key) is not None
+
+
+def pin(request, response):
+    until = time.time() + pin_seconds()
+    response.set_cookie(PIN_COOKIE, f'{until:.3f}', max_age=pin_seconds(), httponly=True, samesite='Lax')
+    key = pin_key(request)
+    if key is not None:
+        shared_state.put(key, int(until), pin_seconds())
+
+
+@contextmanager
+def primary():
+    """
+    Read from the primary inside the block.
+    """
+    state = _state.get()
+    if state is None or state.replica is None:
+        yield
+        return
+    replica, state.replica = state.replica, None
+    try:
+        yield
+    finally:
+        state.replica = replica
+
+
+def from_replica(instance):
+    return instance._state.db in replicas()
+
+
+def choose(request):
+    aliases = replicas()
+    if not aliases or request.method not in SAFE_METHODS or pinned(request):
+        return None
+    return random.choice(aliases)
+
+
+def copy_sqlite(source, target):
+    """
+    Copy the SQLite database behind alias `source` over the one behind `target`, with
+    SQLite's online backup, so the copy is consistent even while the source is written.
+    """
+    for alias in (source, target):
+        if connections[alias].vendor != 'sqlite':
+            raise ValueError(f"Database '{alias}' is not SQLite.")
+    connections[target].close()
+    connections[source].ensure_connection()
+    destination = sqlite3.connect(connections[target].settings_dict['NAME'])
+    try:
+        connections[source].connection.backup(destination)
+    finally:
+        destination.close()
+
+
+class ReplicaRouter:
+    """
+    Reads go to the request's replica when ReplicaMiddleware chose one; writes, migrations
+    and everything else go to the primary.
+    """
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or state.wrote:
+            return None
+        if model._meta.label_lower in PRIMARY_MODELS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None # A transaction must not mix in rows from a lagging copy
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Rows read from a replica are the primary's rows
+        aliases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False # Replicas get their schema from the primary
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Choose where each request reads from, and pin clients that wrote to the primary.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState(choose(request))
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, response, state)
+
+    async def __acall__(self, request):
+        # Pins live in the shared-state file, so reading and writing them happens on a thread
+        state = RoutingState(await sync_to_async(choose)(request))
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return await sync_to_async(self.finish)(request, response, state)
+
+    def finish(self, request, response, state):
+        if state.wrote and replicas():
+            pin(request, response)
+        return response
@@ -0,0 +1,233 @@
+"""
+Response cache for the article list and detail endpoints.
+
+Entries are keyed on the normalized request URL and the viewer's visibility class, and
+every key embeds version stamps that the model signals throw away on change:
+- an epoch shared by every entry (invalidate_all, for writes that bypass signals)
+- a list generation, dropped by any Article, Comment or author change
+- a per-article version (by slug), dropped when that article or its comments change
+- a per-author version, checked on every detail hit so profile edits show up at once
+- an authors generation, dropped by any author change, checked on detail hits that
+  embed comments (comment lists show many authors)
+A version that is missing is recreated with a fresh timestamp, so an evicted version
+can never bring an old entry back to life. The stamps are kept where every worker process
+sees them (apis/shared_state.py), so a write invalidates entries in all workers at once,
+even when the entries themselves sit in a per-process LocMemCache.
+"""
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+from . import replicas, shared_state
+
+PREFIX = 'articles:rc'
+HITS_KEY = f'{PREFIX}:stats:hits'
+MISSES_KEY = f'{PREFIX}:stats:misses'
+EPOCH_KEY = f'{PREFIX}:v:epoch'
+LIST_KEY = f'{PREFIX}:v:list'
+AUTHORS_KEY = f'{PREFIX}:v:authors'
+
+# Author fields that appear in article payloads; other user saves (e.g. last_login) are ignored
+AUTHOR_FIELDS = {'username', 'email', 'first_name', 'last_name', 'other_name', 'occupation', 'bio', 'profile_picture', 'profile_picture_variants'}
+
+
+def timeout():
+    return getattr(settings, 'ARTICLE_CACHE_TIMEOUT', 300)
+
+
+def article_version_key(slug):
+    return f'{PREFIX}:v:article:{slug}'
+
+
+def author_version_key(user_id):
+    return f'{PREFIX}:v:author:{user_id}'
+
+
+def normalize(request):
+    """
+    Host, path and sorted query string; the order of query parameters does not matter.
+    """
+    query = sorted(
+        (name, value)
+        for name in request.query_params
+        for value in request.query_params.getlist(name)
+    )
+    raw = f'{request.get_host()}{request.path}?{query!r}'
+    return sha256(raw.encode('utf-8')).hexdigest()
+
+
+def viewer_class(user):
+    if not user.is_authenticated:
+        return 'anonymous'
+    return 'staff' if user.is_staff else 'authenticated'
+
+
+def private_class(user):
+    """
+    Visibility class under which a non-public article is cached for this viewer.
+    """
+    return 'staff' if user.is_staff else f'author:{user.pk}'
+
+
+def list_key(request):
+    epoch, generation = shared_state.get_versions(EPOCH_KEY, LIST_KEY)
+    return f'{PREFIX}:list:{viewer_class(request.user)}:{epoch}:{generation}:{normalize(request)}'
+
+
+def detail_keys(request, slug):
+    """
+    Keys for the public entry and, for signed-in viewers, their private entry.
+    """
+    epoch, version = shared_state.get_versions(EPOCH_KEY, article_version_key(slug))
+    base = f'{PREFIX}:detail:{{}}:{epoch}:{version}:{normalize(request)}'
+    keys = {'public': base.format('public')}
+    if request.user.is_authenticated:
+        keys['private'] = base.format(private_class(request.user))
+    return keys
+
+
+def record(hit):
+    key = HITS_KEY if hit else MISSES_KEY
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError: # Evicted between add and incr
+        cache.set(key, 1, None)
+
+
+def stats():
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = counters.get(HITS_KEY, 0)
+    misses = counters.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else 0.0,
+    }
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
+
+
+def get_list(request):
+    key = list_key(request)
+    return key, cache.get(key)
+
+
+def set_list(key, data):
+    cache.set(key, data, timeout())
+
+
+def get_detail(request, slug):
+    """
+    Look up a cached detail payload, public first and then the viewer's private class.
+    Returns (keys, data); `keys` maps 'public'/'private' to the keys used for the lookup.
+    """
+    keys = detail_keys(request, slug)
+    found = cache.get_many(list(keys.values()))
+    for key in keys.values():
+        entry = found.get(key)
+        if entry is None:
+            continue
+        versions = entry_versions(entry['author'], 'authors_version' in entry)
+        if all(entry[name] == version for name, version in versions.items()):
+            return keys, entry['data']
+    return keys, None
+
+
+def entry_versions(author_id, with_comments=False):
+    """
+    Versions a detail entry is checked against: its author's, plus the authors generation
+    when it embeds comments (a commenter's profile edit changes the payload too).
+    """
+    keys = [author_version_key(author_id)]
+    if with_comments:
+        keys.append(AUTHORS_KEY)
+    versions = shared_state.get_versions(*keys)
+    return dict(zip(('author_version', 'authors_version'), versions))
+
+
+def set_detail(key, article, data):
+    versions = entry_versions(article.author_id, 'comments' in data)
+    cache.set(key, {'author': article.author_id, 'data': data, **versions}, timeout())
+
+
+def store_detail(keys, article, data):
+    """
+    Cache a detail payload under the public key, or under the viewer's private key
+    when the article is not public.
+    """
+    key = keys['public'] if article.is_published == 'published' else keys.get('private')
+    if key is not None:
+        set_detail(key, article, data)
+
+
+def _drop(*keys):
+    shared_state.drop(*keys)
+    # A reader may repopulate from pre-commit data in between, so drop again once committed
+    transaction.on_commit(lambda: shared_state.drop(*keys))
+
+
+def invalidate_article(slug):
+    _drop(LIST_KEY, article_version_key(slug))
+
+
+def invalidate_articles(slugs):
+    _drop(LIST_KEY, *map(article_version_key, slugs))
+
+
+def invalidate_author(user_id):
+    _drop(LIST_KEY, AUTHORS_KEY, author_version_key(user_id))
+
+
+def invalidate_all():
+    _drop(EPOCH_KEY)
+
+
+class ResponseCacheMixin:
+    """
+    Serve `list` and `retrieve` from the response cache.
+    The view's get_object must store the fetched article on `self.object`. Misses read from
+    the primary, since what they fetch is cached for every client (apis/replicas.py).
+    """
+    def list(self, request, *args, **kwargs):
+        key, data = get_list(request)
+        if data is not None:
+            record(hit=True)
+            return self.cached_response(data, 'HIT')
+
+        record(hit=False)
+        with replicas.primary(): # A lagging replica's page would be cached under the current stamps
+            response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            set_list(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        slug = kwargs[self.lookup_field]
+        keys, data = get_detail(request, slug)
+        if data is not None:
+            record(hit=True)
+            return self.cached_response(data, 'HIT')
+
+        record(hit=False)
+        with replicas.primary():
+            if getattr(self, 'object', None) is not None and replicas.from_replica(self.object):
+                self.object = None # Loaded from a replica for the conditional check; fetch it again
+            response = super().retrieve(request, *args, **kwargs)
+        article = getattr(self, 'object', None)
+        if response.status_code == 200 and article is not None:
+            store_detail(keys, article, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def cached_response(self, data, state):
+        response = Response(data)
+        response['X-Cache'] = state
+        return response
@@ -0,0 +1,184 @@
+"""
+Small pieces of state that every worker process must see at once.
+
+Caches embed version stamps: the response cache (apis/response_cache.py) keys entries on
+them and conditional GETs build ETags from them (apis/conditional.py). A write drops the
+stamps it affects, and the next read recreates them with a fresh timestamp. If the stamps
+live in a process-local cache (LocMemCache, the default), the drop only reaches the process
+that handled the write, and every other worker keeps serving the old entries.
+
+So stamps live in the default cache only when that cache is shared between processes (Redis,
+Memcached, database or file; see settings.CACHES). Otherwise they live in a SQLite file that
+all processes on the host share (settings.SHARED_STATE_DATABASE, WAL mode), like the
+rate-limit counters (apis/throttling.py). Reading the stamps for a request is one indexed
+SELECT; a missing stamp costs one INSERT.
+
+The same place holds short-lived values with a timeout (put/get), such as the replica pins
+of apis/replicas.py.
+"""
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+BUSY_TIMEOUT = 5 # Seconds a write waits for another process's write before giving up
+PRUNE_PROBABILITY = 0.01 # Share of put() calls that also delete expired values
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL,
+    expires REAL -- NULL for stamps, which live until dropped; a time.time() for put() values
+) WITHOUT ROWID
+'''
+
+
+def database_path():
+    return str(getattr(settings, 'SHARED_STATE_DATABASE', settings.BASE_DIR / 'shared_state.sqlite3'))
+
+
+def cache_is_shared(alias='default'):
+    """
+    Whether entries in this cache are visible to every worker process.
+    """
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+class StateStore:
+    """
+    Stamps and expiring values in one SQLite file; one connection per thread and process.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None and self.local.pid == os.getpid():
+            return conn
+        # A connection inherited over fork belongs to the parent
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL') # Readers and the single writer do not block each other
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(SCHEMA)
+        self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def get_many(self, keys):
+        marks = ', '.join('?' * len(keys))
+        rows = self.connect().execute(
+            f'SELECT key, value FROM state WHERE key IN ({marks}) AND (expires IS NULL OR expires > ?)',
+            (*keys, time.time()),
+        )
+        return dict(rows.fetchall())
+
+    def versions(self, keys):
+        found = self.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            # Another process may create the same stamp meanwhile; whichever lands first wins
+            self.connect().executemany('INSERT OR IGNORE INTO state (key, value) VALUES (?, ?)',
+                                       [(key, time.time_ns()) for key in missing])
+            found.update(self.get_many(missing))
+        return [found[key] for key in keys]
+
+    def put(self, key, value, expires):
+        conn = self.connect()
+        conn.execute('INSERT OR REPLACE INTO state (key, value, expires) VALUES (?, ?, ?)', (key, value, expires))
+        if random.random() < PRUNE_PROBABILITY:
+            conn.execute('DELETE FROM state WHERE expires <= ?', (time.time(),))
+
+    def delete_many(self, keys):
+        marks = ', '.join('?' * len(keys))
+        self.connect().execute(f'DELETE FROM state WHERE key IN ({marks})', keys)
+
+    def clear(self):
+        self.connect().execute('DELETE FROM state')
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def store():
+    path = database_path()
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = StateStore(path)
+        return _stores[path]
+
+
+def get_versions(*keys):
+    """
+    Version stamps for `keys`, in order, creating any that are missing.
+    """
+    if not cache_is_shared():
+        return store().versions(list(keys))
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def drop(*keys):
+    """
+    Throw stamps away; each is recreated, newer, on its next read.
+    """
+    if not cache_is_shared():
+        store().delete_many(list(keys))
+    else:
+        cache.delete_many(keys)
+
+
+def put(key, value, timeout):
+    """
+    Keep an integer `value` under `key` for `timeout` seconds.
+    """
+    if not cache_is_shared():
+        store().put(key, value, time.time() + timeout)
+    else:
+        cache.set(key, value, timeout)
+
+
+def get(key):
+    """
+    The value put() under `key`, or None once it expired.
+    """
+    if not cache_is_shared():
+        return store().get_many([key]).get(key)
+    return cache.get(key)
+
+
+def reset():
+    """
+    Forget every stamp and value, e.g. between tests.
+    """
+    store().clear()
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_state(app_configs, **kwargs):
+    """
+    With a process-local default cache, invalidation depends on the shared file being usable.
+    """
+    if cache_is_shared():
+        return []
+    try:
+        store().connect()
+    except sqlite3.Error as exc:
+        return [checks.Error(
+            f"The shared state file {database_path()} cannot be opened: {exc}.",
+            hint="Set SHARED_STATE_DATABASE to a writable path on a local disk, or set REDIS_URL "
+                 "so caches and their version stamps are shared through Redis.",
+            id='apis.E001',
+        )]
+    return []
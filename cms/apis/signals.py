@@ -0,0 +1,67 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from articles.models import Article, Comment
+from articles.signals import deleted_model
+from . import authentication, response_cache
+
+CustomUser = get_user_model()
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_delete, sender=Article)
+def invalidate_article(sender, instance, **kwargs):
+    response_cache.invalidate_article(instance.slug)
+
+
+def article_slug(comment):
+    # The comment's own article instance when it is loaded; otherwise only the slug is fetched
+    if Comment.article.is_cached(comment):
+        return comment.article.slug
+    return Article.objects.filter(pk=comment.article_id).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Comment)
+def invalidate_comment_article(sender, instance, **kwargs):
+    response_cache.invalidate_article(article_slug(instance))
+
+
+@receiver(post_delete, sender=Comment)
+def invalidate_deleted_comment_article(sender, instance, origin=None, **kwargs):
+    # Cascades from an article or a user invalidate in one go (see below and invalidate_article)
+    if deleted_model(origin) in (Article, CustomUser):
+        return
+    slug = article_slug(instance)
+    if slug is not None:
+        response_cache.invalidate_article(slug)
+
+
+@receiver(pre_delete, sender=CustomUser)
+def invalidate_commented_articles(sender, instance, **kwargs):
+    # Replies live on their parent's article, so these are all the articles losing comments
+    slugs = Article.objects.filter(comments__author=instance).values_list('slug', flat=True).distinct()
+    response_cache.invalidate_articles(list(slugs))
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_author(sender, instance, update_fields=None, **kwargs):
+    # Saves such as the last_login stamp on login do not change what articles show
+    if update_fields is not None and not response_cache.AUTHOR_FIELDS & set(update_fields):
+        return
+    response_cache.invalidate_author(instance.pk)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def forget_authenticated_user(sender, instance, update_fields=None, **kwargs):
+    # Password, is_active and is_verified changes must not be served from a stale snapshot
+    if update_fields is not None and set(update_fields) <= authentication.IGNORED_FIELDS:
+        return
+    authentication.forget_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def forget_token(sender, instance, **kwargs):
+    authentication.forget_token(instance.key, instance.user_id)
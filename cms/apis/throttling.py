@@ -0,0 +1,188 @@
+"""
+Rate limiting shared by every worker process on the host.
+
+DRF's throttles keep a list of request timestamps per client in Django's cache, which with
+the default LocMemCache is private to each process, so N gunicorn workers allowed N times
+the configured rate. The throttles here keep DRF's scopes, rates and keys but count in a
+SQLite file (settings.THROTTLE_DATABASE, WAL mode) that all processes share, with a
+sliding-window counter instead of a history list: each key holds this fixed window's count
+and the previous window's, and the previous one is weighted by how much of it the sliding
+window still covers. A check is one read and one upsert of a single row inside
+BEGIN IMMEDIATE, so concurrent workers never both take the last slot.
+"""
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from rest_framework import throttling
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+BUSY_TIMEOUT = 5 # Seconds a check waits for another process's write before giving up
+PRUNE_PROBABILITY = 0.001 # Share of checks that also delete expired rows
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS throttle (
+    key TEXT PRIMARY KEY,
+    window INTEGER NOT NULL,
+    current INTEGER NOT NULL,
+    previous INTEGER NOT NULL,
+    expires REAL NOT NULL
+) WITHOUT ROWID
+'''
+
+
+def database_path():
+    return str(getattr(settings, 'THROTTLE_DATABASE', settings.BASE_DIR / 'throttle.sqlite3'))
+
+
+def roll(row, window):
+    """
+    (current, previous) counts for `window` from a stored (window, current, previous) row.
+    """
+    if row is None:
+        return 0, 0
+    stored, current, previous = row
+    if stored == window:
+        return current, previous
+    if stored == window - 1:
+        return 0, current
+    return 0, 0
+
+
+def retry_after(current, previous, fraction, duration, limit):
+    """
+    Seconds until the weighted count leaves room for one more request.
+    """
+    spare = limit - 1 - current
+    if spare >= 0:
+        # Room opens up in this window as the previous window slides out
+        return duration * (1 - fraction - spare / previous) if previous else 0.0
+    # Otherwise wait for this window to become the previous one and slide out far enough
+    return duration * (1 - fraction) + duration * max(0.0, 1 - (limit - 1) / current)
+
+
+class CounterStore:
+    """
+    Sliding-window counters in one SQLite file; one connection per thread and process.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None and self.local.pid == os.getpid():
+            return conn
+        # A connection inherited over fork belongs to the parent
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL') # Readers and the single writer do not block each other
+        conn.execute('PRAGMA synchronous=NORMAL') # Counters may lose the last moment of writes on power loss
+        conn.execute(SCHEMA)
+        self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def hit(self, key, duration, limit, now=None):
+        """
+        Count a request for `key` if the limit allows it. Returns (allowed, retry_after).
+        """
+        now = time.time() if now is None else now
+        window = int(now // duration)
+        fraction = now / duration - window
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT window, current, previous FROM throttle WHERE key = ?', (key,)).fetchone()
+            current, previous = roll(row, window)
+            allowed = previous * (1 - fraction) + current + 1 <= limit
+            if allowed:
+                current += 1
+            if allowed or row is None or row[0] != window:
+                conn.execute(
+                    'INSERT INTO throttle (key, window, current, previous, expires) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET window = excluded.window, current = excluded.current, '
+                    'previous = excluded.previous, expires = excluded.expires',
+                    (key, window, current, previous, (window + 2) * duration),
+                )
+            if random.random() < PRUNE_PROBABILITY:
+                conn.execute('DELETE FROM throttle WHERE expires < ?', (now,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, None if allowed else retry_after(current, previous, fraction, duration, limit)
+
+    def count(self, key, duration, now=None):
+        """
+        The weighted request count for `key` right now.
+        """
+        now = time.time() if now is None else now
+        window = int(now // duration)
+        row = self.connect().execute('SELECT window, current, previous FROM throttle WHERE key = ?', (key,)).fetchone()
+        current, previous = roll(row, window)
+        return previous * (1 - (now / duration - window)) + current
+
+    def clear(self):
+        self.connect().execute('DELETE FROM throttle')
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def store():
+    path = database_path()
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = CounterStore(path)
+        return _stores[path]
+
+
+def reset():
+    """
+    Forget every client's count, e.g. between tests.
+    """
+    store().clear()
+
+
+class CounterRateThrottle(throttling.SimpleRateThrottle):
+    """
+    SimpleRateThrottle counting in the shared store instead of a cached history list.
+    """
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        try:
+            allowed, self.retry_after = store().hit(self.key, self.duration, self.num_requests)
+        except sqlite3.Error:
+            # A broken or stuck counter file should not take the API down with it
+            logger.warning("Rate limit check for %s failed; allowing the request", self.key, exc_info=True)
+            return True
+        if not allowed:
+            metrics.record_throttle(self.scope)
+        return allowed
+
+    def wait(self):
+        return getattr(self, 'retry_after', None)
+
+
+# DRF's classes first, so their identity and scope lookup run before the shared counter
+class AnonRateThrottle(throttling.AnonRateThrottle, CounterRateThrottle):
+    pass
+
+
+class UserRateThrottle(throttling.UserRateThrottle, CounterRateThrottle):
+    pass
+
+
+class ScopedRateThrottle(throttling.ScopedRateThrottle, CounterRateThrottle):
+    pass
@@ -1,22 +1,29 @@
 from rest_framework import generics, viewsets, filters, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.exceptions import PermissionDenied, NotFound
+from rest_framework.exceptions import PermissionDenied, NotFound, ValidationError
 from rest_framework.authtoken.views import ObtainAuthToken
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Q
 from django.utils import timezone
 from articles.models import Article, Comment
-from articles.serializers import ArticlesSerializers, CommentSerializers, ArticlesSearchSerializer, EmailVerificationResponseSerializer
-from users.serializers import CustomUserSerializer, UserRegistrationSerializer, LoginSerializer
+from articles.search import search_articles, index_articles
+from articles import export, threads
+from articles.serializers import ArticlesSerializers, CommentSerializers, ArticlesSearchSerializer, EmailVerificationResponseSerializer, ArticleBatchSerializer, ThreadedCommentSerializer
+from users.serializers import CustomUserSerializer, UserRegistrationSerializer, LoginSerializer, RefreshTokenSerializer
+from users.mail import queue_mail
+from users import tokens
+from jobs.queue import metrics as job_metrics
 from django.contrib.auth import get_user_model, authenticate
-from django.http import Http404
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, StreamingHttpResponse
 from django.urls import reverse
 from django.template.loader import render_to_string
 from django.conf import settings
-from django.core.mail import send_mail, EmailMessage
 from django.db import transaction
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle, ScopedRateThrottle
+from .throttling import UserRateThrottle, AnonRateThrottle, ScopedRateThrottle
+from .response_cache import ResponseCacheMixin
+from . import response_cache, conditional
+from .query_budget import query_budget
 
 
 CustomUser = get_user_model()
@@ -50,14 +57,24 @@ class IsVerifiedUser(permissions.BasePermission):
         user = request.user
         return user.is_authenticated and getattr(user, "is_verified", False)
 
-class ArticleViewSet(viewsets.ModelViewSet):
+def can_read_article(user, article):
+    """
+    Drafts and scheduled articles exist only for their author and staff.
+    """
+    if article.is_published == 'published':
+        return True
+    return user.is_authenticated and (article.author_id == user.pk or user.is_staff)
+
+class ArticleViewSet(ResponseCacheMixin, viewsets.ModelViewSet):
     """
     A viewset for viewing, creating, updating and deleting articles.
     Lists only published articles to the public
+    List and detail reads are served from the response cache when possible.
     """
     queryset = Article.objects.all()
     serializer_class = ArticlesSerializers
     lookup_field = 'slug' #using slug to retrieve individual articles
+    ordering = ('created_at', 'id') # Oldest first; the paginator keys its cursor on these
     permission_classes = [(IsVerifiedUser | permissions.IsAuthenticatedOrReadOnly), IsAuthorOrReadOnly]
     throttle_classes = [AnonRateThrottle, UserRateThrottle]
 
@@ -68,16 +85,53 @@ class ArticleViewSet(viewsets.ModelViewSet):
         -For detail view (GET /articles/{slug}/): SHow the specific article if its public OR if the requesting user is the author or staff
         """
         user = self.request.user
-        queryset = Article.objects.all()
+        queryset = Article.objects.select_related('author') # The serializer nests the author
 
         if self.action == 'list':
             #Only show published articles with publication date in the past/present
             queryset = queryset.filter(is_published='published',created_at__lte = timezone.now())
 
-        queryset = queryset.order_by("created_at")
+        queryset = queryset.order_by("created_at", "id")
 
 
         return queryset
+
+    @query_budget(2) # The page and the embedded comments when asked for; validators and cache hits need none
+    def list(self, request, *args, **kwargs):
+        validators = conditional.article_list_validators(request)
+        unchanged = conditional.not_modified(request, validators)
+        if unchanged is not None:
+            return unchanged
+        return conditional.set_headers(super().list(request, *args, **kwargs), validators)
+
+    @query_budget(3) # The article, again from the primary when a replica served it and the cache missed, and embedded comments
+    def retrieve(self, request, *args, **kwargs):
+        article = self.get_object()
+        validators = conditional.article_validators(request, article)
+        unchanged = conditional.not_modified(request, validators)
+        if unchanged is not None:
+            return unchanged
+        return conditional.set_headers(super().retrieve(request, *args, **kwargs), validators)
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action == 'retrieve' and args:
+            self.embed_comments(args[:1]) # Just before serializing, so 304s and cache hits skip it
+        return super().get_serializer(*args, **kwargs)
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            self.embed_comments(page)
+        return page
+
+    def embed_comments(self, articles):
+        """
+        With ?comments=N, attach each article's latest N approved comments (N is capped)
+        so the serializer includes them as `comments`.
+        """
+        limit = threads.embed_limit(self.request.query_params.get('comments'))
+        if limit:
+            threads.attach_latest_comments(articles, limit)
     
     def perform_create(self, serializer):
         """
@@ -89,42 +143,160 @@ class ArticleViewSet(viewsets.ModelViewSet):
         serializer.save(author=self.request.user)
 
     def get_object(self):
+        if getattr(self, 'object', None) is not None:
+            return self.object # Already loaded for the conditional check
         obj = super().get_object()
 
-        if obj.is_published != 'published':
-            user = self.request.user
-            if not user.is_authenticated or (obj.author != user and not user.is_staff):
-                raise Http404()
+        if not can_read_article(self.request.user, obj):
+            raise Http404()
 
+        self.object = obj # Lets the response cache see who may read this payload
         return obj
     
 
     
 
+# articles/batch/
+class ArticleBatchAPIView(generics.GenericAPIView):
+    """
+    API view applying many article creates, updates and deletes in one request and one transaction.
+    Every target is fetched in a single query and checked against IsAuthorOrReadOnly in memory;
+    writes go through bulk_create/bulk_update. With `atomic` (the default) nothing is applied
+    unless every operation is valid; otherwise valid operations are applied and the rest reported.
+    """
+    serializer_class = ArticleBatchSerializer
+    permission_classes = [(IsVerifiedUser | permissions.IsAuthenticated), IsAuthorOrReadOnly]
+    throttle_classes = [UserRateThrottle]
+
+    def post(self, request, *args, **kwargs):
+        envelope = self.get_serializer(data=request.data)
+        envelope.is_valid(raise_exception=True)
+        operations = envelope.validated_data['operations']
+
+        slugs = {operation['slug'] for operation in operations if operation['op'] != 'create'}
+        targets = Article.objects.select_related('author').in_bulk(slugs, field_name='slug')
+        context = self.get_serializer_context()
+        checks = self.get_permissions()
+
+        results, creates, updates, deletes, seen = [], [], [], [], set()
+        for index, operation in enumerate(operations):
+            result = {'index': index, 'op': operation['op']}
+            results.append(result)
+            if operation['op'] == 'create':
+                serializer = ArticlesSerializers(data=operation['data'], context=context)
+                if serializer.is_valid():
+                    creates.append((result, Article(author=request.user, **serializer.validated_data)))
+                else:
+                    result.update(status=status.HTTP_400_BAD_REQUEST, errors=serializer.errors)
+                continue
+
+            slug = result['slug'] = operation['slug']
+            article = targets.get(slug)
+            if article is None or not can_read_article(request.user, article):
+                result.update(status=status.HTTP_404_NOT_FOUND, errors={'detail': 'Not found.'})
+            elif slug in seen:
+                result.update(status=status.HTTP_400_BAD_REQUEST, errors={'detail': 'Article already targeted earlier in this batch.'})
+            elif not all(permission.has_object_permission(request, self, article) for permission in checks):
+                result.update(status=status.HTTP_403_FORBIDDEN, errors={'detail': 'You do not have permission to perform this action.'})
+            elif operation['op'] == 'update':
+                serializer = ArticlesSerializers(article, data=operation['data'], partial=True, context=context)
+                if serializer.is_valid():
+                    for field, value in serializer.validated_data.items():
+                        setattr(article, field, value)
+                    updates.append((result, article, set(serializer.validated_data)))
+                else:
+                    result.update(status=status.HTTP_400_BAD_REQUEST, errors=serializer.errors)
+            else:
+                deletes.append((result, article))
+            seen.add(slug)
+
+        if envelope.validated_data['atomic'] and any('status' in result for result in results):
+            for result in results:
+                result.setdefault('status', status.HTTP_424_FAILED_DEPENDENCY)
+            return Response({'applied': False, 'results': results}, status=status.HTTP_400_BAD_REQUEST)
+
+        self.apply(creates, updates, deletes)
+        for result, article in creates:
+            result.update(status=status.HTTP_201_CREATED, slug=article.slug, data=ArticlesSerializers(article, context=context).data)
+        for result, article, _ in updates:
+            result.update(status=status.HTTP_200_OK, data=ArticlesSerializers(article, context=context).data)
+        for result, article in deletes:
+            result['status'] = status.HTTP_204_NO_CONTENT
+        return Response({'applied': True, 'results': results}, status=status.HTTP_200_OK)
+
+    @transaction.atomic
+    def apply(self, creates, updates, deletes):
+        """
+        Write the accepted operations. Bulk writes send no signals, so the search index
+        and response cache are updated here; deletes still go through the ORM collector.
+        """
+        created = Article.objects.bulk_create([article for _, article in creates]) # Slugs allocated in one query
+        changed = [article for _, article, _ in updates]
+        if changed:
+            now = timezone.now()
+            fields = {'updated_at'}
+            for _, article, updated in updates:
+                article.updated_at = now
+                fields |= updated
+            Article.objects.bulk_update(changed, sorted(fields))
+        if deletes:
+            Article.objects.filter(pk__in=[article.pk for _, article in deletes]).delete()
+
+        index_articles(created + changed)
+        for article in created + changed:
+            response_cache.invalidate_article(article.slug)
+
+
+class ThreadListMixin:
+    """
+    List one level of a comment thread: a keyset page plus a reply preview for each entry.
+    A cheap aggregate over the article's comments runs first; it answers 404 for hidden
+    articles and 304 for unchanged polls, before the page is fetched.
+    """
+    ordering = ('created_at', 'id') # Oldest first; the paginator keys its cursor on these
+
+    def list(self, request, *args, **kwargs):
+        activity = threads.thread_activity(self.kwargs['slug'])
+        if activity is None:
+            raise Http404() # Missing or unpublished article
+        validators = conditional.thread_validators(request, self.kwargs['slug'], activity)
+        unchanged = conditional.not_modified(request, validators)
+        if unchanged is not None:
+            return unchanged
+
+        page = self.paginate_queryset(self.get_queryset())
+        if not page and self.kwargs.get('pk') is not None and not threads.thread_exists(self.kwargs['slug'], self.kwargs['pk']):
+            raise Http404()
+        threads.attach_reply_previews(page)
+        serializer = self.get_serializer(page, many=True)
+        return conditional.set_headers(self.get_paginated_response(serializer.data), validators)
+
+
 # URL pattern: /articles/<slug:slug>/comments/
-class CommentListCreateAPIView(generics.ListCreateAPIView):
+class CommentListCreateAPIView(ThreadListMixin, generics.ListCreateAPIView):
     """
-    API view for listing comments of a specific article or creating a new comment for it.
+    API view for listing the top-level comments of a specific article, each with a preview
+    of its replies, or creating a new comment (or reply, via `parent`) for it.
     """
-    serializer_class = CommentSerializers
     permission_classes = [permissions.IsAuthenticatedOrReadOnly] # Authenticated users can comment
     throttle_classes = [ScopedRateThrottle]
     throttle_scope = 'comment'
 
+    def get_serializer_class(self):
+        if self.request.method == 'GET':
+            return ThreadedCommentSerializer
+        return CommentSerializers
+
     def get_queryset(self):
         """
-        Get comments for the article specified in the URL slug.
+        Top-level comments for the article in the URL slug, oldest first.
+        The article's visibility is checked in the same query.
         """
-        article_slug = self.kwargs.get('slug') # Get slug from URL parameters
-        # Ensure the article exists and is public (or accessible to the user)
-        article = get_object_or_404(
-            Article,
-            slug=article_slug,
-            is_published='published', # Only allow comments on published articles (adjust if needed)
-            created_at__lte=timezone.now()
-        )
-        # Return comments ordered by creation date
-        return Comment.objects.filter(article=article).order_by('created_at')
+        return threads.thread_comments(self.kwargs.get('slug')).order_by('created_at', 'id')
+
+    @query_budget(3)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         """
@@ -141,22 +313,54 @@ class CommentListCreateAPIView(generics.ListCreateAPIView):
         if not self.request.user.is_authenticated:
             raise PermissionDenied("You must be authenticated to comment.")
 
+        parent = serializer.validated_data.get('parent')
+        if parent is not None and parent.article_id != article.pk:
+            raise ValidationError({'parent': ["Replies must be on the same article."]})
+
         # Save the comment, setting author and article
         serializer.save(author=self.request.user, article=article)
 
+#articles/<slug:slug>/comments/<int:pk>/replies/
+class CommentRepliesAPIView(ThreadListMixin, generics.ListAPIView):
+    """
+    API view for paging through the direct replies to a comment, each with its own reply preview.
+    """
+    serializer_class = ThreadedCommentSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+
+    def get_queryset(self):
+        return threads.thread_comments(self.kwargs.get('slug'), self.kwargs.get('pk')).order_by('created_at', 'id')
+
+    @query_budget(3)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 #articles/<slug:slug>/comments/<int:pk>/
 class CommentRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
     """
     API view for retrieving, updating, or deleting a specific comment.
     Only the author can update or delete their comment.
     """
-    queryset = Comment.objects.all() # Base queryset for comments
+    queryset = Comment.objects.select_related('author') # Base queryset for comments
     serializer_class = CommentSerializers
     lookup_field = 'pk' # Default lookup field is 'pk' (ID)
     # Permissions: Authenticated users can read, author can update/delete
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
     throttle_classes = [AnonRateThrottle, UserRateThrottle]
 
+    @query_budget(1)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        comment = self.get_object()
+        validators = conditional.comment_validators(request, comment)
+        unchanged = conditional.not_modified(request, validators)
+        if unchanged is not None:
+            return unchanged
+        return conditional.set_headers(Response(self.get_serializer(comment).data), validators)
+
 # user/create
 class UserRegistrationAPIView(generics.CreateAPIView):
     """
@@ -168,6 +372,7 @@ class UserRegistrationAPIView(generics.CreateAPIView):
     throttle_classes = [AnonRateThrottle, ScopedRateThrottle]
     throttle_scope = 'registration' # Links to the 'registration' rate in settings
 
+    @transaction.atomic
     def perform_create(self, serializer):
         # The create method of the serializer handles user creation with password hashing
         user = serializer.save()
@@ -182,52 +387,53 @@ class UserRegistrationAPIView(generics.CreateAPIView):
             reverse('verify-email', kwargs={'user_id': user.pk, 'token': token})
         )
 
-        # 3. Send the email
+        # 3. Queue the email in the same transaction as the user row;
+        # a runworker job delivers it, so registration never waits on SMTP
         subject = ("Verify your email address")
         message = f"Please click the link to verify your email: {verification_url}" # Simple plain text message
 
         from_email = settings.DEFAULT_FROM_EMAIL # Configured in settings.py
         recipient_list = [user.email]
 
-        try:
-            send_mail(subject, message, from_email, recipient_list)
-    
-        except Exception as e:
-            print(f"Error sending verification email: {e}")
-
+        queue_mail(subject, message, from_email, recipient_list)
 
         return user
 
 # articles/search/?q=keyword
 class ArticleSearchView(generics.ListAPIView):
     """
-    API view for searching published articles by title.
+    API view for full-text searching published articles by title and content.
     """
     serializer_class = ArticlesSerializers
     # Allow unauthenticated users to search published articles
     permission_classes = [permissions.AllowAny] 
     throttle_classes = [ScopedRateThrottle]
     throttle_scope = 'search' # Links to the 'search' rate in settings
+    ordering = ('-created_at', '-id') # Newest first
 
     def get_queryset(self):
         """
         Filter published articles based on a search query parameter 'q'.
+        Matches go through the full-text index and come back most relevant first.
         """
-        queryset = Article.objects.filter(
+        queryset = Article.objects.select_related('author').filter(
             is_published='published',
             created_at__lte=timezone.now()
         )
         query = self.request.query_params.get('q', None) # Get the 'q' query parameter
 
         if query:
-            # Filter articles where the title contains the query keyword (case-insensitive)
-            # Using Q object for potentially more complex lookups later
-            queryset = queryset.filter(Q(title__icontains=query))
+            # Every term must appear in the title or content; title hits rank higher
+            return search_articles(queryset, query).order_by('-rank', '-id')
 
         # Add default ordering
-        queryset = queryset.order_by('-created_at')
+        queryset = queryset.order_by('-created_at', '-id')
 
         return queryset
+
+    @query_budget(1)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
     
 class ArticleSearchViewPro(generics.ListAPIView):
     """
@@ -237,6 +443,7 @@ class ArticleSearchViewPro(generics.ListAPIView):
     permission_classes = [permissions.AllowAny] 
     throttle_classes = [ScopedRateThrottle]
     throttle_scope = 'search' # Links to the 'search' rate in settings
+    ordering = ('-created_at', '-id') # Newest first
 
     def get_queryset(self):
         """
@@ -248,7 +455,11 @@ class ArticleSearchViewPro(generics.ListAPIView):
             email = email
         )
 
-        return User.articles.filter(is_published='published')
+        return User.articles.filter(is_published='published').select_related('author').order_by('-created_at', '-id')
+
+    @query_budget(2)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
     
 class EmailVerificationAPIView(APIView):
     """
@@ -294,9 +505,85 @@ class LoginAPIView(generics.GenericAPIView):
         
         if user is None:
             return Response({"detail": "Invalid credentials."}, status=status.HTTP_401_UNAUTHORIZED)
-        return Response({"detail": "Login successful."}, status=status.HTTP_200_OK)
-        
-        return Response({"token": token.key}, status=status.HTTP_200_OK)
-        
-            
-    
\ No newline at end of file
+        # A signed access token plus a refresh token to renew it (users/tokens.py)
+        return Response({"detail": "Login successful.", **tokens.issue_pair(user)}, status=status.HTTP_200_OK)
+
+class TokenRefreshAPIView(generics.GenericAPIView):
+    """
+    API view exchanging a refresh token for a new access and refresh token pair.
+    """
+    serializer_class = RefreshTokenSerializer
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = [] # The refresh token is the credential
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'refresh'
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        pair = tokens.rotate(serializer.validated_data['refresh'])
+        if pair is None:
+            return Response({"detail": "Invalid or expired refresh token."}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response(pair, status=status.HTTP_200_OK)
+
+class LogoutAPIView(generics.GenericAPIView):
+    """
+    API view revoking a refresh token. Access tokens already issued run until they expire.
+    """
+    serializer_class = RefreshTokenSerializer
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'refresh'
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        tokens.revoke(serializer.validated_data['refresh'])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class ResponseCacheStatsAPIView(APIView):
+    """
+    API view exposing article response cache hit/miss counters to staff.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, format=None):
+        return Response(response_cache.stats(), status=status.HTTP_200_OK)
+
+class JobStatsAPIView(APIView):
+    """
+    API view exposing background job queue depth, lag and throughput to staff.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, format=None):
+        return Response(job_metrics(), status=status.HTTP_200_OK)
+
+# articles/export/?output=ndjson|csv&updated_after=...&updated_before=...
+class ArticleExportAPIView(APIView):
+    """
+    API view streaming every article with its author and comments to staff.
+    `output` picks NDJSON (default) or CSV; `updated_after`/`updated_before` bound updated_at
+    so exports can be incremental.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, format=None):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in export.FORMATS:
+            return Response({"detail": f"output must be one of: {', '.join(export.FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            queryset = export.export_queryset(
+                export.parse_bound(request.query_params.get('updated_after')),
+                export.parse_bound(request.query_params.get('updated_before')),
+            )
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # An ASGI server needs an async iterator to stream; given a sync one, Django buffers it
+        stream = export.astream if isinstance(request._request, ASGIRequest) else export.stream
+        response = StreamingHttpResponse(stream(output, queryset), content_type=export.FORMATS[output])
+        response['Content-Disposition'] = f'attachment; filename="articles.{output}"'
+        return response
+
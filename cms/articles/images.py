@@ -0,0 +1,150 @@
+"""
+Image derivatives for Article.picture and CustomUser.profile_picture.
+
+For every size in settings.IMAGE_VARIANTS a resized copy is written in the source
+format (JPEG, or PNG when the image has transparency) and in WebP. Copies are re-encoded
+from pixels only, so EXIF/GPS metadata is dropped; orientation is applied first.
+What was generated is recorded in the model's `<field>_variants` JSON column:
+
+    {"source": "<picture name>", "width": 4000, "height": 3000,
+     "variants": {"thumbnail": {"path": ..., "webp": ..., "width": 150, "height": 113}, ...}}
+
+Processing runs in the job worker (articles.tasks.process_image), never in the request.
+Rebuilds are queued on the write path only: by the post_save signals when a picture changes,
+and by `manage.py regenerate_images` for rows written without signals or with files gone
+missing. Serializing never queues anything, so reads stay read-only.
+"""
+import os
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+
+DEFAULT_VARIANTS = {'thumbnail': 150, 'medium': 600, 'large': 1200}
+
+
+def variant_sizes():
+    return getattr(settings, 'IMAGE_VARIANTS', DEFAULT_VARIANTS)
+
+
+def variants_field(field_name):
+    return f'{field_name}_variants'
+
+
+def is_current(instance, field_name):
+    """
+    True when the recorded variants were built from the picture the instance has now.
+    """
+    picture = getattr(instance, field_name)
+    record = getattr(instance, variants_field(field_name)) or {}
+    if not picture:
+        return not record
+    return record.get('source') == picture.name
+
+
+def encode(image, fmt):
+    buffer = BytesIO()
+    if fmt == 'WEBP':
+        image.save(buffer, 'WEBP', quality=getattr(settings, 'IMAGE_WEBP_QUALITY', 80), method=4)
+    elif fmt == 'PNG':
+        image.save(buffer, 'PNG', optimize=True)
+    else:
+        image.convert('RGB').save(buffer, 'JPEG', quality=getattr(settings, 'IMAGE_JPEG_QUALITY', 85), optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def write(storage, path, data):
+    if storage.exists(path):
+        storage.delete(path)
+    return storage.save(path, ContentFile(data))
+
+
+def build_variants(picture):
+    """
+    Generate and store every variant of an ImageFieldFile; returns the record to keep.
+    """
+    storage = picture.storage
+    directory, filename = os.path.split(picture.name)
+    stem = os.path.splitext(filename)[0]
+
+    with picture.open('rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image) # Bake in the orientation before EXIF is dropped
+        image.load()
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    fmt, ext = ('PNG', 'png') if has_alpha else ('JPEG', 'jpg')
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    record = {'source': picture.name, 'width': image.width, 'height': image.height, 'variants': {}}
+    for name, size in variant_sizes().items():
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS) # Never upscales
+        base = os.path.join(directory, 'variants', f'{stem}_{name}')
+        record['variants'][name] = {
+            'path': write(storage, f'{base}.{ext}', encode(resized, fmt)),
+            'webp': write(storage, f'{base}.webp', encode(resized, 'WEBP')),
+            'width': resized.width,
+            'height': resized.height,
+        }
+    return record
+
+
+def delete_variants(storage, record):
+    for variant in (record or {}).get('variants', {}).values():
+        for path in (variant.get('path'), variant.get('webp')):
+            if path and storage.exists(path):
+                storage.delete(path)
+
+
+def process(instance, field_name):
+    """
+    Rebuild the variants of one instance's image field and save the record.
+    """
+    picture = getattr(instance, field_name)
+    old = getattr(instance, variants_field(field_name)) or {}
+    if picture:
+        record = build_variants(picture)
+    else:
+        record = {}
+    if old.get('source') != record.get('source'):
+        delete_variants(picture.storage, old)
+    setattr(instance, variants_field(field_name), record)
+    instance.save(update_fields=[variants_field(field_name)])
+    return record
+
+
+def schedule(instance, field_name):
+    """
+    Queue a rebuild once the current transaction commits.
+    """
+    from .tasks import process_image
+    label = instance._meta.label_lower
+    transaction.on_commit(lambda: process_image.enqueue(label, instance.pk, field_name))
+
+
+def variant_urls(instance, field_name, request=None):
+    """
+    {"thumbnail": {"url", "webp", "width", "height"}, ...} for a serializer; empty while
+    the variants are being (re)built.
+    """
+    if not is_current(instance, field_name):
+        return {}
+
+    picture = getattr(instance, field_name)
+    record = getattr(instance, variants_field(field_name)) or {}
+    urls = {}
+    for name, variant in record.get('variants', {}).items():
+        url, webp = picture.storage.url(variant['path']), picture.storage.url(variant['webp'])
+        if request is not None:
+            url, webp = request.build_absolute_uri(url), request.build_absolute_uri(webp)
+        urls[name] = {'url': url, 'webp': webp, 'width': variant['width'], 'height': variant['height']}
+    return urls
+
+
+def get_instance(label, pk):
+    return apps.get_model(label).objects.filter(pk=pk).first()
@@ -0,0 +1,379 @@
+"""
+Bulk import of articles, their comments and authors, for content migrated from another CMS.
+
+Input is the same shape `export_articles` writes: NDJSON with one article per line and its
+author and comments nested, or CSV with an `article` row followed by its `comment` rows.
+Records are written in batches, one transaction each:
+
+  * authors are resolved by email through an in-memory map, and unknown ones are created
+    with an unusable password;
+  * source slugs are kept where they are free, and the rest are allocated for the whole batch
+    in one query (ArticleManager.allocate_slugs);
+  * rows go in with bulk_create, or with COPY on PostgreSQL when `use_copy` is set; source
+    timestamps are written as they are (explicit_timestamps), in the same single INSERT.
+
+Bulk writes send no model signals, so the batch is added to the search index here.
+"""
+import csv
+import json
+import logging
+import os
+from contextlib import contextmanager
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import search
+from .models import ARTICLE_STATUS_CHOICES, COMMENT_STATUS_CHOICES, Article, Comment
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+ARTICLE_STATUSES = {value for value, _ in ARTICLE_STATUS_CHOICES}
+COMMENT_STATUSES = {value for value, _ in COMMENT_STATUS_CHOICES}
+
+
+def read_ndjson(f):
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(f):
+    """
+    Fold each `article` row and the `comment` rows after it into one record.
+    """
+    article = None
+    for row in csv.DictReader(f):
+        if row.get('type') == 'comment':
+            if article is not None:
+                article['comments'].append({
+                    'id': row.get('id'),
+                    'parent_id': row.get('parent_id') or None,
+                    'content': row.get('content'),
+                    'status': row.get('status'),
+                    'created_at': row.get('created_at'),
+                    'updated_at': row.get('updated_at'),
+                    'author': {'email': row.get('author_email')},
+                })
+            continue
+        if article is not None:
+            yield article
+        article = {
+            'title': row.get('title'),
+            'slug': row.get('slug'),
+            'content': row.get('content'),
+            'is_published': row.get('is_published'),
+            'created_at': row.get('created_at'),
+            'updated_at': row.get('updated_at'),
+            'author': {'email': row.get('author_email')},
+            'comments': [],
+        }
+    if article is not None:
+        yield article
+
+
+def read_records(f, fmt):
+    return read_csv(f) if fmt == 'csv' else read_ndjson(f)
+
+
+def parse_timestamp(value, default):
+    if not value:
+        return default
+    parsed = parse_datetime(value) if isinstance(value, str) else value
+    if parsed is None:
+        return default
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def author_email(record):
+    return ((record.get('author') or {}).get('email') or '').strip().lower()
+
+
+def comment_status(comment):
+    status = comment.get('status')
+    return status if status in COMMENT_STATUSES else 'pending'
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """
+    Keep the created_at/updated_at set on new objects instead of letting bulk_create stamp
+    the current time. auto_now(_add) is off for the whole process meanwhile, so this is for
+    commands, not request handlers.
+    """
+    fields = [field for model in models for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def load_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    return None
+
+
+def save_checkpoint(path, state):
+    """
+    Replace the checkpoint file atomically, so a crash never leaves half of one behind.
+    """
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+class Importer:
+    """
+    Writes batches of article records. Counters accumulate in `stats`.
+    """
+    def __init__(self, batch_size=BATCH_SIZE, using='default', use_copy=False):
+        self.batch_size = batch_size
+        self.using = using
+        self.connection = connections[using]
+        self.use_copy = use_copy and self.connection.vendor == 'postgresql'
+        self.authors = {} # email -> user id, for every author seen so far
+        self.stats = {'articles': 0, 'comments': 0, 'users': 0, 'skipped': 0}
+
+    def run(self, records, position=0, on_batch=None):
+        """
+        Import `records`, skipping the first `position` (already imported by an earlier run).
+        `on_batch(position)` is called after each batch commits. Returns the final position.
+        """
+        batch = []
+        for index, record in enumerate(records):
+            if index < position:
+                continue
+            batch.append(record)
+            if len(batch) == self.batch_size:
+                position = self.import_batch(batch, position, on_batch)
+                batch = []
+        if batch:
+            position = self.import_batch(batch, position, on_batch)
+        return position
+
+    def import_batch(self, batch, position, on_batch):
+        valid = []
+        for offset, record in enumerate(batch):
+            if record.get('title') and author_email(record):
+                valid.append(record)
+            else:
+                self.stats['skipped'] += 1
+                logger.warning("Skipping record %s: a title and an author email are required", position + offset + 1)
+
+        with transaction.atomic(using=self.using):
+            self.resolve_authors(valid)
+            articles = self.insert_articles(valid)
+            self.insert_comments(valid, articles)
+            search.index_articles(articles, using=self.using)
+
+        position += len(batch)
+        if on_batch is not None:
+            on_batch(position)
+        return position
+
+    def resolve_authors(self, records):
+        """
+        Map every author email in the batch to a user id, creating the missing users.
+        """
+        User = get_user_model()
+        details = {}
+        for record in records:
+            details.setdefault(author_email(record), record.get('author') or {})
+            for comment in record.get('comments') or ():
+                if author_email(comment):
+                    details.setdefault(author_email(comment), comment.get('author') or {})
+
+        missing = [email for email in details if email not in self.authors]
+        if not missing:
+            return
+        manager = User._default_manager.db_manager(self.using)
+        by_email = manager.annotate(email_key=Lower('email')).values_list('email_key', 'id')
+        self.authors.update(by_email.filter(email_key__in=missing))
+
+        new = [email for email in missing if email not in self.authors]
+        if not new:
+            return
+        # The source username, else the email, else the email with a number
+        candidates = {email: [(details[email].get('username') or email)[:150], email[:150]] for email in new}
+        names = {name for names in candidates.values() for name in names}
+        taken = set(manager.filter(username__in=names).values_list('username', flat=True))
+        password = make_password(None) # Imported users set a password through the reset flow
+        users = []
+        for email in new:
+            username = next((name for name in candidates[email] if name not in taken), None)
+            if username is None:
+                username = self.numbered_username(manager, email[:140], taken)
+            taken.add(username)
+            users.append(User(
+                email=email,
+                username=username,
+                first_name=details[email].get('first_name') or '',
+                last_name=details[email].get('last_name') or '',
+                password=password,
+            ))
+        manager.bulk_create(users)
+        self.authors.update(by_email.filter(email_key__in=new))
+        self.stats['users'] += len(users)
+
+    def numbered_username(self, manager, base, taken):
+        """
+        `base-N` with the lowest N that is free in the table and in this batch.
+        """
+        taken.update(manager.filter(username__startswith=f'{base}-').values_list('username', flat=True))
+        number = 1
+        while f'{base}-{number}' in taken:
+            number += 1
+        return f'{base}-{number}'
+
+    def insert_articles(self, records):
+        """
+        Insert the batch's articles, keeping free source slugs and allocating the rest.
+        """
+        manager = Article.objects.db_manager(self.using)
+        now = timezone.now()
+        wanted = [record.get('slug') or None for record in records]
+        in_use = set(manager.filter(slug__in=[slug for slug in wanted if slug]).values_list('slug', flat=True))
+        kept = set()
+        for index, slug in enumerate(wanted):
+            if slug and slug not in in_use and slug not in kept:
+                kept.add(slug)
+            else:
+                wanted[index] = None
+
+        titles = [record['title'] for record, slug in zip(records, wanted) if slug is None]
+        allocated = iter(manager.allocate_slugs(titles, reserved=kept))
+
+        articles = []
+        for record, slug in zip(records, wanted):
+            created_at = parse_timestamp(record.get('created_at'), now)
+            status = record.get('is_published')
+            # Comments are bulk inserted without signals, so the article arrives already counted
+            statuses = [comment_status(comment) for comment in record.get('comments') or () if author_email(comment)]
+            articles.append(Article(
+                title=record['title'][:200],
+                slug=slug or next(allocated),
+                author_id=self.authors[author_email(record)],
+                content=record.get('content') or '',
+                is_published=status if status in ARTICLE_STATUSES else 'draft',
+                picture=record.get('picture') or '',
+                created_at=created_at,
+                updated_at=parse_timestamp(record.get('updated_at'), created_at),
+                comment_count=len(statuses),
+                approved_comment_count=statuses.count('approved'),
+                pending_comment_count=statuses.count('pending'),
+            ))
+        self.insert(Article, articles)
+        self.stats['articles'] += len(articles)
+        return articles
+
+    def insert_comments(self, records, articles):
+        """
+        Insert the batch's comments. Replies reference their parent by its id in the source,
+        so the comments go in one thread level at a time, each level with one bulk insert.
+        """
+        now = timezone.now()
+        pending = []
+        for record, article in zip(records, articles):
+            for comment in record.get('comments') or ():
+                if not author_email(comment):
+                    self.stats['skipped'] += 1
+                    continue
+                created_at = parse_timestamp(comment.get('created_at'), now)
+                source_parent = comment.get('parent_id')
+                pending.append((
+                    (article.pk, str(comment['id'])) if comment.get('id') else None,
+                    (article.pk, str(source_parent)) if source_parent else None,
+                    Comment(
+                        article_id=article.pk,
+                        author_id=self.authors[author_email(comment)],
+                        content=comment.get('content') or '',
+                        status=comment_status(comment),
+                        created_at=created_at,
+                        updated_at=parse_timestamp(comment.get('updated_at'), created_at),
+                    ),
+                ))
+
+        known = {source for source, _, _ in pending if source is not None}
+        inserted = {} # (article id, source comment id) -> new comment id
+        comments = []
+        while pending:
+            level, waiting = [], []
+            for entry in pending:
+                source, parent, comment = entry
+                if parent is None or parent not in known:
+                    level.append(entry) # Top level, or a reply whose parent is not in the file
+                elif parent in inserted:
+                    comment.parent_id = inserted[parent]
+                    level.append(entry)
+                else:
+                    waiting.append(entry)
+            if not level: # A cycle in the source; keep the rest as top-level comments
+                level, waiting = waiting, []
+            self.insert(Comment, [comment for _, _, comment in level])
+            for source, _, comment in level:
+                if source is not None:
+                    inserted[source] = comment.pk
+            comments += [comment for _, _, comment in level]
+            pending = waiting
+        self.stats['comments'] += len(comments)
+        return comments
+
+    def insert(self, model, objs):
+        if not objs:
+            return
+        if self.use_copy:
+            return self.copy(model, objs)
+
+        with explicit_timestamps(model):
+            model._default_manager.db_manager(self.using).bulk_create(objs, batch_size=self.batch_size)
+
+    def copy(self, model, objs):
+        """
+        PostgreSQL fast path: reserve ids from the table's sequence, then COPY the rows in.
+        """
+        table = model._meta.db_table
+        fields = model._meta.concrete_fields
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+                [table, model._meta.pk.column, len(objs)],
+            )
+            for obj, (pk,) in zip(objs, cursor.fetchall()):
+                obj.pk = pk
+
+            buffer = StringIO()
+            for obj in objs:
+                values = []
+                for field in fields:
+                    value = getattr(obj, field.attname)
+                    if value is None:
+                        values.append(r'\N') # Unquoted, so COPY reads it as NULL
+                    else:
+                        text = json.dumps(value) if field.get_internal_type() == 'JSONField' else field.value_to_string(obj)
+                        values.append('"' + str(text).replace('"', '""') + '"')
+                buffer.write(','.join(values) + '\n')
+            buffer.seek(0)
+
+            columns = ', '.join(self.connection.ops.quote_name(field.column) for field in fields)
+            statement = f"COPY {self.connection.ops.quote_name(table)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+            if hasattr(cursor.cursor, 'copy_expert'): # psycopg2
+                cursor.copy_expert(statement, buffer)
+            else: # psycopg 3
+                with cursor.cursor.copy(statement) as copy:
+                    copy.write(buffer.getvalue())
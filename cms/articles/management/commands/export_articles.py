@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from articles import export
+
+
+class Command(BaseCommand):
+    help = "Stream articles with their authors and comments as NDJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='output_format', choices=list(export.FORMATS), default='ndjson', help="Output format.")
+        parser.add_argument('--output', '-o', help="File to write to (default: stdout).")
+        parser.add_argument('--updated-after', help="Only articles updated at or after this ISO 8601 time.")
+        parser.add_argument('--updated-before', help="Only articles updated before this ISO 8601 time.")
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE, help="Rows fetched per database round trip.")
+
+    def handle(self, *args, **options):
+        try:
+            queryset = export.export_queryset(
+                export.parse_bound(options['updated_after']),
+                export.parse_bound(options['updated_before']),
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        rows = export.stream(options['output_format'], queryset, options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                for row in rows:
+                    f.write(row)
+        else:
+            for row in rows:
+                self.stdout.write(row, ending='')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from articles import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the article full-text search index from the articles table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help="Database alias to rebuild.")
+
+    def handle(self, *args, **options):
+        search.rebuild_index(using=options['database'])
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
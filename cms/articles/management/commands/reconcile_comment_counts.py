@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from articles.models import Article
+
+
+class Command(BaseCommand):
+    help = "Recount comments for articles whose denormalized comment counts drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Articles checked per query.")
+
+    def handle(self, *args, **options):
+        fixed = Article.objects.reconcile_comment_counts(batch_size=options['batch_size'])
+        if fixed:
+            # The corrections are QuerySet.update()s, which skip the signals that keep the response cache fresh
+            from apis import response_cache
+            response_cache.invalidate_all()
+        self.stdout.write(self.style.SUCCESS(f"Corrected comment counts on {fixed} article(s)."))
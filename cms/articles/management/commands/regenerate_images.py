@@ -0,0 +1,33 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from articles.models import Article
+from articles.tasks import process_image
+
+
+class Command(BaseCommand):
+    help = "Queue image variant rebuilds for pictures whose variants are outdated or missing on disk."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Rebuild every picture, not only broken ones.")
+
+    def needs_rebuild(self, instance, field_name):
+        picture = getattr(instance, field_name)
+        record = getattr(instance, f'{field_name}_variants') or {}
+        if record.get('source') != picture.name:
+            return True
+        storage = picture.storage
+        return any(
+            not storage.exists(variant['path']) or not storage.exists(variant['webp'])
+            for variant in record.get('variants', {}).values()
+        )
+
+    def handle(self, *args, **options):
+        queued = 0
+        targets = [(Article, 'picture'), (get_user_model(), 'profile_picture')]
+        for model, field_name in targets:
+            rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            for instance in rows.only('pk', field_name, f'{field_name}_variants').iterator(chunk_size=500):
+                if options['all'] or self.needs_rebuild(instance, field_name):
+                    process_image.enqueue(model._meta.label_lower, instance.pk, field_name)
+                    queued += 1
+        self.stdout.write(self.style.SUCCESS(f"Queued {queued} image rebuild(s)."))
@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-17 07:50
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_existing_comments(apps, schema_editor):
+    Article = apps.get_model('articles', 'Article')
+    Comment = apps.get_model('articles', 'Comment')
+
+    def counted(**filters):
+        counts = (Comment.objects.filter(article=OuterRef('pk'), **filters).order_by()
+                  .values('article').annotate(n=Count('pk')).values('n'))
+        return Coalesce(Subquery(counts), 0)
+
+    Article.objects.update(
+        comment_count=counted(),
+        approved_comment_count=counted(status='approved'),
+        pending_comment_count=counted(status='pending'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0005_article_picture_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='approved_comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='pending_comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing_comments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-17 07:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0006_article_comment_counts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, help_text='The comment this one replies to; empty for a top-level comment', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='articles.comment'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['article', 'parent', 'created_at', 'id'], name='articles_comment_thread_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-17 08:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0007_comment_parent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # New indexes first, so the columns are never left unindexed
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['is_published', 'created_at', 'id'], name='articles_article_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['author', 'is_published', 'created_at', 'id'], name='articles_article_author_idx'),
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='author',
+            field=models.ForeignKey(db_index=False, help_text='Select the author of the article', on_delete=django.db.models.deletion.CASCADE, related_name='articles', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='is_published',
+            field=models.CharField(choices=[('draft', 'Draft'), ('published', 'Published'), ('archived', 'Archived'), ('review', 'Under Review')], default='draft', help_text='The publication status of the article.', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='article',
+            field=models.ForeignKey(db_index=False, help_text='Select the article for this comment', on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='articles.article'),
+        ),
+    ]
@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import models, router, transaction, IntegrityError
+from django.db.models import Q, F, Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth import get_user_model # Import get_user_model to get the custom user model
 from django.utils.text import slugify # Import slugify helper
 import os
+import re
 
 def article_picture_upload_path(instance, filename):
     # File will be uploaded to MEDIA_ROOT/article_pictures/<slug>/<filename>
@@ -21,6 +24,115 @@ COMMENT_STATUS_CHOICES = [
     ('rejected', ('Rejected')),
 ]
 
+SLUG_MAX_LENGTH = 250
+SLUG_BATCH_SIZE = 200 # Distinct base slugs looked up per query; two OR terms each, well inside SQLite's 1000-deep expression limit
+SLUG_SAVE_ATTEMPTS = 5 # Retries when a concurrent create takes the slug first
+
+# Comment status -> Article column counting comments in that status (rejected ones only count in the total)
+COMMENT_COUNT_FIELDS = {
+    'approved': 'approved_comment_count',
+    'pending': 'pending_comment_count',
+}
+COMMENT_COUNT_COLUMNS = {'comment_count', *COMMENT_COUNT_FIELDS.values()}
+
+
+class ArticleManager(models.Manager):
+    """
+    Manager that hands out unique slugs without probing one candidate at a time.
+    """
+
+    @staticmethod
+    def slug_base(title):
+        # Leave room for a numeric suffix within the column size
+        return slugify(title)[:SLUG_MAX_LENGTH - 10].strip('-') or 'article'
+
+    def allocate_slugs(self, titles, reserved=()):
+        """
+        Return a unique slug for each title, in order.
+        All existing `base` and `base-N` slugs for a batch of titles are fetched in one
+        query, and each collision takes the next number after the highest one in use.
+        Only suffixes appended to a row's own title count, so "Weekly update 2025" does not
+        push the next "Weekly update" to -2026.
+        `reserved` slugs are about to be inserted by the caller and are never handed out.
+        """
+        bases = [self.slug_base(title) for title in titles]
+        distinct = list(dict.fromkeys(bases))
+        taken = set(reserved) # Slugs that may not be handed out
+        highest = {} # base -> highest numeric suffix in use
+
+        for start in range(0, len(distinct), SLUG_BATCH_SIZE):
+            chunk = set(distinct[start:start + SLUG_BATCH_SIZE])
+            condition = Q()
+            for base in chunk:
+                condition |= Q(slug=base) | Q(slug__startswith=f'{base}-')
+            for slug, title in self.filter(condition).values_list('slug', 'title'):
+                taken.add(slug)
+                base = self.slug_base(title)
+                suffix = re.fullmatch(rf'{re.escape(base)}-(\d+)', slug)
+                if base in chunk and suffix:
+                    highest[base] = max(highest.get(base, 0), int(suffix.group(1)))
+
+        slugs = []
+        for base in bases:
+            slug = base
+            while slug in taken:
+                highest[base] = highest.get(base, 0) + 1
+                slug = f'{base}-{highest[base]}'
+            taken.add(slug)
+            slugs.append(slug)
+        return slugs
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Fill in missing slugs for the whole batch before inserting.
+        """
+        objs = list(objs)
+        missing = [obj for obj in objs if not obj.slug]
+        for obj, slug in zip(missing, self.allocate_slugs([obj.title for obj in missing])):
+            obj.slug = slug
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def adjust_comment_counts(self, article_id, status, delta):
+        """
+        Add `delta` to an article's comment total and to the count for `status`.
+        The arithmetic happens in the UPDATE, so concurrent comments cannot lose increments.
+        """
+        changes = {'comment_count': Greatest(F('comment_count') + delta, Value(0))}
+        field = COMMENT_COUNT_FIELDS.get(status)
+        if field:
+            changes[field] = Greatest(F(field) + delta, Value(0))
+        self.filter(pk=article_id).update(**changes)
+
+    def reconcile_comment_counts(self, batch_size=1000):
+        """
+        Recount comments for every article whose stored counts drifted, one id range at a time.
+        Returns the number of articles corrected.
+        """
+        def actual(**filters):
+            counts = (Comment.objects.filter(article=OuterRef('pk'), **filters).order_by()
+                      .values('article').annotate(n=Count('pk')).values('n'))
+            return Coalesce(Subquery(counts), 0)
+
+        recounts = {'comment_count': actual()}
+        recounts.update({field: actual(status=status) for status, field in COMMENT_COUNT_FIELDS.items()})
+
+        fixed = 0
+        last = 0
+        while True:
+            ids = list(self.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return fixed
+            last = ids[-1]
+            drifted = Q()
+            for field in recounts:
+                drifted |= ~Q(**{field: F(f'actual_{field}')})
+            stale = list(self.filter(pk__in=ids)
+                         .annotate(**{f'actual_{field}': expression for field, expression in recounts.items()})
+                         .filter(drifted).values_list('pk', flat=True))
+            if stale:
+                fixed += self.filter(pk__in=stale).update(**recounts)
+
+
 class Article(models.Model):
     """
     Model representing an article with fields for title, author, content,
@@ -34,6 +146,7 @@ class Article(models.Model):
         get_user_model(),
         on_delete=models.CASCADE, # If author is deleted, delete their articles
         related_name='articles', # Allows calling user.articles.all()
+        db_index=False, # articles_article_author_idx starts with author, so a separate index is redundant
         help_text="Select the author of the article"
     )
 
@@ -54,7 +167,7 @@ class Article(models.Model):
         max_length=20,
         choices=ARTICLE_STATUS_CHOICES, # Use the defined choices
         default='draft', 
-        db_index=True, # Added a database index for faster filtering by status
+        # Indexed through the leading column of articles_article_feed_idx (see Meta.indexes)
         help_text=("The publication status of the article.")
     )
 
@@ -79,12 +192,28 @@ class Article(models.Model):
         help_text=("Optional picture for the article.") # Optional help text
     )
 
+    # Resized/WebP copies of the picture, filled in by the image job (articles/images.py)
+    picture_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    # Denormalized comment counts, kept in step by the comment signals (articles/signals.py)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    approved_comment_count = models.PositiveIntegerField(default=0, editable=False)
+    pending_comment_count = models.PositiveIntegerField(default=0, editable=False)
+
+
+    objects = ArticleManager()
 
     class Meta:
         # Add ordering for default display (e.g., newest first)
         ordering = ['-created_at']
         verbose_name = "Article"
         verbose_name_plural = "Articles"
+        indexes = [
+            # Public list and search: WHERE is_published = ? AND created_at <= ? ORDER BY created_at, id (either direction)
+            models.Index(fields=['is_published', 'created_at', 'id'], name='articles_article_feed_idx'),
+            # An author's articles: WHERE author_id = ? AND is_published = ? ORDER BY created_at, id
+            models.Index(fields=['author', 'is_published', 'created_at', 'id'], name='articles_article_author_idx'),
+        ]
 
 
     def __str__(self):
@@ -93,18 +222,30 @@ class Article(models.Model):
 
     # Add logic to auto-populate the slug
     def save(self, *args, **kwargs):
-        if not self.slug: # If slug is empty or None
-            # Generate slug from the title
-            base_slug = slugify(self.title)
-            slug = base_slug
-            counter = 1
-            # Check if the slug already exists and make it unique
-            while Article.objects.filter(slug=slug).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug # Assign the generated unique slug
-
-        super().save(*args, **kwargs) # Call the real save method
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # Never write back comment counts read earlier; comment signals update them in place
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in COMMENT_COUNT_COLUMNS
+            ]
+        if self.slug: # Slug already set, nothing to allocate
+            return super().save(*args, **kwargs) # Call the real save method
+
+        using = kwargs.get('using') or router.db_for_write(Article, instance=self)
+        manager = Article.objects.db_manager(using)
+        for attempt in range(SLUG_SAVE_ATTEMPTS):
+            # Generate a unique slug from the title in a single query
+            self.slug = manager.allocate_slugs([self.title])[0]
+            try:
+                # Savepoint so a lost race does not break the caller's transaction
+                with transaction.atomic(using=using):
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                # Only a slug taken by a concurrent create is worth retrying
+                if attempt == SLUG_SAVE_ATTEMPTS - 1 or not manager.filter(slug=self.slug).exists():
+                    self.slug = None
+                    raise
+                self.slug = None
 
     @property
     def is_published_(self):
@@ -118,6 +259,7 @@ class Comment(models.Model):
         Article,
         on_delete=models.CASCADE,
         related_name='comments', # Allows calling article.comments.all()
+        db_index=False, # articles_comment_thread_idx starts with article, so a separate index is redundant
         help_text="Select the article for this comment"
     )
     author = models.ForeignKey(
@@ -130,11 +272,33 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, help_text="Date and time when the comment was created")
     updated_at = models.DateTimeField(auto_now=True, help_text="Date and time when the comment was last updated")
     status = models.CharField(max_length=20, choices=COMMENT_STATUS_CHOICES, default='pending')
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE, # Deleting a comment removes its replies
+        null=True,
+        blank=True,
+        related_name='replies', # Allows calling comment.replies.all()
+        help_text="The comment this one replies to; empty for a top-level comment"
+    )
     
     class Meta:
         ordering = ['-created_at']
         verbose_name = "Comment"
         verbose_name_plural = "Comments"
+        indexes = [
+            # Keyset pages of a thread: WHERE article_id = ? AND parent_id IS/= ? ORDER BY created_at, id
+            models.Index(fields=['article', 'parent', 'created_at', 'id'], name='articles_comment_thread_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What the article's counts include this comment as, to spot moves on save (articles/signals.py).
+        # Only rows loaded with both columns are known; deferred fields are not fetched for it.
+        loaded = instance.__dict__
+        known = 'article_id' in loaded and 'status' in loaded
+        instance._counted_as = (loaded['article_id'], loaded['status']) if known else None
+        return instance
 
     def __str__(self):
         return f"Comment by {self.author} on {self.article}"
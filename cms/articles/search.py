@@ -0,0 +1,160 @@
+"""
+Full-text search over article title and content.
+
+SQLite keeps an FTS5 inverted index in `articles_article_fts` (rowid = article id),
+maintained row by row from the Article post_save/post_delete signals and ranked with bm25().
+PostgreSQL uses a GIN expression index on articles_article itself, so the database keeps it
+current and ranking is done with ts_rank_cd(). Other backends fall back to icontains.
+Either way the lookup goes through the index, so cost follows the number of matches
+rather than the size of the table.
+"""
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'articles_article_fts'
+PG_INDEX = 'articles_article_search_idx'
+MAX_TERMS = 10 # Keep pathological queries bounded
+
+# Title matches weigh ten times as much as content matches
+SQLITE_RANK = f'-bm25({FTS_TABLE}, 10.0, 1.0)'
+PG_VECTOR_TEMPLATE = (
+    "(setweight(to_tsvector('english', coalesce({prefix}title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce({prefix}content, '')), 'B'))"
+)
+PG_VECTOR = PG_VECTOR_TEMPLATE.format(prefix='articles_article.')
+PG_QUERY = "plainto_tsquery('english', %s)"
+
+
+def parse_terms(query):
+    """
+    Split a free-text query into lower-cased word terms.
+    Everything that is not a word character is dropped, so user input can never
+    inject operators into the FTS5 / tsquery syntax.
+    """
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+def search_articles(queryset, query):
+    """
+    Restrict an Article queryset to rows matching every term in `query`
+    and annotate it with `rank` (higher is more relevant).
+    """
+    terms = parse_terms(query)
+    if not terms:
+        return queryset.none()
+
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        match = ' '.join(f'"{term}"' for term in terms) # Implicit AND between quoted terms
+        queryset = queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = articles_article.id', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+        )
+        return queryset.annotate(rank=RawSQL(SQLITE_RANK, (), output_field=FloatField()))
+
+    if vendor == 'postgresql':
+        text = ' '.join(terms)
+        queryset = queryset.extra(where=[f'{PG_VECTOR} @@ {PG_QUERY}'], params=[text])
+        return queryset.annotate(
+            rank=RawSQL(f'ts_rank_cd({PG_VECTOR}, {PG_QUERY})', (text,), output_field=FloatField())
+        )
+
+    condition = Q()
+    for term in terms:
+        condition &= Q(title__icontains=term) | Q(content__icontains=term)
+    return queryset.filter(condition).annotate(rank=Value(0.0, output_field=FloatField()))
+
+
+def index_article(article, using='default'):
+    """
+    Insert or refresh one article in the SQLite index.
+    PostgreSQL maintains its expression index itself, so this is a no-op there.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [article.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, content) VALUES (%s, %s, %s)',
+            [article.pk, article.title, article.content],
+        )
+
+
+def index_articles(articles, using='default'):
+    """
+    Insert or refresh a batch of articles in the SQLite index with two statements,
+    for rows written with bulk_create/bulk_update, which send no signals.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or not articles:
+        return
+    with connection.cursor() as cursor:
+        pks = [article.pk for article in articles]
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({", ".join(["%s"] * len(pks))})', pks)
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, content) VALUES (%s, %s, %s)',
+            [(article.pk, article.title, article.content) for article in articles],
+        )
+
+
+def remove_article(pk, using='default'):
+    """
+    Drop one article from the SQLite index.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [pk])
+
+
+def rebuild_index(using='default'):
+    """
+    Re-index every article from scratch, e.g. after rows were written with bulk_create.
+    """
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, content) '
+                'SELECT id, title, content FROM articles_article'
+            )
+    elif connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'REINDEX INDEX {PG_INDEX}')
+
+
+def create_index(connection):
+    """
+    Create the backend's index structure and fill it with the existing articles.
+    Called from the articles migration.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                "USING fts5(title, content, tokenize='porter unicode61')"
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, content) '
+                'SELECT id, title, content FROM articles_article'
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {PG_INDEX} ON articles_article '
+                f'USING GIN ({PG_VECTOR_TEMPLATE.format(prefix="")})'
+            )
+
+
+def drop_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'DROP INDEX IF EXISTS {PG_INDEX}')
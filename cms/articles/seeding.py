@@ -0,0 +1,207 @@
+"""
+Synthetic users, articles and comments for benchmarks, generated from a seed.
+
+The same seed, sizes and skew always produce the same rows, so runs against different
+builds or databases are comparable. Everything is written in batches, one transaction each:
+
+  * every user gets the same password hash, computed once (hashing per user would dominate
+    the run);
+  * slugs are the title's slug plus the article's number, unique by construction, so a batch
+    needs one query to check them against rows that were already there;
+  * rows go in with bulk_create, or with COPY on PostgreSQL (importer.Importer.copy);
+  * comment counts are worked out before the articles are written, so nothing is recounted.
+
+Popularity follows a power law: a few authors write most articles, a few articles collect
+most comments and most articles get few or none. `skew` is the exponent; 1 is uniform.
+"""
+import math
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils.text import slugify
+
+from . import importer, search
+from .models import SLUG_MAX_LENGTH, Article, Comment
+
+BATCH_SIZE = 5000
+SKEW = 3 # With 3, the top 1% of authors write about a fifth of the articles
+SEED_PASSWORD = 'seed-password' # Every seeded user signs in with this
+DATASET_END = datetime(2025, 1, 1, tzinfo=dt_timezone.utc) # Generated content predates this, whenever it is generated
+SPAN = 2 * 365 * 24 * 3600 # Articles are spread over the two years before DATASET_END
+COMMENT_WINDOW = 30 * 24 * 3600 # Comments arrive within a month of their article
+PUBLISHED_RATIO = 0.9
+REPLY_RATIO = 0.3
+COMMENT_STATUSES = (('approved', 0.85), ('pending', 0.10), ('rejected', 0.05))
+
+WORDS = (
+    'river', 'market', 'garden', 'engine', 'harvest', 'city', 'signal', 'winter', 'bridge', 'school',
+    'forest', 'network', 'island', 'theatre', 'museum', 'kitchen', 'festival', 'railway', 'harbour', 'library',
+)
+
+
+def user_email(seed, number):
+    return f'seed{seed}-user{number}@example.invalid'
+
+
+def comment_status(rng):
+    roll = rng.random()
+    for status, share in COMMENT_STATUSES:
+        roll -= share
+        if roll < 0:
+            return status
+    return COMMENT_STATUSES[0][0]
+
+
+def popularity(rng, n, skew):
+    """
+    A function drawing indexes in range(n), low ranks far more often than high ones.
+    Ranks are scattered over the range with a stride coprime to n, so the popular rows
+    are not simply the oldest.
+    """
+    stride = 1
+    if n > 2:
+        stride = rng.randrange(1, n)
+        while math.gcd(stride, n) != 1:
+            stride = rng.randrange(1, n)
+    offset = rng.randrange(n)
+
+    def draw():
+        return (int(n * rng.random() ** skew) * stride + offset) % n
+    return draw
+
+
+class Seeder:
+    """
+    Writes a synthetic dataset. Counters accumulate in `stats`.
+    """
+    def __init__(self, seed=1, skew=SKEW, batch_size=BATCH_SIZE, using='default'):
+        self.seed = seed
+        self.skew = skew
+        self.batch_size = batch_size
+        self.using = using
+        self.writer = importer.Importer(batch_size=batch_size, using=using, use_copy=True) # COPY on PostgreSQL only
+        self.stats = {'users': 0, 'articles': 0, 'comments': 0}
+
+    def run(self, users, articles, comments, on_batch=None):
+        """
+        Write `users` users, then `articles` articles with `comments` comments between them.
+        `on_batch(stats)` is called after each batch commits.
+        """
+        rng = random.Random(self.seed)
+        user_ids = self.create_users(users, rng, on_batch)
+        if not articles:
+            return self.stats
+        # Decide up front how many comments each article gets, so its counts go in with it
+        counts = [0] * articles
+        viral = popularity(rng, articles, self.skew)
+        for _ in range(comments):
+            counts[viral()] += 1
+        author = popularity(rng, users, self.skew)
+        commenter = popularity(rng, users, self.skew)
+        for start in range(0, articles, self.batch_size):
+            numbers = range(start, min(start + self.batch_size, articles))
+            self.create_articles(numbers, counts, user_ids, author, commenter, rng)
+            if on_batch is not None:
+                on_batch(self.stats)
+        return self.stats
+
+    def create_users(self, total, rng, on_batch):
+        User = get_user_model()
+        password = make_password(SEED_PASSWORD) # One hash for everyone
+        ids = []
+        for start in range(0, total, self.batch_size):
+            users = []
+            for number in range(start, min(start + self.batch_size, total)):
+                users.append(User(
+                    username=f'seed{self.seed}-user{number}',
+                    email=user_email(self.seed, number),
+                    first_name=rng.choice(WORDS).capitalize(),
+                    password=password,
+                    is_verified=True,
+                    date_joined=DATASET_END - timedelta(seconds=SPAN + rng.randrange(SPAN)),
+                ))
+            with transaction.atomic(using=self.using):
+                self.insert(User, users)
+            if users and users[0].pk is None: # The backend cannot return ids from a bulk insert
+                found = dict(User._default_manager.db_manager(self.using)
+                             .filter(email__in=[user.email for user in users]).values_list('email', 'id'))
+                for user in users:
+                    user.pk = found[user.email]
+            ids += [user.pk for user in users]
+            self.stats['users'] += len(users)
+            if on_batch is not None:
+                on_batch(self.stats)
+        return ids
+
+    def create_articles(self, numbers, counts, user_ids, author, commenter, rng):
+        articles, threads = [], []
+        for number in numbers:
+            title = ' '.join(rng.choices(WORDS, k=rng.randint(3, 7))).capitalize()
+            created_at = DATASET_END - timedelta(seconds=rng.randrange(SPAN))
+            thread, roots = [], [] # (index of the comment replied to, comment); indexes of top-level ones
+            for _ in range(counts[number]):
+                status = comment_status(rng)
+                replies_to = rng.choice(roots) if roots and rng.random() < REPLY_RATIO else None
+                if replies_to is None:
+                    roots.append(len(thread))
+                posted = min(created_at + timedelta(seconds=rng.randrange(COMMENT_WINDOW)), DATASET_END)
+                if replies_to is not None:
+                    posted = max(posted, thread[replies_to][1].created_at) # Never before what it answers
+                thread.append((replies_to, Comment(
+                    author_id=user_ids[commenter()],
+                    content=' '.join(rng.choices(WORDS, k=rng.randint(5, 40))),
+                    status=status,
+                    created_at=posted,
+                    updated_at=posted,
+                )))
+            statuses = [comment.status for _, comment in thread]
+            articles.append(Article(
+                title=title,
+                # Words hold no digits, so the trailing number alone keeps slugs apart
+                slug=f'{slugify(title)[:SLUG_MAX_LENGTH - 10]}-{number + 1}',
+                author_id=user_ids[author()],
+                content=' '.join(rng.choices(WORDS, k=rng.randint(80, 400))),
+                is_published='published' if rng.random() < PUBLISHED_RATIO else 'draft',
+                created_at=created_at,
+                updated_at=created_at,
+                comment_count=len(statuses),
+                approved_comment_count=statuses.count('approved'),
+                pending_comment_count=statuses.count('pending'),
+            ))
+            threads.append(thread)
+
+        with transaction.atomic(using=self.using):
+            self.free_slugs(articles)
+            self.insert(Article, articles)
+            top_level, replies = [], []
+            for article, thread in zip(articles, threads):
+                for replies_to, comment in thread:
+                    comment.article_id = article.pk
+                    (top_level if replies_to is None else replies).append((replies_to, comment, thread))
+            self.insert(Comment, [comment for _, comment, _ in top_level])
+            for replies_to, comment, thread in replies:
+                comment.parent_id = thread[replies_to][1].pk
+            self.insert(Comment, [comment for _, comment, _ in replies])
+            search.index_articles(articles, using=self.using)
+        self.stats['articles'] += len(articles)
+        self.stats['comments'] += len(top_level) + len(replies)
+
+    def free_slugs(self, articles):
+        """
+        Give articles whose slug is already in the table (from an earlier seed or real
+        content) a newly allocated one.
+        """
+        manager = Article.objects.db_manager(self.using)
+        taken = set(manager.filter(slug__in=[article.slug for article in articles]).values_list('slug', flat=True))
+        clashing = [article for article in articles if article.slug in taken]
+        if not clashing:
+            return
+        reserved = {article.slug for article in articles} - taken
+        for article, slug in zip(clashing, manager.allocate_slugs([article.title for article in clashing], reserved=reserved)):
+            article.slug = slug
+
+    def insert(self, model, objs):
+        self.writer.insert(model, objs) # Keeps the generated timestamps (importer.explicit_timestamps)
@@ -1,7 +1,9 @@
 from rest_framework import serializers
 from .models import Article, Comment
 from django.contrib.auth import get_user_model
+from django.conf import settings
 from users.serializers import CustomUserSerializer, CustomUserSearchSerializer
+from .images import variant_urls
 
 
 class CommentSerializers(serializers.ModelSerializer):
@@ -9,24 +11,75 @@ class CommentSerializers(serializers.ModelSerializer):
 
     class Meta:
         model = Comment
-        fields = ('id', 'author', 'content', 'created_at', 'updated_at')
+        fields = ('id', 'author', 'content', 'parent', 'created_at', 'updated_at')
 
         # Define fields that should be read-only
         read_only_fields = ('id', 'article', 'author', 'created_at', 'updated_at')
-        pass
+
+    def validate_parent(self, parent):
+        # A reply stays in the thread it was posted to
+        if self.instance is not None and parent != self.instance.parent:
+            raise serializers.ValidationError("A comment cannot be moved to another thread.")
+        return parent
+
+class ThreadedCommentSerializer(CommentSerializers):
+    """
+    A top-level comment with the first few replies and the total number of replies.
+    The view attaches `reply_preview` and `reply_count` (see articles/threads.py).
+    """
+    replies = CommentSerializers(source='reply_preview', many=True, read_only=True)
+    reply_count = serializers.IntegerField(read_only=True)
+
+    class Meta(CommentSerializers.Meta):
+        fields = CommentSerializers.Meta.fields + ('reply_count', 'replies')
 
 class ArticlesSerializers(serializers.ModelSerializer):
     author = CustomUserSerializer(read_only = True)
-    comment = CommentSerializers(many=True,read_only=True)
+    # Present only when the view embedded comments (?comments=N); otherwise the attribute is missing and the field is skipped
+    comments = CommentSerializers(source='latest_comments', many=True, read_only=True)
+    picture_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Article
 
         # Define fields for output (GET requests)
-        fields = ('id', 'title', 'slug', 'author', 'content', 'created_at', 'updated_at', 'picture', 'is_published','comment')
+        fields = ('id', 'title', 'slug', 'author', 'content', 'created_at', 'updated_at', 'picture', 'picture_variants', 'is_published','comments',
+                  'comment_count', 'approved_comment_count', 'pending_comment_count')
 
         # Define fields that should be read-only (included in output, ignored on input)
-        read_only_fields = ('id', 'slug', 'author', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'slug', 'author', 'created_at', 'updated_at', 'comment_count', 'approved_comment_count', 'pending_comment_count')
+
+    def get_picture_variants(self, obj):
+        # Resized/WebP URLs; empty until the image job has processed the current picture
+        return variant_urls(obj, 'picture', self.context.get('request'))
+
+class ArticleBatchOperationSerializer(serializers.Serializer):
+    """
+    One operation of a batch: `create` takes `data`, `update` takes `slug` and `data`, `delete` takes `slug`.
+    """
+    op = serializers.ChoiceField(choices=['create', 'update', 'delete'])
+    slug = serializers.SlugField(required=False)
+    data = serializers.DictField(required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] != 'create' and not attrs.get('slug'):
+            raise serializers.ValidationError({'slug': f"Required for {attrs['op']}."})
+        if attrs['op'] != 'delete' and 'data' not in attrs:
+            raise serializers.ValidationError({'data': f"Required for {attrs['op']}."})
+        return attrs
+
+class ArticleBatchSerializer(serializers.Serializer):
+    """
+    Request body of the article batch endpoint.
+    """
+    atomic = serializers.BooleanField(default=True, help_text="Apply nothing unless every operation is valid.")
+    operations = ArticleBatchOperationSerializer(many=True, allow_empty=False)
+
+    def validate_operations(self, operations):
+        limit = getattr(settings, 'ARTICLE_BATCH_MAX_OPERATIONS', 500)
+        if len(operations) > limit:
+            raise serializers.ValidationError(f"At most {limit} operations per batch.")
+        return operations
 
 class ArticlesSearchSerializer(serializers.ModelSerializer):
     author = CustomUserSearchSerializer()
@@ -0,0 +1,104 @@
+import threading
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Article, Comment
+from . import search, images
+
+CustomUser = get_user_model()
+
+
+@receiver(post_save, sender=Article)
+def update_search_index(sender, instance, using, update_fields=None, **kwargs):
+    """
+    Keep the full-text index in step with the article's title and content.
+    """
+    # Saves that only touch other columns leave the indexed text unchanged
+    if update_fields is not None and not {'title', 'content'} & set(update_fields):
+        return
+    search.index_article(instance, using=using)
+
+
+@receiver(post_delete, sender=Article)
+def remove_from_search_index(sender, instance, using, **kwargs):
+    search.remove_article(instance.pk, using=using)
+
+
+@receiver(post_save, sender=Article)
+def process_article_picture(sender, instance, **kwargs):
+    """
+    Queue variant generation when the picture changed; the upload request does not wait for it.
+    """
+    if not images.is_current(instance, 'picture'):
+        images.schedule(instance, 'picture')
+
+
+@receiver(post_save, sender=CustomUser)
+def process_profile_picture(sender, instance, **kwargs):
+    if not images.is_current(instance, 'profile_picture'):
+        images.schedule(instance, 'profile_picture')
+
+
+@receiver(post_delete, sender=Article)
+def delete_article_picture_variants(sender, instance, **kwargs):
+    images.delete_variants(instance.picture.storage, instance.picture_variants)
+
+
+@receiver(post_delete, sender=CustomUser)
+def delete_profile_picture_variants(sender, instance, **kwargs):
+    images.delete_variants(instance.profile_picture.storage, instance.profile_picture_variants)
+
+
+def deleted_model(origin):
+    """
+    The model whose delete() started a cascade; `origin` is an instance or a queryset.
+    """
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, **kwargs):
+    """
+    Keep Article.comment_count and the per-status counts in step with comment writes.
+    """
+    current = (instance.article_id, instance.status)
+    counted_as = getattr(instance, '_counted_as', None) # Set by Comment.from_db
+    if created:
+        Article.objects.adjust_comment_counts(*current, 1)
+    elif counted_as is not None and counted_as != current:
+        Article.objects.adjust_comment_counts(*counted_as, -1)
+        Article.objects.adjust_comment_counts(*current, 1)
+    instance._counted_as = current
+
+
+_deleting = threading.local()
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, origin=None, **kwargs):
+    model = deleted_model(origin)
+    if model is Article:
+        return # The article and its counts are going too
+    if model is CustomUser:
+        # A user's comments (and replies to them) across many articles: tally them, and
+        # apply one adjustment per article and status once the user row is deleted
+        pending = getattr(_deleting, 'pending', None)
+        if pending is None or pending[0] is not origin:
+            pending = _deleting.pending = (origin, Counter())
+        pending[1][instance.article_id, instance.status] += 1
+        return
+    Article.objects.adjust_comment_counts(instance.article_id, instance.status, -1)
+
+
+@receiver(post_delete, sender=CustomUser)
+def count_deleted_user_comments(sender, instance, origin=None, **kwargs):
+    # Comments are deleted before the users they point at, so the tally is complete here
+    pending = getattr(_deleting, 'pending', None)
+    if pending is None or pending[0] is not origin:
+        return
+    _deleting.pending = None
+    for (article_id, status), count in pending[1].items():
+        Article.objects.adjust_comment_counts(article_id, status, -count)
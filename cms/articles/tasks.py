@@ -0,0 +1,13 @@
+from jobs.queue import task
+from . import images
+
+
+@task
+def process_image(label, pk, field_name):
+    """
+    Build the resized/WebP variants of an uploaded image (see articles/images.py).
+    """
+    instance = images.get_instance(label, pk)
+    if instance is None:
+        return # Deleted before the worker got to it
+    images.process(instance, field_name)
@@ -1,18 +1,71 @@
 from django.test import TestCase
+from django.http import HttpResponse
+from django.conf import settings
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase, APITransactionTestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from datetime import timedelta
-from .models import Article, Comment
+from .models import Article, ArticleManager, Comment
 from .serializers import ArticlesSerializers, ArticlesSearchSerializer, CommentSerializers
 from rest_framework.throttling import AnonRateThrottle, UserRateThrottle, ScopedRateThrottle
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from unittest import mock
+from apis.pagination import KeysetPagination
+from apis.query_budget import query_budget, QueryBudgetExceeded
+from apis import authentication, loadtest, metrics, pooling, query_plans, replicas, response_cache, shared_state, throttling
+from django.test import override_settings
+from articles import search, export, importer, seeding
+from users import tokens
+from users.models import RefreshToken
+from jobs.models import Job
+from jobs.queue import claim, execute
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+from io import BytesIO, StringIO
+import tempfile
+import random
+import csv
+import json
+import os
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.urls import resolve
+from rest_framework.authtoken.models import Token
+from asgiref.sync import async_to_sync
+import asyncio
+import multiprocessing
+import sqlite3
+import subprocess
+import sys
+import time
 
 
 # Get your custom user model
 CustomUser = get_user_model()
 
+def setUpModule():
+    # Rate-limit counters, request metrics and cache version stamps live in SQLite files
+    # (apis/throttling.py, apis/metrics.py, apis/shared_state.py); give this run its own,
+    # and flush metrics only when a test asks
+    global throttle_dir, throttle_settings
+    throttle_dir = tempfile.TemporaryDirectory()
+    throttle_settings = override_settings(
+        THROTTLE_DATABASE=os.path.join(throttle_dir.name, 'throttle.sqlite3'),
+        METRICS_DATABASE=os.path.join(throttle_dir.name, 'metrics.sqlite3'),
+        SHARED_STATE_DATABASE=os.path.join(throttle_dir.name, 'shared_state.sqlite3'),
+        METRICS_FLUSH_INTERVAL=3600,
+    )
+    throttle_settings.enable()
+
+def tearDownModule():
+    metrics.reset() # Nothing left for the exit-time flush to write to the default file
+    throttle_settings.disable()
+    throttle_dir.cleanup()
+
 class ArticleTests(APITestCase):
     """
     Test for model and related API views
@@ -61,16 +114,16 @@ class ArticleTests(APITestCase):
         response = self.client.get(self.article_list_create_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         # Check that only published articles are returned
-        self.assertEqual(len(response.data), 1) # Only article_public should be returned
-        self.assertEqual(response.data[0]['title'], self.article_published.title)
+        self.assertEqual(len(response.data['results']), 1) # Only article_public should be returned
+        self.assertEqual(response.data['results'][0]['title'], self.article_published.title)
 
     def test_list_articles_authenticated(self):
         """Authenticated users should also only see public articles in the list."""
         self.client.force_authenticate(user=self.user) # Authenticate the client
         response = self.client.get(self.article_list_create_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['title'], self.article_published.title)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['title'], self.article_published.title)
         self.client.force_authenticate(user=None) # Log out the client after the test
 
     # --- Test Cases for Article Create API View (POST /articles/) ---
@@ -175,8 +228,8 @@ class CommentTests(APITestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
-        self.assertEqual(response.data[0]['content'], 'First comment!') # Check ordering
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['results'][0]['content'], 'First comment!') # Check ordering
 
     def test_create_comment_authenticated(self):
         """Authenticated users should be able to create comments on a public article."""
@@ -237,23 +290,1903 @@ class ArticleSearchTests(APITestCase):
      def test_search_by_title(self):
          response = self.client.get(self.search_url_title, {'q': 'Django'}) # Pass query param
          self.assertEqual(response.status_code, status.HTTP_200_OK)
-         self.assertEqual(len(response.data), 1) # Only public articles matching "Django"
-         self.assertEqual(response.data[0]['title'], self.article1.title)
+         self.assertEqual(len(response.data['results']), 1) # Only public articles matching "Django"
+         self.assertEqual(response.data['results'][0]['title'], self.article1.title)
 
      def test_search_by_author_email(self):
         #  url = reverse('article-search-email', kwargs={'email': 'u1@ex.com'}) # Pass email param
          response = self.client.get(self.search_url_email) 
          self.assertEqual(response.status_code, status.HTTP_200_OK)
-         self.assertEqual(len(response.data), 1) # Only public articles by user1
-         self.assertEqual(response.data[0]['title'], self.article1.title)
+         self.assertEqual(len(response.data['results']), 1) # Only public articles by user1
+         self.assertEqual(response.data['results'][0]['title'], self.article1.title)
 
      def test_search_no_results(self):
          response = self.client.get(self.search_url_title, {'q': 'NonExistent'})
          self.assertEqual(response.status_code, status.HTTP_200_OK)
-         self.assertEqual(len(response.data), 0) # Expect empty list
+         self.assertEqual(len(response.data['results']), 0) # Expect empty list
+
+class FullTextSearchTests(APITestCase):
+    """
+    Tests for the indexed full-text search behind ArticleSearchView.
+    """
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        self.user = CustomUser.objects.create_user(username='searcher',
+                                                   email='searcher@ex.com',
+                                                   password='pass')
+        self.title_hit = Article.objects.create(title='Caching strategies',
+                                                author=self.user,
+                                                content='How to keep things fast.',
+                                                is_published='published')
+        self.content_hit = Article.objects.create(title='Weekly update',
+                                                  author=self.user,
+                                                  content='We talked about caching and queues.',
+                                                  is_published='published')
+        self.draft = Article.objects.create(title='Caching drafts',
+                                            author=self.user,
+                                            content='Not public yet.',
+                                            is_published='draft')
+        self.search_url = reverse('article-search')
+
+    def search(self, q, **params):
+        response = self.client.get(self.search_url, {'q': q, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['title'] for item in response.data['results']]
+
+    def test_matches_content_and_ranks_title_hits_first(self):
+        self.assertEqual(self.search('caching'), [self.title_hit.title, self.content_hit.title])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.search('caching queues'), [self.content_hit.title])
+        self.assertEqual(self.search('caching nonexistent'), [])
+
+    def test_operator_characters_are_ignored(self):
+        self.assertEqual(self.search('"caching" OR NEAR(*'), [])
+        self.assertEqual(self.search('caching!'), [self.title_hit.title, self.content_hit.title])
+
+    def test_index_follows_save_and_delete(self):
+        self.content_hit.title = 'Zeppelin notes'
+        self.content_hit.save()
+        self.assertEqual(self.search('zeppelin'), ['Zeppelin notes'])
+        self.content_hit.delete()
+        self.assertEqual(self.search('zeppelin'), [])
+
+    def test_ranked_results_paginate(self):
+        first = self.client.get(self.search_url, {'q': 'caching', 'page_size': 1})
+        second = self.client.get(first.data['next'])
+        self.assertEqual(first.data['results'][0]['title'], self.title_hit.title)
+        self.assertEqual(second.data['results'][0]['title'], self.content_hit.title)
+        self.assertIsNone(second.data['next'])
+
+class KeysetPaginationTests(APITestCase):
+    """
+    Tests for cursor pagination on the article list and search endpoints.
+    """
+    def setUp(self):
+        cache.clear()
+        throttling.reset() # Rate-limit counts from earlier tests
+        self.user = CustomUser.objects.create_user(username='pager',
+                                                   email='pager@ex.com',
+                                                   password='pass')
+        self.articles = [
+            Article.objects.create(title=f'Paged Article {i}',
+                                   author=self.user,
+                                   content='paging',
+                                   is_published='published')
+            for i in range(5)
+        ]
+        # Give two articles the same timestamp so the id tie-breaker is exercised
+        tie = self.articles[1].created_at
+        Article.objects.filter(pk=self.articles[2].pk).update(created_at=tie)
+        self.article_list_url = reverse('article-list-create')
+        self.search_url = reverse('article-search')
+        self.client.force_authenticate(user=self.user)
+
+    def walk(self, url, params):
+        titles, previous_links = [], []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            titles += [item['title'] for item in response.data['results']]
+            previous_links.append(response.data['previous'])
+            if response.data['next'] is None:
+                return titles, previous_links, response
+            response = self.client.get(response.data['next'])
+
+    def test_list_walks_every_article_once_in_ascending_order(self):
+        titles, previous_links, _ = self.walk(self.article_list_url, {'page_size': 2})
+        self.assertEqual(titles, [a.title for a in self.articles])
+        self.assertIsNone(previous_links[0])
+        self.assertTrue(all(previous_links[1:]))
+
+    def test_search_walks_in_descending_order(self):
+        titles, _, _ = self.walk(self.search_url, {'page_size': 2})
+        self.assertEqual(titles, [a.title for a in reversed(self.articles)])
+
+    def test_previous_link_returns_the_prior_page(self):
+        first = self.client.get(self.article_list_url, {'page_size': 2})
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(KeysetPagination, 'max_page_size', 3):
+            response = self.client.get(self.article_list_url, {'page_size': 10000})
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.article_list_url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_no_offset_or_count_queries(self):
+        first = self.client.get(self.article_list_url, {'page_size': 2})
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(first.data['next'])
+        sql = ' '.join(q['sql'].upper() for q in ctx.captured_queries)
+        self.assertNotIn('OFFSET', sql)
+        self.assertNotIn('COUNT(', sql)
+
+def invalidate_in_another_process(slug):
+    # Runs in a forked process, as the worker that handled the write would
+    response_cache.invalidate_article(slug)
+
+class ResponseCacheTests(APITestCase):
+    """
+    Tests for the article list/detail response cache and its invalidation.
+    """
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        self.author = CustomUser.objects.create_user(username='cached',
+                                                     email='cached@ex.com',
+                                                     password='pass')
+        self.reader = CustomUser.objects.create_user(username='reader',
+                                                     email='reader@ex.com',
+                                                     password='pass')
+        self.staff = CustomUser.objects.create_user(username='cachestaff',
+                                                    email='cachestaff@ex.com',
+                                                    password='pass',
+                                                    is_staff=True)
+        self.published = Article.objects.create(title='Cached article',
+                                                author=self.author,
+                                                content='cached',
+                                                is_published='published')
+        self.draft = Article.objects.create(title='Cached draft',
+                                            author=self.author,
+                                            content='secret',
+                                            is_published='draft')
+        self.list_url = reverse('article-list-create')
+        self.detail_url = lambda slug: reverse('article-detail-update-delete', kwargs={'slug': slug})
+
+    def get(self, url, user=None, **params):
+        self.client.force_authenticate(user=user)
+        response = self.client.get(url, params)
+        self.client.force_authenticate(user=None)
+        return response
+
+    def test_repeated_list_is_a_hit(self):
+        self.assertEqual(self.get(self.list_url)['X-Cache'], 'MISS')
+        response = self.get(self.list_url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['results'][0]['title'], self.published.title)
+        # Query parameter order is normalized away
+        self.assertEqual(self.client.get(self.list_url + '?a=1&b=2')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(self.list_url + '?b=2&a=1')['X-Cache'], 'HIT')
+
+    def test_article_change_invalidates_list_and_detail(self):
+        self.get(self.list_url)
+        self.get(self.detail_url(self.published.slug))
+        self.published.title = 'Renamed article'
+        self.published.save()
+
+        response = self.get(self.list_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['title'], 'Renamed article')
+        response = self.get(self.detail_url(self.published.slug))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['title'], 'Renamed article')
+
+    def test_cached_draft_never_leaks(self):
+        url = self.detail_url(self.draft.slug)
+        self.assertEqual(self.get(url, user=self.author).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get(url, user=self.author)['X-Cache'], 'HIT')
+        self.assertEqual(self.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.get(url, user=self.reader).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.get(url, user=self.staff).status_code, status.HTTP_200_OK)
+
+    def test_publishing_a_draft_makes_it_public(self):
+        url = self.detail_url(self.draft.slug)
+        self.get(url, user=self.author)
+        self.draft.is_published = 'published'
+        self.draft.save()
+        self.assertEqual(self.get(url).status_code, status.HTTP_200_OK)
+        self.draft.is_published = 'draft'
+        self.draft.save()
+        self.assertEqual(self.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_comment_change_invalidates_article(self):
+        url = self.detail_url(self.published.slug)
+        self.get(url)
+        Comment.objects.create(article=self.published, author=self.reader, content='hi')
+        self.assertEqual(self.get(url)['X-Cache'], 'MISS')
+
+    def test_author_profile_change_invalidates(self):
+        url = self.detail_url(self.published.slug)
+        self.get(url)
+        self.get(self.list_url)
+        self.author.first_name = 'Ada'
+        self.author.save()
+        self.assertEqual(self.get(url).data['author']['first_name'], 'Ada')
+        self.assertEqual(self.get(self.list_url).data['results'][0]['author']['first_name'], 'Ada')
+
+        # A login stamp does not touch anything articles show
+        self.author.last_login = timezone.now()
+        self.author.save(update_fields=['last_login'])
+        self.assertEqual(self.get(url)['X-Cache'], 'HIT')
+
+    def test_commenter_profile_change_invalidates_embedded_comments(self):
+        Comment.objects.create(article=self.published, author=self.reader, content='hi', status='approved')
+        url = self.detail_url(self.published.slug)
+        self.get(url, comments=5)
+        self.assertEqual(self.get(url, comments=5)['X-Cache'], 'HIT')
+        self.get(url)
+        self.reader.username = 'renamed'
+        self.reader.save()
+
+        response = self.get(url, comments=5)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['comments'][0]['author']['username'], 'renamed')
+        # Entries without comments only depend on the article's own author
+        self.assertEqual(self.get(url)['X-Cache'], 'HIT')
+
+    def test_invalidation_reaches_every_worker_process(self):
+        url = self.detail_url(self.published.slug)
+        self.get(url)
+        self.get(self.list_url)
+        self.assertEqual(self.get(url)['X-Cache'], 'HIT')
+        # The entries sit in this process's LocMemCache; the stamps they are keyed on do not
+        worker = multiprocessing.get_context('fork').Process(target=invalidate_in_another_process, args=(self.published.slug,))
+        worker.start()
+        worker.join(60)
+        self.assertEqual(worker.exitcode, 0)
+        self.assertEqual(self.get(url)['X-Cache'], 'MISS')
+        self.assertEqual(self.get(self.list_url)['X-Cache'], 'MISS')
+
+    def test_check_reports_an_unusable_stamp_file(self):
+        self.assertEqual(shared_state.check_shared_state(None), [])
+        with self.settings(SHARED_STATE_DATABASE=os.path.join(tempfile.gettempdir(), 'missing-dir', 'state.sqlite3')):
+            self.assertEqual([error.id for error in shared_state.check_shared_state(None)], ['apis.E001'])
+
+    def test_stats_endpoint(self):
+        self.get(self.list_url)
+        self.get(self.list_url)
+        url = reverse('cache-stats')
+        self.assertEqual(self.get(url, user=self.reader).status_code, status.HTTP_403_FORBIDDEN)
+        response = self.get(url, user=self.staff)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['hits'], 1)
+        self.assertEqual(response.data['misses'], 1)
+        self.assertEqual(response.data['hit_ratio'], 0.5)
+
+@override_settings(QUERY_BUDGET_ENFORCE=True)
+class QueryBudgetTests(APITestCase):
+    """
+    Every list and detail endpoint must stay within its declared query budget
+    no matter how many rows it serves.
+    """
+    sizes = (10, 100, 1000)
+
+    def seed(self, size):
+        """
+        Create `size` authors, each with one published article, and `size` comments
+        from distinct authors on the first article.
+        """
+        tag = f's{size}'
+        authors = CustomUser.objects.bulk_create([
+            CustomUser(username=f'{tag}-author{i}', email=f'{tag}-author{i}@ex.com')
+            for i in range(size)
+        ])
+        articles = Article.objects.bulk_create([
+            Article(title=f'Budget {tag} {i}', slug=f'budget-{tag}-{i}', author=author,
+                    content='budget', is_published='published')
+            for i, author in enumerate(authors)
+        ])
+        comments = Comment.objects.bulk_create([
+            Comment(article=articles[0], author=author, content='budget comment')
+            for author in authors
+        ])
+        search.rebuild_index()
+        return authors, articles, comments
+
+    def test_endpoints_stay_within_budget(self):
+        for size in self.sizes:
+            with self.subTest(size=size):
+                cache.clear()
+                throttling.reset()
+                authors, articles, comments = self.seed(size)
+                slug = articles[0].slug
+                urls = [
+                    reverse('article-list-create') + '?page_size=100',
+                    reverse('article-list-create') + '?page_size=100&comments=5',
+                    reverse('article-detail-update-delete', kwargs={'slug': slug}),
+                    reverse('article-detail-update-delete', kwargs={'slug': slug}) + '?comments=5',
+                    reverse('comment-list-create', kwargs={'slug': slug}),
+                    reverse('comment-detail-update-delete', kwargs={'slug': slug, 'pk': comments[0].pk}),
+                    reverse('article-search') + '?q=budget&page_size=100',
+                    reverse('article-search-email', kwargs={'email': authors[0].email}),
+                ]
+                for url in urls:
+                    # Over-budget handlers raise QueryBudgetExceeded out of the test client
+                    response = self.client.get(url)
+                    self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+
+    def test_budget_is_enforced(self):
+        class Greedy:
+            @query_budget(1)
+            def get(self, request):
+                return list(CustomUser.objects.all()) + list(Article.objects.all())
+
+        with self.assertRaises(QueryBudgetExceeded):
+            Greedy().get(None)
+
+class QueryPlanTests(APITestCase):
+    """
+    The hot read queries must be answered from an index, never a full scan or a sort
+    (apis/query_plans.py).
+    """
+    tables = ('articles_article', 'articles_comment')
+
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        self.author = CustomUser.objects.create_user(username='planner', email='planner@ex.com', password='pass')
+        other = CustomUser.objects.create_user(username='other', email='other@ex.com', password='pass')
+        articles = Article.objects.bulk_create([
+            Article(title=f'Plan {i}', slug=f'plan-{i}', author=self.author if i % 2 else other,
+                    content='plan', is_published='published' if i % 3 else 'draft')
+            for i in range(30)
+        ])
+        self.article = articles[1]
+        comments = Comment.objects.bulk_create([
+            Comment(article=self.article, author=other, content=f'comment {i}', status='approved') for i in range(5)
+        ])
+        self.comment = comments[0]
+        Comment.objects.create(article=self.article, author=other, content='reply', status='approved', parent=self.comment)
+
+    def test_hot_queries_use_indexes(self):
+        first_page = self.client.get(reverse('article-list-create') + '?page_size=5')
+        urls = [
+            reverse('article-list-create') + '?page_size=5',
+            first_page.data['next'],
+            reverse('article-search'),
+            reverse('article-search-email', kwargs={'email': self.author.email}),
+            reverse('comment-list-create', kwargs={'slug': self.article.slug}),
+            reverse('comment-replies', kwargs={'slug': self.article.slug, 'pk': self.comment.pk}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                # Reply previews sort at most a page of threads' replies, by design
+                with query_plans.expect_indexed(self.tables, allow=['ROW_NUMBER() OVER']):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_full_scans_and_sorts_are_reported(self):
+        with self.assertRaises(query_plans.QueryPlanError) as raised:
+            with query_plans.expect_indexed(self.tables):
+                list(Article.objects.filter(content='plan'))
+        self.assertIn('articles_article', str(raised.exception))
+        with self.assertRaises(query_plans.QueryPlanError):
+            with query_plans.expect_indexed(self.tables):
+                list(Article.objects.filter(is_published='published').order_by('title'))
+        with query_plans.expect_indexed(self.tables):
+            list(Article.objects.filter(is_published='published').order_by('-created_at', '-id')[:5])
+            list(CustomUser.objects.filter(bio='x')) # Not a watched table
+
+def pin_in_another_process(authorization):
+    # Runs in a forked process, as the worker that served the write would
+    request = APIRequestFactory().post('/', HTTP_AUTHORIZATION=authorization)
+    replicas.pin(request, HttpResponse())
+
+class ReplicaRoutingTests(APITransactionTestCase):
+    """
+    Tests for read-replica routing with read-your-writes stickiness (apis/replicas.py).
+    A second SQLite file stands in for the replica; it only has what copy_sqlite put there.
+    """
+    databases = '__all__' # Includes the replica, which only exists while this class runs
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        configured = connections.configure_settings({
+            'default': dict(connections.settings['default']),
+            'replica1': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(cls.directory.name, 'replica.sqlite3')},
+        })
+        connections.settings['replica1'] = configured['replica1']
+        cls.replica_settings = override_settings(DATABASE_REPLICAS=['replica1'])
+        cls.replica_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.replica_settings.disable()
+        connections['replica1'].close()
+        del connections.settings['replica1']
+        cls.directory.cleanup()
+
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        shared_state.reset() # Pins from earlier tests
+        self.user = CustomUser.objects.create_user(username='writer', email='writer@ex.com', password='pass')
+        self.token = Token.objects.create(user=self.user)
+        self.synced = Article.objects.create(title='Synced', author=self.user, content='old', is_published='published')
+        replicas.copy_sqlite('default', 'replica1')
+        # Only on the primary from here on, like rows a lagging replica has not received yet
+        self.unsynced = Article.objects.create(title='Unsynced', author=self.user, content='new', is_published='published')
+
+    def detail(self, client, article):
+        return client.get(reverse('article-detail-update-delete', kwargs={'slug': article.slug})).status_code
+
+    def create(self, client, title):
+        response = client.post(reverse('article-list-create'), {'title': title, 'content': 'body', 'is_published': 'published'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Article.objects.get(slug=response.data['slug'])
+
+    def test_reads_come_from_the_replica(self):
+        self.assertEqual(self.detail(self.client, self.synced), status.HTTP_200_OK)
+        self.assertEqual(self.detail(self.client, self.unsynced), status.HTTP_404_NOT_FOUND)
+
+    def test_writers_read_their_writes_from_the_primary(self):
+        writer = APIClient()
+        writer.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        created = self.create(writer, 'Fresh')
+        self.assertIn(replicas.PIN_COOKIE, writer.cookies)
+        self.assertEqual(self.detail(writer, created), status.HTTP_200_OK)
+        self.assertEqual(self.detail(writer, self.unsynced), status.HTTP_200_OK)
+
+        # A client that drops cookies is still pinned through its Authorization header
+        cookieless = APIClient()
+        cookieless.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(self.detail(cookieless, created), status.HTTP_200_OK)
+        # Other clients keep reading the replica
+        self.assertEqual(self.detail(APIClient(), created), status.HTTP_404_NOT_FOUND)
+
+    def test_pins_reach_every_worker_process(self):
+        header = f'Token {self.token.key}'
+        worker = multiprocessing.get_context('fork').Process(target=pin_in_another_process, args=(header,))
+        worker.start()
+        worker.join(60)
+        self.assertEqual(worker.exitcode, 0)
+        cookieless = APIClient()
+        cookieless.credentials(HTTP_AUTHORIZATION=header)
+        self.assertEqual(self.detail(cookieless, self.unsynced), status.HTTP_200_OK)
+
+    def test_lagging_replica_does_not_poison_the_caches(self):
+        self.synced.content = 'edited' # The replica still has 'old'
+        self.synced.save()
+        url = reverse('article-detail-update-delete', kwargs={'slug': self.synced.slug})
+        reader = APIClient()
+        response = reader.get(url)
+        self.assertEqual((response['X-Cache'], response.data['content']), ('MISS', 'edited'))
+        listed = reader.get(reverse('article-list-create'))
+        self.assertIn(self.unsynced.slug, [article['slug'] for article in listed.data['results']])
+
+        writer = APIClient()
+        writer.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.create(writer, 'Pinned') # The writer reads the primary now, but hits the cache first
+        response = writer.get(url)
+        self.assertEqual((response['X-Cache'], response.data['content']), ('HIT', 'edited'))
+
+    def test_revoked_credentials_are_not_read_from_the_replica(self):
+        key = self.token.key
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        self.token.delete() # Still on the replica
+        self.assertEqual(self.detail(client, self.synced), status.HTTP_401_UNAUTHORIZED)
+        self.assertIsNone(authentication.cached_token(key))
+
+    def test_pin_expires(self):
+        writer = APIClient()
+        writer.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        with self.settings(REPLICA_PIN_SECONDS=0):
+            created = self.create(writer, 'Fleeting')
+        self.assertEqual(self.detail(writer, created), status.HTTP_404_NOT_FOUND)
+
+    def test_transactions_and_locks_use_the_primary(self):
+        pending = CustomUser.objects.create_user(username='pending', email='pending@ex.com', password='pass')
+        pending.generate_verification_token()
+        url = reverse('verify-email', kwargs={'user_id': pending.pk, 'token': pending.email_verification_token})
+        # The user is not on the replica; the view's select_for_update finds it on the primary
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        pending.refresh_from_db()
+        self.assertTrue(pending.is_verified)
+
+        router = replicas.ReplicaRouter()
+        state = replicas.RoutingState('replica1')
+        token = replicas._state.set(state)
+        try:
+            self.assertEqual(router.db_for_read(Article), 'replica1')
+            with transaction.atomic():
+                self.assertIsNone(router.db_for_read(Article))
+            self.assertEqual(Article.objects.select_for_update().db, 'default')
+            self.assertTrue(state.wrote)
+            self.assertIsNone(router.db_for_read(Article)) # Read-your-writes within the request
+        finally:
+            replicas._state.reset(token)
+        self.assertIsNone(router.db_for_read(Article)) # Outside requests
+
+    def test_async_reads_come_from_the_replica(self):
+        with self.settings(ROOT_URLCONF='apis.async_urls'):
+            url = reverse('article-detail-update-delete', kwargs={'slug': self.unsynced.slug})
+            self.assertEqual(async_to_sync(self.async_client.get)(url).status_code, status.HTTP_404_NOT_FOUND)
+            url = reverse('article-detail-update-delete', kwargs={'slug': self.synced.slug})
+            self.assertEqual(async_to_sync(self.async_client.get)(url).status_code, status.HTTP_200_OK)
+
+class SlugAllocationTests(TestCase):
+    """
+    Tests for unique slug allocation in Article.save and bulk_create.
+    """
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='slugger',
+                                                   email='slugger@ex.com',
+                                                   password='pass')
+
+    def create(self, title='Weekly update'):
+        return Article.objects.create(title=title, author=self.user, content='...')
+
+    def test_collisions_get_increasing_suffixes(self):
+        slugs = [self.create().slug for _ in range(3)]
+        self.assertEqual(slugs, ['weekly-update', 'weekly-update-1', 'weekly-update-2'])
+        # Unrelated slugs sharing the prefix are not mistaken for suffixes
+        self.assertEqual(self.create('Weekly update notes').slug, 'weekly-update-notes')
+        self.assertEqual(self.create().slug, 'weekly-update-3')
+
+    def test_titles_ending_in_a_number(self):
+        self.assertEqual(self.create('Weekly update 2025').slug, 'weekly-update-2025')
+        self.assertEqual(self.create().slug, 'weekly-update')
+        # The year is part of the other title, not a suffix this allocator appended
+        self.assertEqual(self.create().slug, 'weekly-update-1')
+        self.assertEqual(self.create('Weekly update 2025').slug, 'weekly-update-2025-1')
+
+    def test_allocates_more_titles_than_one_lookup_holds(self):
+        # A single lookup for 500 distinct titles was deeper than SQLite's expression limit
+        self.create('Batch title 0')
+        titles = [f'Batch title {number}' for number in range(501)]
+        slugs = Article.objects.allocate_slugs(titles)
+        self.assertEqual(len(set(slugs)), len(titles))
+        self.assertEqual(slugs[:2], ['batch-title-0-1', 'batch-title-1'])
+
+    def test_query_count_does_not_grow_with_collisions(self):
+        self.create()
+        with CaptureQueriesContext(connection) as few:
+            self.create()
+        for _ in range(20):
+            self.create()
+        with CaptureQueriesContext(connection) as many:
+            self.create()
+        self.assertEqual(len(few), len(many))
+
+    def test_retries_when_slug_is_taken_concurrently(self):
+        self.create()
+        # The first allocation loses the race to the existing row, the second wins
+        with mock.patch.object(ArticleManager, 'allocate_slugs', side_effect=[['weekly-update'], ['weekly-update-9']]):
+            article = self.create()
+        self.assertEqual(article.slug, 'weekly-update-9')
+
+    def test_bulk_create_allocates_in_batch(self):
+        self.create()
+        with CaptureQueriesContext(connection) as ctx:
+            articles = Article.objects.bulk_create([
+                Article(title=title, author=self.user, content='...')
+                for title in ['Weekly update', 'Weekly update', 'Other', 'Weekly-Update 1']
+            ])
+        self.assertEqual([a.slug for a in articles],
+                         ['weekly-update-1', 'weekly-update-2', 'other', 'weekly-update-1-1'])
+        self.assertEqual(len(ctx), 2) # One slug lookup, one INSERT
+
+class ImagePipelineTests(APITestCase):
+    """
+    Tests for the background image derivative pipeline.
+    """
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings_override.enable()
+        self.user = CustomUser.objects.create_user(username='photographer',
+                                                   email='photo@ex.com',
+                                                   password='pass')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+
+    def jpeg(self, size=(2000, 1000)):
+        exif = Image.Exif()
+        exif[0x010F] = 'TestCam' # Camera make
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def run_jobs(self):
+        for job in claim('test', 100):
+            execute(job.pk, 'test')
+
+    def test_variants_are_built_in_the_background(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            article = Article.objects.create(title='Photo', author=self.user, content='.',
+                                             is_published='published', picture=self.jpeg())
+        # Saving only queued the work
+        self.assertEqual(article.picture_variants, {})
+        self.assertEqual(Job.objects.filter(task='articles.tasks.process_image').count(), 1)
+
+        self.run_jobs()
+        article.refresh_from_db()
+        record = article.picture_variants
+        self.assertEqual((record['width'], record['height']), (2000, 1000))
+        self.assertEqual(set(record['variants']), {'thumbnail', 'medium', 'large'})
+        thumb = record['variants']['thumbnail']
+        self.assertEqual((thumb['width'], thumb['height']), (150, 75))
+
+        storage = article.picture.storage
+        with storage.open(thumb['path']) as f:
+            image = Image.open(f)
+            self.assertEqual(image.format, 'JPEG')
+            self.assertNotIn(0x010F, image.getexif()) # Metadata stripped
+        with storage.open(thumb['webp']) as f:
+            self.assertEqual(Image.open(f).format, 'WEBP')
+
+        response = self.client.get(reverse('article-detail-update-delete', kwargs={'slug': article.slug}))
+        variants = response.data['picture_variants']
+        self.assertTrue(variants['medium']['url'].startswith('http://testserver/media/'))
+        self.assertTrue(variants['medium']['webp'].endswith('.webp'))
+
+    def test_upload_request_does_not_process(self):
+        self.client.force_authenticate(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('article-list-create'),
+                                        {'title': 'Upload', 'content': '.', 'picture': self.jpeg()},
+                                        format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['picture_variants'], {})
+        self.assertTrue(Job.objects.filter(status='queued').exists())
+
+    def test_reads_never_queue_rebuilds(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            article = Article.objects.create(title='Lazy', author=self.user, content='.',
+                                             is_published='published', picture=self.jpeg((300, 300)))
+        self.run_jobs()
+        Article.objects.filter(pk=article.pk).update(picture_variants={}) # Bypasses the signals
+
+        url = reverse('article-detail-update-delete', kwargs={'slug': article.slug})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(url)
+        self.assertEqual(response.data['picture_variants'], {})
+        self.assertFalse(Job.objects.filter(status='queued').exists())
+
+        call_command('regenerate_images', stdout=StringIO())
+        self.run_jobs()
+        article.refresh_from_db()
+        # Small images are never upscaled
+        self.assertEqual(article.picture_variants['variants']['large']['width'], 300)
+
+    def test_profile_picture_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.profile_picture = self.jpeg((400, 800))
+            self.user.save()
+        self.run_jobs()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.profile_picture_variants['variants']['thumbnail']['height'], 150)
+
+class ExportTests(APITestCase):
+    """
+    Tests for the streaming article export endpoint and command.
+    """
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        self.author = CustomUser.objects.create_user(username='exporter',
+                                                     email='export@ex.com',
+                                                     password='pass')
+        self.staff = CustomUser.objects.create_user(username='exportstaff',
+                                                    email='exportstaff@ex.com',
+                                                    password='pass',
+                                                    is_staff=True)
+        self.first = Article.objects.create(title='First', author=self.author, content='one', is_published='published')
+        self.second = Article.objects.create(title='Second', author=self.author, content='two', is_published='draft')
+        Comment.objects.create(article=self.first, author=self.staff, content='Nice', status='approved')
+        Comment.objects.create(article=self.first, author=self.author, content='Thanks', status='pending')
+        self.url = reverse('article-export')
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_export_requires_staff(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.force_authenticate(user=self.author)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_ndjson_export(self):
+        self.client.force_authenticate(user=self.staff)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([row['slug'] for row in rows], ['first', 'second']) # Drafts included
+        self.assertEqual(rows[0]['author']['email'], 'export@ex.com')
+        self.assertEqual([c['content'] for c in rows[0]['comments']], ['Nice', 'Thanks'])
+        self.assertEqual(rows[1]['comments'], [])
+
+    def test_csv_export(self):
+        self.client.force_authenticate(user=self.staff)
+        response = self.client.get(self.url, {'output': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(self.read(response).splitlines()))
+        self.assertEqual([(r['type'], r['article_id']) for r in rows],
+                         [('article', str(self.first.pk)), ('comment', str(self.first.pk)),
+                          ('comment', str(self.first.pk)), ('article', str(self.second.pk))])
+
+    def test_asgi_export_streams_asynchronously(self):
+        async_to_sync(self.async_client.aforce_login)(self.staff)
+        response = async_to_sync(self.async_client.get)(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.is_async) # A sync iterator would be read into a list first
+
+        async def read():
+            return b''.join([part async for part in response.streaming_content]).decode()
+        lines = [json.loads(line) for line in async_to_sync(read)().splitlines()]
+        self.assertEqual(sorted(line['slug'] for line in lines), ['first', 'second'])
+
+    def test_updated_at_filters(self):
+        Article.objects.filter(pk=self.first.pk).update(updated_at=timezone.now() - timedelta(days=2))
+        cutoff = (timezone.now() - timedelta(days=1)).isoformat()
+        self.client.force_authenticate(user=self.staff)
+
+        after = self.read(self.client.get(self.url, {'updated_after': cutoff}))
+        self.assertEqual([json.loads(line)['slug'] for line in after.splitlines()], ['second'])
+        before = self.read(self.client.get(self.url, {'updated_before': cutoff}))
+        self.assertEqual([json.loads(line)['slug'] for line in before.splitlines()], ['first'])
+
+        response = self.client.get(self.url, {'updated_after': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_comments_fetched_per_chunk(self):
+        for i in range(5):
+            article = Article.objects.create(title=f'Bulk {i}', author=self.author, content='.', is_published='published')
+            Comment.objects.create(article=article, author=self.author, content='c', status='approved')
+        with CaptureQueriesContext(connection) as ctx:
+            lines = list(export.stream('ndjson', export.export_queryset(), chunk_size=3))
+        self.assertEqual(len(lines), 7)
+        # One streamed article query, plus one comment query for each chunk of three
+        self.assertEqual(len(ctx), 4)
+
+    def test_export_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'articles.ndjson')
+            call_command('export_articles', output=path)
+            with open(path) as f:
+                self.assertEqual(len(f.read().splitlines()), 2)
+
+class ImportTests(APITestCase):
+    """
+    Tests for the bulk import command.
+    """
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        self.directory = tempfile.TemporaryDirectory()
+        self.existing = CustomUser.objects.create_user(username='existing',
+                                                       email='existing@ex.com',
+                                                       password='pass')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, records):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        return path
+
+    def record(self, i, email='Existing@ex.com', slug=None, comments=()):
+        return {
+            'title': f'Imported {i}',
+            'slug': slug,
+            'content': f'migrated body {i}',
+            'is_published': 'published',
+            'created_at': '2019-05-01T10:00:00+00:00',
+            'updated_at': '2019-06-01T10:00:00+00:00',
+            'author': {'email': email, 'username': email.split('@')[0], 'first_name': 'Old'},
+            'comments': list(comments),
+        }
+
+    def test_import_articles_comments_and_authors(self):
+        Article.objects.create(title='Taken', slug='taken', author=self.existing, content='.')
+        comment = {'content': 'Great', 'status': 'approved', 'created_at': '2019-05-02T10:00:00+00:00',
+                   'author': {'email': 'reader@ex.com'}}
+        path = self.write('content.ndjson', [
+            self.record(1, slug='keep-me', comments=[comment]),
+            self.record(2, slug='taken'),
+            self.record(3, email='new@ex.com'),
+            {'title': '', 'author': {'email': 'x@ex.com'}}, # Skipped
+        ])
+        call_command('import_content', path, stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(set(Article.objects.exclude(slug='taken').values_list('slug', flat=True)),
+                         {'keep-me', 'imported-2', 'imported-3'})
+        article = Article.objects.get(slug='keep-me')
+        self.assertEqual(article.author, self.existing) # Matched case-insensitively
+        self.assertEqual(article.created_at.year, 2019) # Source timestamps kept
+        self.assertEqual(article.updated_at.month, 6)
+        self.assertEqual(article.comments.get().author.email, 'reader@ex.com')
+        self.assertEqual((article.comment_count, article.approved_comment_count), (1, 1))
+        new_user = CustomUser.objects.get(email='new@ex.com')
+        self.assertFalse(new_user.has_usable_password())
+        self.assertEqual(new_user.username, 'new')
+        # Imported rows are searchable without a rebuild
+        self.assertEqual(list(search.search_articles(Article.objects.all(), 'migrated body 3')), [Article.objects.get(slug='imported-3')])
+
+    def test_queries_per_batch_are_constant(self):
+        def queries(n):
+            Article.objects.all().delete()
+            path = self.write(f'{n}.ndjson', [self.record(i, comments=[{'content': 'c', 'author': {'email': 'existing@ex.com'}}]) for i in range(n)])
+            run = importer.Importer(batch_size=1000)
+            with CaptureQueriesContext(connection) as ctx:
+                with open(path) as f:
+                    run.run(importer.read_records(f, 'ndjson'))
+            return len(ctx)
+        # Sizes that fit in one statement; beyond that SQLite's 999-parameter cap splits the INSERTs
+        self.assertEqual(queries(10), queries(50))
+
+    def test_rows_are_written_once_with_source_timestamps(self):
+        path = self.write('once.ndjson', [self.record(i) for i in range(3)])
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('import_content', path, stdout=open(os.devnull, 'w'))
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')])
+        self.assertEqual({a.created_at.year for a in Article.objects.all()}, {2019})
+        # auto_now is back on for everyone else
+        article = Article.objects.create(title='Fresh', author=self.existing, content='.')
+        self.assertEqual(article.created_at.year, timezone.now().year)
+
+    def test_username_fallbacks_are_checked_too(self):
+        # Both the source username and the email are already someone's username
+        CustomUser.objects.create_user(username='clash', email='one@ex.com', password='pass')
+        CustomUser.objects.create_user(username='clash@ex.com', email='two@ex.com', password='pass')
+        CustomUser.objects.create_user(username='clash@ex.com-1', email='three@ex.com', password='pass')
+        path = self.write('clash.ndjson', [self.record(1, email='clash@ex.com')])
+        call_command('import_content', path, stdout=open(os.devnull, 'w'))
+        self.assertEqual(CustomUser.objects.get(email='clash@ex.com').username, 'clash@ex.com-2')
+
+    def test_resume_from_checkpoint(self):
+        path = self.write('resume.ndjson', [self.record(i) for i in range(5)])
+        checkpoint = os.path.join(self.directory.name, 'checkpoint.json')
+
+        original = importer.Importer.import_batch
+        calls = []
+        def fail_on_third_batch(run, batch, position, on_batch):
+            calls.append(position)
+            if len(calls) == 3:
+                raise RuntimeError('interrupted')
+            return original(run, batch, position, on_batch)
+
+        with mock.patch.object(importer.Importer, 'import_batch', fail_on_third_batch):
+            with self.assertRaises(RuntimeError):
+                call_command('import_content', path, batch_size=2, checkpoint=checkpoint, stdout=open(os.devnull, 'w'))
+        self.assertEqual(Article.objects.count(), 4)
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f)['position'], 4)
+
+        call_command('import_content', path, batch_size=2, checkpoint=checkpoint, stdout=open(os.devnull, 'w'))
+        self.assertEqual(sorted(Article.objects.values_list('title', flat=True)),
+                         [f'Imported {i}' for i in range(5)])
+
+    def test_csv_export_round_trip(self):
+        article = Article.objects.create(title='Round trip', author=self.existing, content='body', is_published='published')
+        first = Comment.objects.create(article=article, author=self.existing, content='First!', status='approved')
+        Comment.objects.create(article=article, author=self.existing, content='Reply', parent=first)
+        path = os.path.join(self.directory.name, 'articles.csv')
+        call_command('export_articles', format='csv', output=path)
+        Article.objects.all().delete()
+
+        call_command('import_content', path, stdout=open(os.devnull, 'w'))
+        imported = Article.objects.get(slug='round-trip')
+        self.assertEqual(imported.content, 'body')
+        first = imported.comments.get(parent=None)
+        self.assertEqual(first.content, 'First!')
+        self.assertEqual([c.content for c in first.replies.all()], ['Reply'])
+
+class SeedContentTests(APITestCase):
+    """
+    Tests for the synthetic dataset generator (articles/seeding.py).
+    """
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+
+    def seed(self, seed=7, **options):
+        options = {'users': 20, 'articles': 60, 'comments': 300, 'batch_size': 25, **options}
+        call_command('seed_content', seed=seed, stdout=open(os.devnull, 'w'), **options)
+
+    def snapshot(self):
+        articles = list(Article.objects.order_by('slug').values_list(
+            'slug', 'title', 'content', 'author__email', 'is_published', 'created_at', 'comment_count'))
+        comments = list(Comment.objects.order_by('article__slug', 'created_at', 'content', 'author__email').values_list(
+            'article__slug', 'author__email', 'content', 'status', 'created_at', 'parent__content'))
+        return articles, comments
+
+    def test_same_seed_same_content(self):
+        self.seed(batch_size=7)
+        first = self.snapshot()
+        CustomUser.objects.all().delete()
+        self.seed() # A different batch size must not change the rows
+        self.assertEqual(self.snapshot(), first)
+        CustomUser.objects.all().delete()
+        self.seed(seed=8)
+        self.assertNotEqual(self.snapshot()[0], first[0])
+
+    def test_counts_threads_and_timestamps(self):
+        self.seed()
+        self.assertEqual((CustomUser.objects.count(), Article.objects.count(), Comment.objects.count()), (20, 60, 300))
+        self.assertEqual(Article.objects.reconcile_comment_counts(), 0) # Stored counts match the rows
+        self.assertEqual(Article.objects.values('slug').distinct().count(), 60)
+        for reply in Comment.objects.filter(parent__isnull=False).select_related('parent'):
+            self.assertIsNone(reply.parent.parent_id)
+            self.assertEqual(reply.parent.article_id, reply.article_id)
+            self.assertGreaterEqual(reply.created_at, reply.parent.created_at)
+        self.assertFalse(Article.objects.filter(created_at__gt=seeding.DATASET_END).exists())
+        self.assertFalse(Comment.objects.filter(created_at__gt=seeding.DATASET_END).exists())
+        self.assertTrue(search.search_articles(Article.objects.all(), Article.objects.first().title.split()[0]).exists())
+
+    def test_popularity_is_skewed(self):
+        draw = seeding.popularity(random.Random(1), 1000, seeding.SKEW)
+        hits = {}
+        for _ in range(20000):
+            index = draw()
+            hits[index] = hits.get(index, 0) + 1
+        top = sorted(hits.values(), reverse=True)
+        self.assertGreater(sum(top[:100]) / 20000, 0.4) # The top tenth takes a large share
+        self.assertLess(sum(top[-100:]) / 20000, 0.05) # While the bottom tenth gets a trickle
+        uniform = seeding.popularity(random.Random(1), 1000, 1)
+        self.assertGreater(len({uniform() for _ in range(20000)}), 990)
+
+    def test_seeded_users_can_log_in(self):
+        self.seed(users=3, articles=0, comments=0)
+        response = self.client.post(reverse('login'), {'email': seeding.user_email(7, 2), 'password': seeding.SEED_PASSWORD}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_reused_seed_is_refused(self):
+        self.seed(users=2, articles=1, comments=0)
+        with self.assertRaises(CommandError):
+            self.seed(users=2, articles=1, comments=0)
+        with self.assertRaises(CommandError):
+            self.seed(seed=9, users=0, articles=1, comments=0)
+
+    def test_taken_slugs_are_reallocated(self):
+        self.seed(users=2, articles=5, comments=0)
+        slugs = list(Article.objects.values_list('slug', flat=True))
+        Comment.objects.all().delete()
+        for user in CustomUser.objects.all(): # Free the seed, keep the articles
+            user.email, user.username = f'old-{user.email}', f'old-{user.username}'
+            user.save()
+        self.seed(users=2, articles=5, comments=0)
+        self.assertEqual(Article.objects.count(), 10)
+        self.assertEqual(Article.objects.values('slug').distinct().count(), 10)
+        self.assertEqual(Article.objects.filter(slug__in=slugs).count(), 5)
+
+class ArticleBatchTests(APITestCase):
+    """
+    Tests for the article batch endpoint.
+    """
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        self.user = CustomUser.objects.create_user(username='batcher',
+                                                   email='batch@ex.com',
+                                                   password='pass')
+        self.other = CustomUser.objects.create_user(username='otherbatch',
+                                                    email='otherbatch@ex.com',
+                                                    password='pass')
+        self.mine = Article.objects.create(title='Mine', author=self.user, content='old words', is_published='published')
+        self.gone = Article.objects.create(title='Gone', author=self.user, content='.', is_published='draft')
+        self.theirs = Article.objects.create(title='Theirs', author=self.other, content='.', is_published='published')
+        self.url = reverse('article-batch')
+        self.client.force_authenticate(user=self.user)
+
+    def post(self, operations, atomic=True):
+        return self.client.post(self.url, {'atomic': atomic, 'operations': operations}, format='json')
+
+    def test_mixed_batch(self):
+        response = self.post([
+            {'op': 'create', 'data': {'title': 'Mine', 'content': 'fresh', 'is_published': 'published'}},
+            {'op': 'update', 'slug': 'mine', 'data': {'content': 'rewritten words'}},
+            {'op': 'delete', 'slug': 'gone'},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['applied'])
+        self.assertEqual([r['status'] for r in response.data['results']], [201, 200, 204])
+        self.assertEqual(response.data['results'][0]['slug'], 'mine-1')
+        self.assertEqual(response.data['results'][0]['data']['author']['email'], 'batch@ex.com')
+
+        self.mine.refresh_from_db()
+        self.assertEqual(self.mine.content, 'rewritten words')
+        self.assertGreater(self.mine.updated_at, self.mine.created_at)
+        self.assertFalse(Article.objects.filter(slug='gone').exists())
+        # Bulk writes are still searchable
+        self.assertEqual(list(search.search_articles(Article.objects.all(), 'rewritten').values_list('slug', flat=True)), ['mine'])
+        self.assertEqual(list(search.search_articles(Article.objects.all(), 'fresh').values_list('slug', flat=True)), ['mine-1'])
+
+    def test_atomic_batch_applies_nothing_on_error(self):
+        response = self.post([
+            {'op': 'update', 'slug': 'mine', 'data': {'content': 'changed'}},
+            {'op': 'delete', 'slug': 'theirs'},
+            {'op': 'create', 'data': {'content': 'no title'}},
+            {'op': 'delete', 'slug': 'missing'},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(response.data['applied'])
+        self.assertEqual([r['status'] for r in response.data['results']], [424, 403, 400, 404])
+        self.mine.refresh_from_db()
+        self.assertEqual(self.mine.content, 'old words')
+        self.assertTrue(Article.objects.filter(slug='theirs').exists())
+
+    def test_best_effort_batch(self):
+        response = self.post([
+            {'op': 'update', 'slug': 'mine', 'data': {'content': 'changed'}},
+            {'op': 'update', 'slug': 'theirs', 'data': {'content': 'hijacked'}},
+            {'op': 'delete', 'slug': 'mine'}, # Already targeted
+        ], atomic=False)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['status'] for r in response.data['results']], [200, 403, 400])
+        self.mine.refresh_from_db()
+        self.assertEqual(self.mine.content, 'changed')
+        self.theirs.refresh_from_db()
+        self.assertEqual(self.theirs.content, '.')
+
+    def test_other_authors_drafts_are_not_found(self):
+        Article.objects.create(title='Secret', author=self.other, content='.', is_published='draft')
+        response = self.post([{'op': 'delete', 'slug': 'secret'}])
+        self.assertEqual(response.data['results'][0]['status'], 404)
+
+    def test_queries_do_not_grow_with_batch_size(self):
+        def queries(n):
+            for i in range(n):
+                Article.objects.create(title=f'Bulk {n} {i}', author=self.user, content='.', is_published='published')
+            operations = [{'op': 'update', 'slug': f'bulk-{n}-{i}', 'data': {'content': 'x'}} for i in range(n)]
+            operations += [{'op': 'create', 'data': {'title': f'New {n} {i}', 'content': 'y'}} for i in range(n)]
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.post(operations)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(ctx)
+        self.assertEqual(queries(3), queries(30))
+
+    def test_envelope_validation(self):
+        self.assertEqual(self.post([]).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.post([{'op': 'update', 'data': {}}]).status_code, status.HTTP_400_BAD_REQUEST)
+        with override_settings(ARTICLE_BATCH_MAX_OPERATIONS=2):
+            response = self.post([{'op': 'delete', 'slug': 'mine'}] * 3)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.post([{'op': 'delete', 'slug': 'mine'}]).status_code, status.HTTP_401_UNAUTHORIZED)
+
+class CommentCountTests(APITestCase):
+    """
+    Tests for the denormalized comment counts on Article.
+    """
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        self.user = CustomUser.objects.create_user(username='counter',
+                                                   email='count@ex.com',
+                                                   password='pass')
+        self.article = Article.objects.create(title='Counted', author=self.user, content='.', is_published='published')
+        self.other = Article.objects.create(title='Elsewhere', author=self.user, content='.', is_published='published')
+
+    def counts(self, article=None):
+        article = article or self.article
+        article.refresh_from_db()
+        return (article.comment_count, article.approved_comment_count, article.pending_comment_count)
+
+    def test_counts_follow_comment_writes(self):
+        approved = Comment.objects.create(article=self.article, author=self.user, content='a', status='approved')
+        pending = Comment.objects.create(article=self.article, author=self.user, content='b')
+        Comment.objects.create(article=self.article, author=self.user, content='c', status='rejected')
+        self.assertEqual(self.counts(), (3, 1, 1))
+
+        pending.status = 'approved'
+        pending.save()
+        self.assertEqual(self.counts(), (3, 2, 0))
+        pending.save() # No change, no adjustment
+        self.assertEqual(self.counts(), (3, 2, 0))
+
+        approved.article = self.other
+        approved.save()
+        self.assertEqual(self.counts(), (2, 1, 0))
+        self.assertEqual(self.counts(self.other), (1, 1, 0))
+
+        approved.delete()
+        self.assertEqual(self.counts(self.other), (0, 0, 0))
+
+    def test_stale_article_save_keeps_counts(self):
+        stale = Article.objects.get(pk=self.article.pk)
+        Comment.objects.create(article=self.article, author=self.user, content='a', status='approved')
+        stale.title = 'Renamed'
+        stale.save()
+        self.assertEqual(self.counts(), (1, 1, 0))
+
+    def test_counts_in_serializer_without_aggregation(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post(reverse('comment-list-create', kwargs={'slug': self.article.slug}), {'content': 'Hi'})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('article-list-create'))
+        self.assertFalse([q for q in ctx.captured_queries if 'articles_comment' in q['sql']])
+        counted = next(a for a in response.data['results'] if a['slug'] == 'counted')
+        self.assertEqual(counted['comment_count'], 1)
+        self.assertEqual(counted['pending_comment_count'], 1)
+
+    def test_reconcile_command(self):
+        Comment.objects.create(article=self.article, author=self.user, content='a', status='approved')
+        Comment.objects.create(article=self.article, author=self.user, content='b', status='pending')
+        Article.objects.filter(pk=self.article.pk).update(comment_count=7, pending_comment_count=0)
+        out = StringIO()
+        url = reverse('article-detail-update-delete', kwargs={'slug': self.article.slug})
+        self.assertEqual(self.client.get(url).data['comment_count'], 7)
+        call_command('reconcile_comment_counts', batch_size=1, stdout=out)
+        self.assertIn('on 1 article', out.getvalue())
+        self.assertEqual(self.counts(), (2, 1, 1))
+        response = self.client.get(url)
+        self.assertEqual((response['X-Cache'], response.data['comment_count']), ('MISS', 2))
+        self.assertEqual(self.counts(self.other), (0, 0, 0))
+
+    def test_deleting_an_article_skips_per_comment_work(self):
+        for i in range(20):
+            Comment.objects.create(article=self.article, author=self.user, content=str(i), status='approved')
+        with CaptureQueriesContext(connection) as ctx:
+            self.article.delete()
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')])
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('SELECT') and 'FROM "articles_article"' in q['sql']])
+
+    def test_deleting_a_user_adjusts_counts_once_per_article(self):
+        commenter = CustomUser.objects.create_user(username='leaving', email='leaving@ex.com', password='pass')
+        for i in range(10):
+            top = Comment.objects.create(article=self.article, author=commenter, content=str(i), status='approved')
+            # Another user's reply goes with the comment it answers
+            Comment.objects.create(article=self.article, author=self.user, content='re', status='pending', parent=top)
+        Comment.objects.create(article=self.other, author=commenter, content='x', status='rejected')
+        Comment.objects.create(article=self.other, author=self.user, content='stays', status='approved')
+        self.client.get(reverse('article-detail-update-delete', kwargs={'slug': self.other.slug})) # Cached
+
+        with CaptureQueriesContext(connection) as ctx:
+            commenter.delete()
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "articles_article"')]
+        self.assertEqual(len(updates), 3) # counted/approved, counted/pending, elsewhere/rejected
+        self.assertEqual(self.counts(), (0, 0, 0))
+        self.assertEqual(self.counts(self.other), (1, 1, 0))
+        response = self.client.get(reverse('article-detail-update-delete', kwargs={'slug': self.other.slug}))
+        self.assertEqual(response.data['comment_count'], 1)
+
+class ThreadedCommentTests(APITestCase):
+    """
+    Tests for threaded, keyset-paginated comment listings.
+    """
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        self.user = CustomUser.objects.create_user(username='threader',
+                                                   email='thread@ex.com',
+                                                   password='pass')
+        self.article = Article.objects.create(title='Threads', author=self.user, content='.', is_published='published')
+        self.url = reverse('comment-list-create', kwargs={'slug': self.article.slug})
+
+    def comment(self, content, parent=None, article=None):
+        return Comment.objects.create(article=article or self.article, author=self.user, content=content, parent=parent)
+
+    def test_top_level_page_with_reply_previews(self):
+        root = self.comment('root')
+        replies = [self.comment(f'reply {i}', parent=root) for i in range(5)]
+        self.comment('nested', parent=replies[0])
+        self.comment('second root')
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(ctx), 3) # Conditional GET validators, the page, then every preview at once
+        results = response.data['results']
+        self.assertEqual([c['content'] for c in results], ['root', 'second root'])
+        self.assertEqual(results[0]['reply_count'], 5)
+        self.assertEqual([r['content'] for r in results[0]['replies']], ['reply 0', 'reply 1', 'reply 2'])
+        self.assertEqual(results[0]['replies'][0]['parent'], root.pk)
+        self.assertEqual((results[1]['reply_count'], results[1]['replies']), (0, []))
+
+    def test_query_count_does_not_grow_with_page(self):
+        for i in range(20):
+            root = self.comment(f'root {i}')
+            self.comment('reply', parent=root)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, {'page_size': 20})
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(len(ctx), 3)
+
+    def test_keyset_pages(self):
+        for i in range(5):
+            self.comment(f'root {i}')
+        first = self.client.get(self.url, {'page_size': 2})
+        second = self.client.get(first.data['next'])
+        self.assertEqual([c['content'] for c in second.data['results']], ['root 2', 'root 3'])
+
+    def test_replies_endpoint(self):
+        root = self.comment('root')
+        for i in range(4):
+            self.comment(f'reply {i}', parent=root)
+        url = reverse('comment-replies', kwargs={'slug': self.article.slug, 'pk': root.pk})
+        response = self.client.get(url, {'page_size': 3})
+        self.assertEqual([c['content'] for c in response.data['results']], ['reply 0', 'reply 1', 'reply 2'])
+        self.assertIsNotNone(response.data['next'])
+
+        empty = self.comment('no replies yet')
+        url = reverse('comment-replies', kwargs={'slug': self.article.slug, 'pk': empty.pk})
+        self.assertEqual(self.client.get(url).data['results'], [])
+        url = reverse('comment-replies', kwargs={'slug': self.article.slug, 'pk': 999999})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_hidden_or_missing_article(self):
+        draft = Article.objects.create(title='Draft', author=self.user, content='.', is_published='draft')
+        self.comment('hidden', article=draft)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('comment-list-create', kwargs={'slug': draft.slug}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(len(ctx), 1)
+        response = self.client.get(reverse('comment-list-create', kwargs={'slug': 'nope'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        # A visible article without comments is just an empty page
+        self.assertEqual(self.client.get(self.url).data['results'], [])
+
+    def test_post_reply(self):
+        root = self.comment('root')
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(self.url, {'content': 'answer', 'parent': root.pk}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['parent'], root.pk)
+
+        other = Article.objects.create(title='Other', author=self.user, content='.', is_published='published')
+        response = self.client.post(reverse('comment-list-create', kwargs={'slug': other.slug}),
+                                    {'content': 'misplaced', 'parent': root.pk}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        reply = Comment.objects.get(content='answer')
+        response = self.client.patch(reverse('comment-detail-update-delete', kwargs={'slug': self.article.slug, 'pk': reply.pk}),
+                                     {'parent': None}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class EmbeddedCommentTests(APITestCase):
+    """
+    Tests for embedding recent approved comments in article responses.
+    """
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        self.user = CustomUser.objects.create_user(username='embedder',
+                                                   email='embed@ex.com',
+                                                   password='pass')
+        self.articles = [
+            Article.objects.create(title=f'Embed {i}', author=self.user, content='.', is_published='published')
+            for i in range(3)
+        ]
+        for article in self.articles:
+            for i in range(4):
+                Comment.objects.create(article=article, author=self.user, content=f'{article.slug} #{i}', status='approved')
+            Comment.objects.create(article=article, author=self.user, content='unmoderated', status='pending')
+
+    def test_list_embeds_latest_approved_comments_in_one_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('article-list-create'), {'comments': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(ctx), 2) # The page, then one windowed query for every article on it
+        for article in response.data['results']:
+            self.assertEqual([c['content'] for c in article['comments']],
+                             [f"{article['slug']} #3", f"{article['slug']} #2"])
+
+    def test_comments_are_opt_in(self):
+        response = self.client.get(reverse('article-list-create'))
+        self.assertNotIn('comments', response.data['results'][0])
+        response = self.client.get(reverse('article-list-create'), {'comments': 'lots'})
+        self.assertNotIn('comments', response.data['results'][0])
+
+    def test_embed_is_capped(self):
+        article = self.articles[0]
+        for i in range(12):
+            Comment.objects.create(article=article, author=self.user, content='more', status='approved')
+        with override_settings(ARTICLE_EMBED_COMMENTS_MAX=5):
+            response = self.client.get(reverse('article-detail-update-delete', kwargs={'slug': article.slug}), {'comments': 50})
+        self.assertEqual(len(response.data['comments']), 5)
+
+    def test_detail_embed_and_cache_key(self):
+        url = reverse('article-detail-update-delete', kwargs={'slug': self.articles[1].slug})
+        self.assertNotIn('comments', self.client.get(url).data)
+        response = self.client.get(url, {'comments': 1})
+        self.assertEqual(response['X-Cache'], 'MISS') # Cached separately from the plain payload
+        self.assertEqual([c['content'] for c in response.data['comments']], [f'{self.articles[1].slug} #3'])
+
+class ConditionalGetTests(APITestCase):
+    """
+    Tests for ETag / Last-Modified / 304 on article and comment reads.
+    """
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        self.user = CustomUser.objects.create_user(username='poller',
+                                                   email='poll@ex.com',
+                                                   password='pass')
+        self.article = Article.objects.create(title='Polled', author=self.user, content='.', is_published='published')
+        self.comment = Comment.objects.create(article=self.article, author=self.user, content='first', status='approved')
+        self.urls = {
+            'list': reverse('article-list-create'),
+            'detail': reverse('article-detail-update-delete', kwargs={'slug': self.article.slug}),
+            'comments': reverse('comment-list-create', kwargs={'slug': self.article.slug}),
+            'comment': reverse('comment-detail-update-delete', kwargs={'slug': self.article.slug, 'pk': self.comment.pk}),
+        }
+        self.client.force_authenticate(user=self.user) # Stay clear of the anonymous rate limit
+
+    def assertNotModified(self, url, etag, queries=1):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED, url)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(len(ctx), queries, url)
+
+    def test_unchanged_polls_get_304(self):
+        for name, url in self.urls.items():
+            with self.subTest(name):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertTrue(response['ETag'].startswith('"'))
+                self.assertIn('Last-Modified', response)
+                self.assertNotModified(url, response['ETag'], queries=0 if name == 'list' else 1)
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"stale"').status_code, status.HTTP_200_OK)
+
+    def test_list_cache_hit_is_query_free(self):
+        self.client.get(self.urls['list'])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.urls['list'])
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(len(ctx), 0)
+
+    def test_list_validators_roll_over_with_the_cache_timeout(self):
+        # An article scheduled for later shows up without a write, once the window moves on
+        response = self.client.get(self.urls['list'])
+        later = time.time() + response_cache.timeout()
+        with mock.patch('apis.conditional.time.time', return_value=later):
+            again = self.client.get(self.urls['list'], HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, status.HTTP_200_OK)
+
+    def test_if_modified_since(self):
+        response = self.client.get(self.urls['detail'])
+        again = self.client.get(self.urls['detail'], HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+        earlier = self.client.get(self.urls['detail'], HTTP_IF_MODIFIED_SINCE='Mon, 01 Jan 2001 00:00:00 GMT')
+        self.assertEqual(earlier.status_code, status.HTTP_200_OK)
+
+    def test_writes_change_the_etag(self):
+        etags = {name: self.client.get(url)['ETag'] for name, url in self.urls.items()}
+
+        self.comment.content = 'edited' # Leaves Article.updated_at alone
+        self.comment.save()
+        for name in ('list', 'detail', 'comments', 'comment'):
+            self.assertEqual(self.client.get(self.urls[name], HTTP_IF_NONE_MATCH=etags[name]).status_code,
+                             status.HTTP_200_OK, name)
+
+        etags = {name: self.client.get(url)['ETag'] for name, url in self.urls.items()}
+        self.user.first_name = 'Renamed'
+        self.user.save()
+        for name in ('list', 'detail', 'comments', 'comment'):
+            self.assertEqual(self.client.get(self.urls[name], HTTP_IF_NONE_MATCH=etags[name]).status_code,
+                             status.HTTP_200_OK, name)
+
+    def test_query_string_is_part_of_the_etag(self):
+        plain = self.client.get(self.urls['detail'])['ETag']
+        embedded = self.client.get(self.urls['detail'], {'comments': 3})['ETag']
+        self.assertNotEqual(plain, embedded)
+
+    def test_hidden_articles_are_not_revalidated(self):
+        etag = self.client.get(self.urls['comments'])['ETag']
+        Article.objects.filter(pk=self.article.pk).update(is_published='draft')
+        response = self.client.get(self.urls['comments'], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+@override_settings(ROOT_URLCONF='apis.async_urls', QUERY_BUDGET_ENFORCE=True)
+class AsyncReadPathTests(APITestCase):
+    """
+    Tests for the async read views served under ASGI (apis/async_views.py).
+    """
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        self.user = CustomUser.objects.create_user(username='asyncreader',
+                                                   email='async@ex.com',
+                                                   password='pass')
+        self.token = Token.objects.create(user=self.user)
+        self.auth = {'Authorization': f'Token {self.token.key}'}
+        self.article = Article.objects.create(title='Async river', author=self.user, content='flows', is_published='published')
+        self.draft = Article.objects.create(title='Async draft', author=self.user, content='flows', is_published='draft')
+        comment = Comment.objects.create(article=self.article, author=self.user, content='top', status='approved')
+        Comment.objects.create(article=self.article, author=self.user, content='reply', parent=comment, status='approved')
+        self.urls = {
+            'list': reverse('article-list-create') + '?comments=2',
+            'detail': reverse('article-detail-update-delete', kwargs={'slug': self.article.slug}),
+            'comments': reverse('comment-list-create', kwargs={'slug': self.article.slug}),
+            'search': reverse('article-search') + '?q=river',
+        }
+
+    def get(self, url, **headers):
+        return async_to_sync(self.async_client.get)(url, headers={**self.auth, **headers})
+
+    def test_routes_resolve_to_async_views(self):
+        for name, url in self.urls.items():
+            with self.subTest(name):
+                self.assertTrue(asyncio.iscoroutinefunction(resolve(url.split('?')[0]).func))
+
+    def test_same_payload_as_sync_views(self):
+        for name, url in self.urls.items():
+            with self.subTest(name):
+                cache.clear()
+                throttling.reset()
+                response = self.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                cache.clear()
+                throttling.reset()
+                with self.settings(ROOT_URLCONF='apis.urls'):
+                    expected = self.client.get(url, HTTP_AUTHORIZATION=self.auth['Authorization'])
+                self.assertEqual(response.json(), expected.json())
+
+    def test_embedded_comments_and_reply_previews(self):
+        articles = self.get(self.urls['list']).json()['results']
+        self.assertEqual([c['content'] for c in articles[0]['comments']], ['reply', 'top'])
+        comments = self.get(self.urls['comments']).json()['results']
+        self.assertEqual(comments[0]['reply_count'], 1)
+        self.assertEqual(comments[0]['replies'][0]['content'], 'reply')
+
+    def test_drafts_only_for_their_author(self):
+        url = reverse('article-detail-update-delete', kwargs={'slug': self.draft.slug})
+        self.assertEqual(self.get(url).status_code, status.HTTP_200_OK)
+        anonymous = async_to_sync(self.async_client.get)(url)
+        self.assertEqual(anonymous.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_token_is_rejected(self):
+        response = self.get(self.urls['list'], Authorization='Token nope')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_not_modified_and_cache_hit(self):
+        first = self.get(self.urls['detail'])
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(self.get(self.urls['detail'])['X-Cache'], 'HIT')
+        again = self.get(self.urls['detail'], **{'If-None-Match': first['ETag']})
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_anonymous_reads_are_throttled(self):
+        url = reverse('article-list-create')
+        codes = [async_to_sync(self.async_client.get)(url).status_code for _ in range(6)]
+        self.assertEqual(codes[-1], status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_authentication_and_throttles_run_off_the_event_loop(self):
+        checks = []
+        def allow_request(throttle, request, view):
+            try:
+                asyncio.get_running_loop()
+                checks.append('event loop')
+            except RuntimeError:
+                checks.append('thread')
+            return True
+        with mock.patch.object(UserRateThrottle, 'allow_request', allow_request), \
+             mock.patch.object(authentication.CachedTokenAuthentication, 'authenticate_credentials',
+                               autospec=True, side_effect=authentication.CachedTokenAuthentication.authenticate_credentials) as credentials:
+            response = self.get(self.urls['list'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(checks, ['thread'])
+        credentials.assert_called_once() # The configured class resolved the token
+
+    @override_settings(DATABASE_REPLICAS=['default']) # So the middleware reads and writes pins
+    def test_shared_state_is_read_off_the_event_loop(self):
+        calls = []
+        def on_thread(function):
+            def wrapper(*args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                    calls.append((function.__name__, 'event loop'))
+                except RuntimeError:
+                    calls.append((function.__name__, 'thread'))
+                return function(*args, **kwargs)
+            return wrapper
+        with mock.patch.object(shared_state, 'get_versions', on_thread(shared_state.get_versions)), \
+             mock.patch.object(shared_state, 'get', on_thread(shared_state.get)), \
+             mock.patch.object(shared_state, 'put', on_thread(shared_state.put)):
+            for name in ('list', 'list', 'detail', 'detail', 'comments'):
+                self.assertEqual(self.get(self.urls[name]).status_code, status.HTTP_200_OK)
+            response = async_to_sync(self.async_client.post)(
+                reverse('article-list-create'), {'title': 'Pinned', 'content': 'x'},
+                content_type='application/json', headers=self.auth,
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual({name for name, _ in calls}, {'get_versions', 'get', 'put'})
+        self.assertNotIn('event loop', {where for _, where in calls})
+
+    def test_writes_fall_through_to_sync_views(self):
+        response = async_to_sync(self.async_client.post)(
+            reverse('article-list-create'), {'title': 'Posted', 'content': 'x'},
+            content_type='application/json', headers=self.auth,
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Article.objects.filter(title='Posted', author=self.user).exists())
+
+    def test_reads_stay_within_budget(self):
+        # QUERY_BUDGET_ENFORCE turns an over-budget async handler into an error
+        for name, url in self.urls.items():
+            with self.subTest(name):
+                with CaptureQueriesContext(connection) as ctx:
+                    response = self.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertLessEqual(len(ctx), 4, name) # Token lookup plus at most three queries
+
+    def test_async_budget_is_enforced(self):
+        class Greedy:
+            @query_budget(1)
+            async def get(self, request):
+                return [user async for user in CustomUser.objects.all()] + [article async for article in Article.objects.all()]
+
+        with self.assertRaises(QueryBudgetExceeded):
+            async_to_sync(Greedy().get)(None)
+
+def revoke_in_another_process(key, user_id):
+    # Runs in a forked process, as the worker that deleted the token would
+    authentication.forget_token(key, user_id)
+
+class AuthCacheTests(APITestCase):
+    """
+    Tests for token and session lookups served from the auth cache (apis/authentication.py).
+    """
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        authentication.auth_cache().clear()
+        self.user = CustomUser.objects.create_user(username='cacheduser',
+                                                   email='cached@ex.com',
+                                                   password='pass')
+        self.token = Token.objects.create(user=self.user)
+        self.article = Article.objects.create(title='Cached auth', author=self.user, content='c', is_published='published')
+        self.url = reverse('article-detail-update-delete', kwargs={'slug': self.article.slug})
+
+    def auth_queries(self, ctx):
+        # Without a shared cache sessions use the db engine, which reads the session row itself
+        tables = ('authtoken_token', 'users_customuser')
+        return [q['sql'] for q in ctx.captured_queries if any(f'FROM "{table}"' in q['sql'] for table in tables)]
+
+    def test_token_lookup_cached(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.auth_queries(ctx), [])
+
+    def test_session_lookup_cached(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.auth_queries(ctx), [])
+
+    def test_session_read_costs_one_session_query(self):
+        # The db session engine's known cost when REDIS_URL is unset: one query for the session row
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as token_read:
+            self.client.get(self.url)
+        self.client.credentials()
+        self.client.force_login(self.user)
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as session_read:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        sessions = [q['sql'] for q in session_read.captured_queries if 'FROM "django_session"' in q['sql']]
+        self.assertEqual(len(sessions), 1)
+        self.assertEqual(len(session_read), len(token_read) + 1)
+
+    def test_deleted_token_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.client.get(self.url)
+        self.token.delete()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_ends_sessions(self):
+        self.client.force_login(self.user)
+        self.client.get(self.url)
+        self.user.set_password('changed')
+        self.user.save()
+        with mock.patch('apis.authentication.CachedSessionAuthentication.enforce_csrf'):
+            request = self.client.get(self.url).wsgi_request
+        self.assertFalse(request.user.is_authenticated)
+
+    def test_verified_flip_seen(self):
+        backend = authentication.CachedTokenAuthentication()
+        user, _ = backend.authenticate_credentials(self.token.key)
+        self.assertFalse(user.is_verified)
+        self.user.verify_email()
+        user, _ = backend.authenticate_credentials(self.token.key)
+        self.assertTrue(user.is_verified)
+
+    def test_last_login_save_keeps_snapshot(self):
+        authentication.CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=['last_login'])
+        self.assertIsNotNone(authentication.cached_token(self.token.key))
+
+    def test_revocation_reaches_every_worker_process(self):
+        backend = authentication.CachedTokenAuthentication()
+        backend.authenticate_credentials(self.token.key)
+        self.assertIsNotNone(authentication.cached_token(self.token.key))
+        # The snapshot sits in this process's LocMemCache; the revision stamp it was taken at does not
+        worker = multiprocessing.get_context('fork').Process(target=revoke_in_another_process, args=(self.token.key, self.user.pk))
+        worker.start()
+        worker.join(60)
+        self.assertEqual(worker.exitcode, 0)
+        self.assertIsNone(authentication.cached_token(self.token.key))
+
+    def test_sessions_are_not_cached_per_process(self):
+        self.assertEqual(settings.SESSION_ENGINE, 'django.contrib.sessions.backends.db')
+        self.assertEqual(authentication.check_shared_sessions(None), [])
+        with self.settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db'):
+            self.assertEqual([w.id for w in authentication.check_shared_sessions(None)], ['apis.W001'])
+
+    @override_settings(ROOT_URLCONF='apis.async_urls')
+    def test_async_token_lookup_cached(self):
+        get = async_to_sync(self.async_client.get)
+        url = reverse('article-detail-update-delete', kwargs={'slug': self.article.slug})
+        headers = {'Authorization': f'Token {self.token.key}'}
+        self.assertEqual(get(url, headers=headers).status_code, status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as ctx:
+            response = get(url, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.auth_queries(ctx), [])
+        self.token.delete()
+        self.assertEqual(get(url, headers=headers).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(ROOT_URLCONF='apis.async_urls')
+    def test_async_session_lookup_cached(self):
+        self.article.is_published = 'draft' # Only its author may read it
+        self.article.save()
+        async_to_sync(self.async_client.aforce_login)(self.user)
+        get = async_to_sync(self.async_client.get)
+        url = reverse('article-detail-update-delete', kwargs={'slug': self.article.slug})
+        self.assertEqual(get(url).status_code, status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as ctx:
+            response = get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.auth_queries(ctx), [])
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertEqual(get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+def hammer_metrics(path, requests):
+    with override_settings(METRICS_DATABASE=path):
+        for _ in range(requests):
+            metrics.record_throttle('anon')
+        metrics.flush()
+
+
+class MetricsTests(APITestCase):
+    """
+    Tests for the request metrics middleware and the /metrics endpoint (apis/metrics.py).
+    """
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        metrics.reset()
+        self.user = CustomUser.objects.create_user(username='metricsuser', email='metrics@ex.com', password='pass')
+        self.article = Article.objects.create(title='Measured', author=self.user, content='c', is_published='published')
+
+    def scrape(self, **headers):
+        return self.client.get(reverse('metrics'), headers=headers)
+
+    def series(self):
+        return [line for line in metrics.render().splitlines() if not line.startswith('#')]
+
+    def test_records_route_status_and_histograms(self):
+        self.client.get(reverse('article-detail-update-delete', kwargs={'slug': self.article.slug}))
+        self.client.get(reverse('article-detail-update-delete', kwargs={'slug': 'missing'}))
+        metrics.flush()
+        lines = self.series()
+        route = 'route="api/v1/articles/<slug:slug>/"'
+        self.assertIn(f'cms_http_requests_total{{method="GET",{route},status="200"}} 1', lines)
+        self.assertIn(f'cms_http_requests_total{{method="GET",{route},status="404"}} 1', lines)
+        self.assertIn(f'cms_http_request_duration_seconds_bucket{{method="GET",{route},le="+Inf"}} 2', lines)
+        self.assertIn(f'cms_http_request_duration_seconds_count{{method="GET",{route}}} 2', lines)
+        queries = [line for line in lines if line.startswith(f'cms_db_queries_sum{{method="GET",{route}}}')]
+        self.assertEqual(len(queries), 1)
+        self.assertGreater(float(queries[0].split()[-1]), 0)
+        self.assertTrue(any(line.startswith(f'cms_http_response_size_bytes_count{{method="GET",{route}}}') for line in lines))
+
+    def test_histogram_buckets_are_cumulative(self):
+        labels = metrics.label_text(route='r', method='GET')
+        for seconds in (0.001, 0.02, 0.02, 30):
+            metrics.observe('cms_http_request_duration_seconds', labels, seconds)
+        metrics.flush()
+        buckets = {line.split('le="')[1].split('"')[0]: line.split()[-1] for line in self.series()
+                   if line.startswith('cms_http_request_duration_seconds_bucket')}
+        self.assertEqual((buckets['0.005'], buckets['0.025'], buckets['10'], buckets['+Inf']), ('1', '3', '3', '4'))
+
+    def test_throttle_denials_by_scope(self):
+        for _ in range(7):
+            self.client.get(reverse('article-search'), {'q': 'Measured'})
+        metrics.flush()
+        denials = [line for line in self.series() if line.startswith('cms_throttle_denials_total')]
+        self.assertTrue(denials)
+        self.assertTrue(all('scope="' in line for line in denials))
+
+    def test_totals_add_up_across_processes(self):
+        path = metrics.database_path()
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=hammer_metrics, args=(path, 25)) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertIn('cms_throttle_denials_total{scope="anon"} 75', self.series())
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_endpoint_access(self):
+        self.assertEqual(self.scrape().status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.scrape(Authorization='Bearer wrong').status_code, status.HTTP_403_FORBIDDEN)
+        response = self.scrape(Authorization='Bearer scrape-secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('# TYPE cms_http_request_duration_seconds histogram', response.content.decode())
+        staff = CustomUser.objects.create_user(username='metricsstaff', email='staff@ex.com', password='pass', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.scrape().status_code, status.HTTP_200_OK)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_scrape_survives_a_locked_file(self):
+        self.client.get(reverse('article-list-create'))
+        with mock.patch.object(metrics.MetricStore, 'add', side_effect=sqlite3.OperationalError('database is locked')), \
+             self.assertLogs('apis.metrics', 'WARNING'):
+            response = self.scrape(Authorization='Bearer scrape-secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        metrics.flush() # The counts were kept for the next flush
+        self.assertIn('route="api/v1/articles/"', self.scrape(Authorization='Bearer scrape-secret').content.decode())
+
+    @override_settings(ROOT_URLCONF='apis.async_urls')
+    def test_async_views_recorded(self):
+        async_to_sync(self.async_client.get)(reverse('article-list-create'))
+        metrics.flush()
+        self.assertTrue(any(
+            line.startswith('cms_http_requests_total{method="GET",route="v1/articles/",status="200"}')
+            for line in self.series()
+        ))
+
+
+def warm_up_in_forked_worker():
+    # Runs in a forked process; the pools it inherited must be replaced, not reused
+    pool = mock.Mock()
+    with mock.patch('apis.pooling.pools', return_value=[('default', pool)]):
+        pooling.warm_up()
+    if pool.open.call_count != 1:
+        raise SystemExit(1)
+
+class ConnectionPoolTests(TestCase):
+    """
+    Tests for pool warmup and pool metrics (apis/pooling.py). The pools are stand-ins:
+    pooling needs PostgreSQL with psycopg 3.
+    """
+    def setUp(self):
+        metrics.reset()
+        pooling._warmed_pid = None
+
+    def fake_pool(self, stats=None, fails=False):
+        pool = mock.Mock()
+        pool.pop_stats.return_value = stats or {}
+        if fails:
+            pool.open.side_effect = RuntimeError('database is down')
+        return pool
+
+    def test_no_pools_without_postgresql(self):
+        self.assertEqual(pooling.pools(), [])
+        pooling.warm_up() # Nothing to open
+
+    def test_warm_up_opens_every_pool_and_survives_a_down_database(self):
+        up, down = self.fake_pool(), self.fake_pool(fails=True)
+        with mock.patch('apis.pooling.pools', return_value=[('default', up), ('replica1', down)]):
+            with self.assertLogs('apis.pooling', 'WARNING'):
+                pooling.warm_up()
+        up.open.assert_called_once_with(wait=True, timeout=pooling.warmup_timeout())
+        down.open.assert_called_once()
+
+    def test_forked_workers_open_their_own_pools(self):
+        pool = self.fake_pool()
+        with mock.patch('apis.pooling.pools', return_value=[('default', pool)]):
+            pooling.warm_up()
+            pooling.warm_up() # The post-fork hook in a worker that loaded the application itself
+            self.assertEqual(pool.open.call_count, 1)
+            # As under gunicorn --preload: the master warmed up, then forks
+            worker = multiprocessing.get_context('fork').Process(target=warm_up_in_forked_worker)
+            worker.start()
+            worker.join(60)
+        self.assertEqual(worker.exitcode, 0)
+
+    def test_pool_statistics_are_exported(self):
+        pool = self.fake_pool({'requests_num': 40, 'requests_queued': 3, 'requests_wait_ms': 250,
+                               'connections_lost': 1, 'returns_bad': 1, 'pool_size': 4})
+        with mock.patch('apis.pooling.pools', return_value=[('default', pool)]):
+            metrics.flush()
+            pool.pop_stats.return_value = {'requests_num': 2}
+            metrics.flush() # Counts since the previous flush are added on top
+        lines = metrics.render().splitlines()
+        self.assertIn('cms_db_pool_requests_total{database="default"} 42', lines)
+        self.assertIn('cms_db_pool_waits_total{database="default"} 3', lines)
+        self.assertIn('cms_db_pool_wait_seconds_total{database="default"} 0.25', lines)
+        self.assertIn('cms_db_pool_connections_lost_total{database="default"} 2', lines)
+        self.assertFalse(any(line.startswith('cms_db_pool_timeouts_total{') for line in lines))
+
+    def test_gunicorn_hooks_run_without_preload(self):
+        # A fresh interpreter, as gunicorn's master is without --preload: no settings module set
+        env = {name: value for name, value in os.environ.items() if name != 'DJANGO_SETTINGS_MODULE'}
+        script = ("import runpy; conf = runpy.run_path('gunicorn.conf.py'); "
+                  "conf['when_ready'](None); conf['post_worker_init'](None)")
+        result = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+class LoadTestSummaryTests(TestCase):
+    """
+    Tests for the benchmark result summary (apis/loadtest.py).
+    """
+    def test_percentiles_and_errors(self):
+        results = [(200, i / 1000) for i in range(1, 101)] + [(500, 0.5), (0, 1.0)]
+        summary = loadtest.summarize(results, elapsed=2.0)
+        self.assertEqual(summary['requests'], 102)
+        self.assertEqual(summary['errors'], 2)
+        self.assertEqual(summary['rps'], 51.0)
+        self.assertEqual(summary['p50_ms'], 51.0)
+        self.assertEqual(summary['p99_ms'], 500.0)
+
+    def test_queries_per_request_from_metrics(self):
+        metrics.reset()
+        labels = metrics.label_text(route='api/v1/articles/', method='GET')
+        for queries in (1, 3):
+            metrics.observe('cms_db_queries', labels, queries)
+        metrics.flush()
+        before = loadtest.query_totals(metrics.render())
+        for queries in (2, 2, 5):
+            metrics.observe('cms_db_queries', labels, queries)
+        metrics.flush()
+        after = loadtest.query_totals(metrics.render())
+        self.assertEqual(after['api/v1/articles/'], [13.0, 5.0])
+        self.assertEqual(loadtest.queries_per_request(before, after, 'api/v1/articles/'), 3.0)
+        self.assertIsNone(loadtest.queries_per_request(after, after, 'api/v1/articles/'))
+
+    def test_post_targets(self):
+        with mock.patch('apis.loadtest.fetch', return_value=(201, 0.01)) as fetch:
+            loadtest.run(['http://host/a/', ('http://host/b/', {'x': 1})], concurrency=1)
+        fetch.assert_has_calls([mock.call('http://host/a/', None, None), mock.call('http://host/b/', None, {'x': 1})])
 
 class UserRegistrationTests(APITestCase):
     def setUp(self):
+        throttling.reset() # Each test starts with a clean rate limit
         self.register_url = reverse("create-user")
         self.user_profile = {
             "username": "user1",
@@ -323,6 +2256,7 @@ class ThrottleTests(APITestCase):
     """
     def setUp(self):
         """Set up a user for authenticated tests."""
+        throttling.reset() # Each test starts with a clean rate limit
         self.user = CustomUser.objects.create_user(
             username='throttleuser',
             email='throttle@example.com',
@@ -472,9 +2406,66 @@ class ThrottleTests(APITestCase):
         self.assertIn('Retry-After', response.headers)
         print(f"Successfully received 429 with Retry-After: {response.headers.get('Retry-After')}")
 
+def hammer_throttle(path, key, hits, results):
+    # Runs in a forked process with its own connection to the counter file
+    store = throttling.CounterStore(path)
+    results.put(sum(store.hit(key, 10 ** 9, 50)[0] for _ in range(hits)))
+
+class ThrottleStoreTests(APITestCase):
+    """
+    Tests for the shared sliding-window rate-limit counters (apis/throttling.py).
+    """
+    start = 60 * 10 ** 7 # The first second of a 60 second window
+
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'counters.sqlite3')
+        self.store = throttling.CounterStore(self.path)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_previous_window_slides_out(self):
+        for i in range(5):
+            self.assertTrue(self.store.hit('k', 60, 5, now=self.start + i)[0])
+        self.assertFalse(self.store.hit('k', 60, 5, now=self.start + 10)[0])
+
+        # Halfway through the next window, half of the previous window still counts
+        self.assertAlmostEqual(self.store.count('k', 60, now=self.start + 90), 2.5)
+        self.assertTrue(self.store.hit('k', 60, 5, now=self.start + 90)[0])
+        self.assertTrue(self.store.hit('k', 60, 5, now=self.start + 90)[0])
+        self.assertFalse(self.store.hit('k', 60, 5, now=self.start + 90)[0])
+
+    def test_retry_after_is_when_a_slot_frees(self):
+        for i in range(5):
+            self.store.hit('k', 60, 5, now=self.start)
+        allowed, wait = self.store.hit('k', 60, 5, now=self.start + 30)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 42) # 30s to the next window, then 12s until 4 of 5 still count
+        self.assertFalse(self.store.hit('k', 60, 5, now=self.start + 30 + wait - 1)[0])
+        self.assertTrue(self.store.hit('k', 60, 5, now=self.start + 30 + wait + 0.01)[0])
+
+    def test_limit_holds_across_processes(self):
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        workers = [context.Process(target=hammer_throttle, args=(self.path, 'shared', 40, results)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        allowed = sum(results.get(timeout=60) for _ in workers)
+        for worker in workers:
+            worker.join()
+        self.assertEqual(allowed, 50) # 160 attempts from 4 processes, limit 50
+
+    def test_views_count_in_the_shared_store(self):
+        self.client.get(reverse('article-list-create'))
+        self.assertEqual(throttling.store().count('throttle_anon_127.0.0.1', 60), 1)
+
 # Test the ThrottledObtainAuthToken view
 class AuthThrottleTests(APITestCase):
     def setUp(self):
+        throttling.reset() # Each test starts with a clean rate limit
         self.user = CustomUser.objects.create_user(username='loginuser', 
                                                    email='login@ex.com', 
                                                    password='loginpass')
@@ -504,6 +2495,7 @@ class LoginTests(APITestCase):
     Tests for the login functionality.
     """
     def setUp(self):
+        throttling.reset() # Each test starts with a clean rate limit
         self.user = CustomUser.objects.create_user(username='loginuser',
                                            email='loginuser@test.com',
                                            password='loginpassword')
@@ -541,6 +2533,106 @@ class LoginTests(APITestCase):
         self.assertIn('Retry-After', response.headers)
         print(f"Successfully received 429 with Retry-After: {response.headers.get('Retry-After')}")
 
+
+class AccessTokenTests(APITestCase):
+    """
+    Tests for the signed access tokens and refresh tokens issued at login (users/tokens.py).
+    """
+    def setUp(self):
+        throttling.reset()
+        self.user = CustomUser.objects.create_user(username='pairuser',
+                                                   email='pair@test.com',
+                                                   password='pairpassword')
+        self.article = Article.objects.create(title='Pair draft', author=self.user, content='c', is_published='draft')
+        self.url = reverse('article-detail-update-delete', kwargs={'slug': self.article.slug})
+
+    def login(self):
+        response = self.client.post(reverse('login'), {'email': 'pair@test.com', 'password': 'pairpassword'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def refresh(self, token):
+        return self.client.post(reverse('token-refresh'), {'refresh': token}, format='json')
+
+    def test_login_issues_pair(self):
+        pair = self.login()
+        self.assertEqual(set(pair), {'detail', 'access', 'refresh', 'expires_in'})
+        self.assertEqual(tokens.read_access_token(pair['access']), {'uid': self.user.pk, 'ver': False, 'staff': False})
+
+    def test_read_needs_no_queries_for_auth(self):
+        access = self.login()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url) # A draft only its author may read
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([q for q in ctx.captured_queries if 'FROM "users_customuser"' in q['sql'] or 'authtoken' in q['sql']])
+
+    def test_write_rejected_for_deactivated_user(self):
+        access = self.login()['access']
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        response = self.client.patch(self.url, {'title': 'Changed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_expired_and_forged_tokens_rejected(self):
+        access = self.login()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}x')
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        with self.settings(ACCESS_TOKEN_LIFETIME=-1):
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_secret_key_rotation(self):
+        with self.settings(SECRET_KEY='old-secret'):
+            access = tokens.access_token(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        with self.settings(SECRET_KEY='new-secret', SECRET_KEY_FALLBACKS=['old-secret']):
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        with self.settings(SECRET_KEY='new-secret', SECRET_KEY_FALLBACKS=[]):
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_rotates_and_detects_reuse(self):
+        first = self.login()['refresh']
+        response = self.refresh(first)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        second = response.data['refresh']
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.refresh(first).status_code, status.HTTP_401_UNAUTHORIZED)
+        # Reusing the old token revoked the one issued in its place as well
+        self.assertEqual(self.refresh(second).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_invalidates_refresh(self):
+        refresh = self.login()['refresh']
+        self.user.set_password('newpassword')
+        self.user.save()
+        self.assertEqual(self.refresh(refresh).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_revokes_refresh(self):
+        refresh = self.login()['refresh']
+        response = self.client.post(reverse('logout'), {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.refresh(refresh).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_prune_deletes_only_expired_refresh_tokens(self):
+        first = self.login()['refresh']
+        second = self.refresh(first).data['refresh'] # `first` is now revoked but not yet expired
+        self.login()
+        RefreshToken.objects.filter(digest=tokens.digest(second)).update(expires_at=timezone.now() - timedelta(seconds=1))
+        out = StringIO()
+        call_command('prune_refresh_tokens', batch_size=1, stdout=out)
+        self.assertIn('Deleted 1 expired', out.getvalue())
+        self.assertEqual(RefreshToken.objects.count(), 2)
+        self.assertFalse(RefreshToken.objects.filter(digest=tokens.digest(second)).exists())
+        # The revoked token still trips reuse detection
+        self.assertEqual(self.refresh(first).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertFalse(RefreshToken.objects.filter(revoked_at__isnull=True).exists())
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_auth', iterations=5, json=True, stdout=out)
+        queries = {result['scheme']: result['queries_per_request'] for result in json.loads(out.getvalue())}
+        self.assertEqual(queries, {'token table': 1, 'cached token': 0, 'access token': 0})
+
     
         
         
@@ -0,0 +1,170 @@
+"""
+Comment reads for listings.
+
+Comments carry an optional `parent`; a page lists top-level comments (or the replies to one
+comment) and each entry gets a bounded preview of its direct replies. A page costs two queries
+whatever its size: the keyset page itself, joined to the article to apply its visibility, and
+one windowed query for every preview on the page. Functions prefixed with `a` are the
+async ORM versions used by apis/async_views.py.
+"""
+from django.conf import settings
+from django.db.models import Count, F, Max, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import Article, Comment
+
+DEFAULT_REPLY_PREVIEW = 3
+DEFAULT_EMBED_MAX = 10
+
+
+def reply_preview_size():
+    return getattr(settings, 'COMMENT_REPLY_PREVIEW', DEFAULT_REPLY_PREVIEW)
+
+
+def visible_articles():
+    # Comments are only listed for articles the public can read
+    return Article.objects.filter(is_published='published', created_at__lte=timezone.now())
+
+
+def thread_comments(slug, parent_id=None):
+    """
+    Top-level comments of an article (or the direct replies to `parent_id`),
+    filtered on the article's visibility in the same query.
+    """
+    queryset = Comment.objects.select_related('author').filter(
+        article__slug=slug,
+        article__in=visible_articles(),
+    )
+    if parent_id is None:
+        return queryset.filter(parent__isnull=True)
+    return queryset.filter(parent_id=parent_id)
+
+
+def thread_parent(slug, parent_id=None):
+    if parent_id is None:
+        return visible_articles().filter(slug=slug)
+    return Comment.objects.filter(pk=parent_id, article__slug=slug, article__in=visible_articles())
+
+
+def thread_exists(slug, parent_id=None):
+    """
+    Distinguish an empty page from a missing (or hidden) article or parent comment.
+    Only needed when a page came back empty.
+    """
+    return thread_parent(slug, parent_id).exists()
+
+
+async def athread_exists(slug, parent_id=None):
+    return await thread_parent(slug, parent_id).aexists()
+
+
+def activity_query(slug):
+    return visible_articles().filter(slug=slug).annotate(
+        latest=Max('comments__updated_at'), total=Count('comments'),
+    ).values_list('latest', 'total')
+
+
+def thread_activity(slug):
+    """
+    (latest comment update, comment count) for a visible article in one aggregate query,
+    or None when the article does not exist or is not visible.
+    """
+    # Not first(): its ORDER BY id would sort the grouped row in a temporary B-tree
+    return next(iter(activity_query(slug)[:1]), None)
+
+
+async def athread_activity(slug):
+    async for row in activity_query(slug)[:1]:
+        return row
+    return None
+
+
+def reply_preview_query(comments, limit):
+    """
+    The windowed query behind attach_reply_previews, after resetting every comment's preview;
+    None when there is nothing to fetch.
+    """
+    for comment in comments:
+        comment.reply_preview = []
+        comment.reply_count = 0
+    if not comments:
+        return None
+    return Comment.objects.select_related('author').filter(parent_id__in=[comment.pk for comment in comments]).annotate(
+        position=Window(RowNumber(), partition_by=[F('parent_id')], order_by=[F('created_at').asc(), F('id').asc()]),
+        siblings=Window(Count('id'), partition_by=[F('parent_id')]),
+    ).filter(position__lte=max(limit, 1)).order_by('parent_id', 'position')
+
+
+def fill_reply_previews(comments, replies, limit):
+    by_id = {comment.pk: comment for comment in comments}
+    for reply in replies:
+        parent = by_id[reply.parent_id]
+        parent.reply_count = reply.siblings
+        if reply.position <= limit:
+            parent.reply_preview.append(reply)
+    return comments
+
+
+def attach_reply_previews(comments, limit=None):
+    """
+    Set `reply_preview` (the first `limit` replies, oldest first) and `reply_count`
+    on every comment in `comments`, using one query.
+    """
+    limit = reply_preview_size() if limit is None else limit
+    replies = reply_preview_query(comments, limit)
+    return fill_reply_previews(comments, replies if replies is not None else [], limit)
+
+
+async def aattach_reply_previews(comments, limit=None):
+    limit = reply_preview_size() if limit is None else limit
+    replies = reply_preview_query(comments, limit)
+    return fill_reply_previews(comments, [reply async for reply in replies] if replies is not None else [], limit)
+
+
+def embed_limit(requested):
+    """
+    Number of comments to embed per article for a `?comments=N` value, capped by
+    settings.ARTICLE_EMBED_COMMENTS_MAX so payloads stay bounded; 0 when absent or invalid.
+    """
+    try:
+        wanted = int(requested or 0)
+    except (TypeError, ValueError):
+        return 0
+    return max(0, min(wanted, getattr(settings, 'ARTICLE_EMBED_COMMENTS_MAX', DEFAULT_EMBED_MAX)))
+
+
+def latest_comments_query(articles, limit):
+    """
+    The windowed query behind attach_latest_comments, after resetting every article's list;
+    None when there is nothing to fetch.
+    """
+    for article in articles:
+        article.latest_comments = []
+    if not articles or limit <= 0:
+        return None
+    return Comment.objects.select_related('author').filter(article_id__in=[article.pk for article in articles], status='approved').annotate(
+        position=Window(RowNumber(), partition_by=[F('article_id')], order_by=[F('created_at').desc(), F('id').desc()]),
+    ).filter(position__lte=limit).order_by('article_id', 'position')
+
+
+def fill_latest_comments(articles, comments):
+    by_id = {article.pk: article for article in articles}
+    for comment in comments:
+        by_id[comment.article_id].latest_comments.append(comment)
+    return articles
+
+
+def attach_latest_comments(articles, limit):
+    """
+    Set `latest_comments` on every article to its `limit` newest approved comments,
+    fetched for all of them in one windowed query.
+    """
+    comments = latest_comments_query(articles, limit)
+    return fill_latest_comments(articles, comments if comments is not None else [])
+
+
+async def aattach_latest_comments(articles, limit):
+    comments = latest_comments_query(articles, limit)
+    return fill_latest_comments(articles, [comment async for comment in comments] if comments is not None else [])
+
@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cms.settings')
+os.environ.setdefault('ASYNC_READ_VIEWS', 'True') # Read endpoints run natively on the event loop
 
 application = get_asgi_application()
+
+# Open the database connection pools (DATABASE_POOL=True) before the first request arrives.
+# Under gunicorn --preload this runs in the master; see gunicorn.conf.py
+from apis.pooling import warm_up  # noqa: E402
+
+warm_up()
@@ -28,6 +28,8 @@ AUTH_USER_MODEL = 'users.CustomUser'
 
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.getenv("SECRET_KEY")
+# Previous secret keys, comma-separated; signatures and sessions made with them stay valid after rotating SECRET_KEY
+SECRET_KEY_FALLBACKS = [key for key in os.getenv('SECRET_KEY_FALLBACKS', '').split(',') if key]
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.environ.get('DEBUG') == 'True'
@@ -49,12 +51,15 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'articles.apps.ArticlesConfig',
     'apis.apps.ApisConfig',
+    'jobs.apps.JobsConfig',
     'rest_framework',
     'drf_spectacular',
     'rest_framework.authtoken'
 ]
 
 MIDDLEWARE = [
+    'apis.metrics.MetricsMiddleware', # First, so it times the whole stack
+    'apis.replicas.ReplicaMiddleware', # Picks each request's read database before anything queries
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -90,9 +95,12 @@ WSGI_APPLICATION = 'cms.wsgi.application'
 REST_FRAMEWORK = {
     #OTHER DRF SETTINGS GO HERE
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_PAGINATION_CLASS': 'apis.pagination.KeysetPagination', # Cursor pages keyed on (created_at, id)
+    'PAGE_SIZE': 20,
     'DEFAULT_AUTHENTICATION_CLASSES':[
-        'rest_framework.authentication.TokenAuthentication',
-        'rest_framework.authentication.SessionAuthentication'            
+        'apis.authentication.AccessTokenAuthentication', # Signed access tokens from the login endpoint
+        'apis.authentication.CachedTokenAuthentication', # Token/session lookups served from the auth cache
+        'apis.authentication.CachedSessionAuthentication'
         ],
     'DEFAULT_THROTTLE_RATES': {
         # 'anon': '1000/day',         # General rate for anonymous users by IP
@@ -101,6 +109,7 @@ REST_FRAMEWORK = {
         'registration':'5/minute',
         # Specific, stricter rates for sensitive/resource-intensive actions
         'login': '5/minute',       # Limit login attempts per IP or user
+        'refresh': '30/minute',    # Limit access token refreshes per IP
         # 'registration': '20/hour',  # Limit registration attempts per IP
         'comment': '15/hour',      # Limit comments per hour per user
         'search': '6/minute',      # Limit search queries per user/IP
@@ -108,6 +117,18 @@ REST_FRAMEWORK = {
     }
 }
 
+# Rate-limit counters shared by every worker process on this host (apis/throttling.py)
+THROTTLE_DATABASE = os.getenv('THROTTLE_DATABASE', str(BASE_DIR / 'throttle.sqlite3'))
+
+# Request metrics shared by every worker process on this host (apis/metrics.py), served at /metrics
+METRICS_DATABASE = os.getenv('METRICS_DATABASE', str(BASE_DIR / 'metrics.sqlite3'))
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 10)) # Seconds a worker keeps its counts in memory before adding them to the file
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '') # Bearer token for the scraper; without one only staff may read /metrics
+
+# Benchmarks (benchmark_read_path) turn throttling off so they measure the views rather than 429s
+if os.environ.get('DISABLE_THROTTLING') == 'True':
+    REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] = dict.fromkeys(REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'])
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'CMS API',
     'DESCRIPTION': 'API for Content Management System',
@@ -137,6 +158,29 @@ else:
     }
 }
 
+# Read replicas: comma-separated database URLs, e.g. sqlite:////tmp/replica1.sqlite3.
+# GET/HEAD/OPTIONS requests read from one of them (apis/replicas.py); tests mirror them onto the primary.
+DATABASE_REPLICAS = []
+for number, url in enumerate(filter(None, os.getenv('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {**dj_database_url.parse(url.strip(), conn_max_age=600), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['apis.replicas.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '5')) # How long a client reads from the primary after writing
+
+# Connection pooling for PostgreSQL (psycopg 3): each process keeps MIN_SIZE..MAX_SIZE connections
+# per database, opened as the worker boots and checked before each use (apis/pooling.py)
+if os.getenv('DATABASE_POOL') == 'True':
+    for database in DATABASES.values():
+        if database['ENGINE'] == 'django.db.backends.postgresql':
+            database['CONN_MAX_AGE'] = 0 # The pool keeps the connections, not Django
+            database['CONN_HEALTH_CHECKS'] = True # Makes the pool check a connection before handing it out
+            database.setdefault('OPTIONS', {})['pool'] = {
+                'min_size': int(os.getenv('DATABASE_POOL_MIN_SIZE', '2')),
+                'max_size': int(os.getenv('DATABASE_POOL_MAX_SIZE', '10')),
+                'timeout': float(os.getenv('DATABASE_POOL_TIMEOUT', '10')), # Seconds a request may wait for a connection
+                'max_idle': float(os.getenv('DATABASE_POOL_MAX_IDLE', '300')), # Close connections above min_size idle this long
+            }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -193,15 +237,71 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL')
 SERVER_EMAIL = 'danieligboke669@gmail.com'
 
-# --- Cache Settings (for Throttling) ---
-# Configure a production cache backend (e.g., Redis on Render)
-# CACHES = {
-#     'default': {
-#         'BACKEND': 'django_redis.cache.RedisCache',
-#         'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/0'),
-#         'OPTIONS': {
-#             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
-#         }
-#     }
-# }
-# If using Redis on Render, they provide REDIS_URL environment variable.
+# Queued email (users/mail.py), delivered as jobs by `python manage.py runworker`
+EMAIL_MAX_ATTEMPTS = 5          # Give up on a message after this many failed sends (retries back off as JOBS_RETRY_*)
+EMAIL_CONNECTION_IDLE = 30      # Seconds a worker keeps an unused mail connection open
+
+# Background jobs (jobs app), run by `python manage.py runworker`
+JOBS_MAX_ATTEMPTS = 3       # Default attempts before a job is marked failed
+JOBS_RETRY_BASE = 30        # Seconds before the first retry, doubled on each failure
+JOBS_RETRY_MAX = 3600       # Longest wait between retries
+JOBS_LEASE_TIMEOUT = 600    # A running job not finished within this many seconds is reclaimed
+
+# Image derivatives (articles/images.py): longest side in pixels for each variant
+IMAGE_VARIANTS = {'thumbnail': 150, 'medium': 600, 'large': 1200}
+IMAGE_JPEG_QUALITY = 85
+IMAGE_WEBP_QUALITY = 80
+
+# Raise instead of logging when a view runs more queries than its @query_budget (apis/query_budget.py)
+QUERY_BUDGET_ENFORCE = DEBUG
+
+# Seconds an article list/detail response stays in the response cache (apis/response_cache.py)
+ARTICLE_CACHE_TIMEOUT = int(os.getenv('ARTICLE_CACHE_TIMEOUT', 300))
+
+# Replies shown under each comment in a comment listing (articles/threads.py)
+COMMENT_REPLY_PREVIEW = 3
+
+# Upper bound for ?comments=N on article list/detail responses
+ARTICLE_EMBED_COMMENTS_MAX = 10
+
+# Serve article list/detail, comment list and search reads from the async views (apis/async_views.py).
+# cms/asgi.py turns this on; WSGI servers keep the sync views
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS') == 'True'
+
+# Most operations accepted by POST /api/v1/articles/batch/
+ARTICLE_BATCH_MAX_OPERATIONS = 500
+
+# Seconds a token or session stays resolved to a cached user (apis/authentication.py)
+AUTH_CACHE_TIMEOUT = int(os.getenv('AUTH_CACHE_TIMEOUT', 60))
+
+# Signed access tokens and refresh tokens issued at login (users/tokens.py), in seconds
+ACCESS_TOKEN_LIFETIME = int(os.getenv('ACCESS_TOKEN_LIFETIME', 300))
+REFRESH_TOKEN_LIFETIME = int(os.getenv('REFRESH_TOKEN_LIFETIME', 14 * 24 * 3600))
+
+# Without REDIS_URL each worker process caches in its own memory. The version stamps that
+# invalidate cached responses then live in SHARED_STATE_DATABASE, so a write reaches every
+# worker on the host at once (apis/shared_state.py). Across several hosts, set REDIS_URL
+# (needs the redis package)
+REDIS_URL = os.getenv('REDIS_URL')
+SHARED_STATE_DATABASE = os.getenv('SHARED_STATE_DATABASE', str(BASE_DIR / 'shared_state.sqlite3'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # User snapshots for authentication, kept apart so they neither evict nor get evicted by
+    # responses. Per process, they are checked against revision stamps in SHARED_STATE_DATABASE
+    'auth': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL, 'KEY_PREFIX': 'auth',
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'auth',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# With a shared cache, session reads come from it and writes still go to the database. A
+# per-process cache would keep serving a session in other workers after logout()
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db' if REDIS_URL else 'django.contrib.sessions.backends.db'
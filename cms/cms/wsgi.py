@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cms.settings')
 
 application = get_wsgi_application()
+
+# Open the database connection pools (DATABASE_POOL=True) before the first request arrives.
+# Under gunicorn --preload this runs in the master; see gunicorn.conf.py
+from apis.pooling import warm_up  # noqa: E402
+
+warm_up()
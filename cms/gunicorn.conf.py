@@ -0,0 +1,22 @@
+"""
+gunicorn settings, read when gunicorn starts from this directory (`gunicorn cms.wsgi`).
+
+With --preload the master loads the application, and cms/wsgi.py opens the connection
+pools there. Workers must not share the master's connections, so the master closes its
+pools before forking and each worker opens its own (apis/pooling.py).
+Without --preload the master never loads Django, so the settings module is set here for
+the hooks.
+"""
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cms.settings')
+
+
+def when_ready(server):
+    from apis.pooling import close_pools
+    close_pools()
+
+
+def post_worker_init(worker):
+    from apis.pooling import warm_up
+    warm_up()
@@ -0,0 +1,12 @@
+from django.contrib import admin
+from .models import Job
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for background jobs.
+    """
+    list_display = ('task', 'status', 'priority', 'run_at', 'attempts', 'locked_by', 'finished_at')
+    list_filter = ('status', 'task')
+    search_fields = ('task',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'last_error')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from jobs.worker import Worker
+
+
+class Command(BaseCommand):
+    help = "Run background jobs from the job table on a thread or process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help="Jobs run at the same time.")
+        parser.add_argument('--mode', choices=['thread', 'process'], default='thread', help="Pool type used to run jobs.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between polls when the queue is idle.")
+        parser.add_argument('--start-method', choices=['fork', 'spawn', 'forkserver'], help="How --mode process starts its children (default: the platform's).")
+        parser.add_argument('--once', action='store_true', help="Exit once no job is due instead of waiting for more.")
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            concurrency=options['concurrency'],
+            mode=options['mode'],
+            poll_interval=options['poll_interval'],
+            start_method=options['start_method'],
+        )
+        if not options['once']:
+            worker.install_signal_handlers()
+        self.stdout.write(f"Worker {worker.worker_id} started ({options['mode']} x {options['concurrency']}).")
+        processed = worker.run(once=options['once'])
+        self.stdout.write(self.style.SUCCESS(f"Worker {worker.worker_id} stopped after {processed} job(s)."))
@@ -0,0 +1,41 @@
+from django.db import models
+from django.utils import timezone
+
+
+JOB_STATUS_CHOICES = [
+    ('queued', ('Queued')),
+    ('running', ('Running')),
+    ('done', ('Done')),
+    ('failed', ('Failed')),
+]
+
+class Job(models.Model):
+    """
+    A unit of background work: a registered task name plus its arguments.
+    Claimed and executed by `manage.py runworker`.
+    """
+    task = models.CharField(max_length=255, help_text="Registered task name")
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    priority = models.IntegerField(default=0, help_text="Higher runs first")
+    status = models.CharField(max_length=20, choices=JOB_STATUS_CHOICES, default='queued')
+    run_at = models.DateTimeField(default=timezone.now, help_text="Earliest time the job may run")
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    last_error = models.TextField(blank=True, default='')
+    locked_by = models.CharField(max_length=255, blank=True, default='', help_text="Worker holding the job")
+    locked_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-priority', 'run_at', 'id']
+        indexes = [
+            # Claiming looks for due queued jobs, highest priority first
+            models.Index(fields=['status', '-priority', 'run_at'], name='jobs_job_claim_idx'),
+            models.Index(fields=['status', 'finished_at'], name='jobs_job_finished_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
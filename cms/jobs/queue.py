@@ -0,0 +1,190 @@
+"""
+Database-backed job queue.
+
+Register a function with @task, queue it with enqueue() (or my_task.enqueue(...)),
+and run `python manage.py runworker` to execute it off the request path.
+Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED where the database supports it,
+and with a per-row compare-and-set UPDATE on SQLite. Claiming counts the attempt, so a job
+whose worker dies mid-task (OOM kill, segfault) still uses up its attempts and ends up
+failed instead of being reclaimed forever.
+"""
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+LOCK_RETRIES = 5
+
+
+def task(func=None, *, name=None):
+    """
+    Register a function as a background task.
+    The function gains an `enqueue(*args, **kwargs)` shortcut.
+    """
+    def register(func):
+        task_name = name or f'{func.__module__}.{func.__qualname__}'
+        registry[task_name] = func
+        func.task_name = task_name
+        func.enqueue = lambda *args, **kwargs: enqueue(func, *args, **kwargs)
+        return func
+    return register(func) if func is not None else register
+
+
+def enqueue(func, *args, priority=0, run_at=None, delay=None, max_attempts=None, **kwargs):
+    """
+    Queue a registered task. Arguments must be JSON serialisable.
+    `run_at` (datetime) or `delay` (seconds or timedelta) schedule it for later.
+    """
+    task_name = func if isinstance(func, str) else getattr(func, 'task_name', None)
+    if task_name not in registry:
+        raise ValueError(f"{func!r} is not a registered task")
+
+    if run_at is None:
+        run_at = timezone.now()
+        if delay is not None:
+            run_at += delay if isinstance(delay, timedelta) else timedelta(seconds=delay)
+    if max_attempts is None:
+        max_attempts = getattr(settings, 'JOBS_MAX_ATTEMPTS', 3)
+
+    return Job.objects.create(
+        task=task_name,
+        args=list(args),
+        kwargs=kwargs,
+        priority=priority,
+        run_at=run_at,
+        max_attempts=max_attempts,
+    )
+
+
+def lease_timeout():
+    return timedelta(seconds=getattr(settings, 'JOBS_LEASE_TIMEOUT', 600))
+
+
+def claimable(now):
+    """
+    Due queued jobs, plus running jobs whose lease ran out because their worker died.
+    JOBS_LEASE_TIMEOUT must therefore be longer than the slowest task.
+    """
+    return Job.objects.filter(
+        Q(status='queued', run_at__lte=now) |
+        Q(status='running', locked_at__lt=now - lease_timeout())
+    ).order_by('-priority', 'run_at', 'id')
+
+
+def claim(worker_id, limit):
+    """
+    Atomically take up to `limit` jobs for `worker_id`, mark them running and count the attempt.
+    """
+    now = timezone.now()
+    claimed = {'status': 'running', 'locked_by': worker_id, 'locked_at': now, 'attempts': F('attempts') + 1}
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(claimable(now).select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            Job.objects.filter(id__in=ids).update(**claimed)
+        return list(Job.objects.filter(id__in=ids).order_by('-priority', 'run_at', 'id'))
+
+    # Fallback: pick candidates, then claim each one only if nobody changed it in between
+    ids = []
+    for job in claimable(now).only('id', 'status', 'locked_at')[:limit * 2]:
+        won = Job.objects.filter(id=job.id, status=job.status, locked_at=job.locked_at).update(**claimed)
+        if won:
+            ids.append(job.id)
+            if len(ids) == limit:
+                break
+    return list(Job.objects.filter(id__in=ids).order_by('-priority', 'run_at', 'id'))
+
+
+def backoff(attempts):
+    base = getattr(settings, 'JOBS_RETRY_BASE', 30)
+    cap = getattr(settings, 'JOBS_RETRY_MAX', 3600)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), cap))
+
+
+def retry_locked(func):
+    """
+    Call `func`, retrying briefly while SQLite reports the table locked by another writer.
+    Only for single statements that are safe to repeat.
+    """
+    for attempt in range(LOCK_RETRIES):
+        try:
+            return func()
+        except OperationalError as e:
+            if 'locked' not in str(e) or attempt == LOCK_RETRIES - 1:
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+
+
+def execute(job_id, worker_id):
+    """
+    Run a claimed job and record the outcome. Safe to call from a thread or a child process.
+    Returns the job's final status.
+    """
+    job = retry_locked(lambda: Job.objects.get(pk=job_id))
+    if job.status != 'running' or job.locked_by != worker_id:
+        return job.status # Reclaimed by someone else after our lease ran out
+
+    job.started_at = timezone.now()
+    func = registry.get(job.task)
+    try:
+        if job.attempts > job.max_attempts:
+            # Reclaimed after its last attempt's worker died without recording an outcome
+            raise RuntimeError(f"Worker lost on the final attempt of {job.task!r}")
+        if func is None:
+            raise LookupError(f"Unknown task {job.task!r}")
+        func(*job.args, **job.kwargs)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_at = timezone.now() + backoff(job.attempts)
+        else:
+            job.status = 'failed'
+            job.finished_at = timezone.now()
+        logger.warning("Job %s (%s) failed on attempt %s", job.pk, job.task, job.attempts, exc_info=True)
+    else:
+        job.status = 'done'
+        job.last_error = ''
+        job.finished_at = timezone.now()
+
+    # Only while we still hold the lease: a worker that reclaimed the job owns its outcome now.
+    # The task has already run, so losing this write to a busy database would run it twice
+    finished = retry_locked(lambda: Job.objects.filter(pk=job.pk, locked_by=worker_id, locked_at=job.locked_at).update(
+        status=job.status, started_at=job.started_at, finished_at=job.finished_at, run_at=job.run_at,
+        last_error=job.last_error, locked_by='', locked_at=None,
+    ))
+    if not finished:
+        logger.warning("Job %s (%s) was reclaimed while it ran; its outcome was dropped", job.pk, job.task)
+        return retry_locked(lambda: Job.objects.values_list('status', flat=True).get(pk=job.pk))
+    return job.status
+
+
+def metrics(window=60):
+    """
+    Queue depth, lag and throughput. `window` is the throughput window in seconds.
+    """
+    now = timezone.now()
+    counts = dict.fromkeys(('queued', 'running', 'done', 'failed'), 0)
+    for row in Job.objects.order_by().values('status').annotate(n=Count('id')):
+        counts[row['status']] = row['n']
+
+    oldest_due = Job.objects.filter(status='queued', run_at__lte=now).aggregate(oldest=Min('run_at'))['oldest']
+    finished = Job.objects.filter(status__in=['done', 'failed'], finished_at__gte=now - timedelta(seconds=window)).count()
+    return {
+        **counts,
+        'due': Job.objects.filter(status='queued', run_at__lte=now).count(),
+        'lag_seconds': round((now - oldest_due).total_seconds(), 3) if oldest_due else 0.0,
+        'throughput_per_second': round(finished / window, 3),
+        'window_seconds': window,
+    }
+
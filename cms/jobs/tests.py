@@ -0,0 +1,167 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+import os
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework import status
+from users.models import CustomUser
+from .models import Job
+from .queue import task, enqueue, claim, execute, metrics, registry
+from .worker import Worker
+
+ran = []
+
+@task
+def record(value):
+    ran.append(value)
+
+@task(name='tests.explode')
+def explode():
+    raise RuntimeError("boom")
+
+
+class JobQueueTests(TestCase):
+    """
+    Tests for enqueueing, claiming and executing jobs.
+    """
+    def setUp(self):
+        ran.clear()
+
+    def test_only_registered_tasks_can_be_queued(self):
+        with self.assertRaises(ValueError):
+            enqueue(print, 'nope')
+        self.assertEqual(enqueue('tests.explode').task, 'tests.explode')
+
+    def test_claim_order_priority_and_schedule(self):
+        low = record.enqueue('low')
+        high = record.enqueue('high', priority=10)
+        later = record.enqueue('later', delay=60)
+
+        jobs = claim('w1', 10)
+        self.assertEqual([job.pk for job in jobs], [high.pk, low.pk])
+        self.assertTrue(all(job.status == 'running' and job.locked_by == 'w1' for job in jobs))
+        # Already claimed, and the delayed job is not due
+        self.assertEqual(claim('w2', 10), [])
+
+        Job.objects.filter(pk=later.pk).update(run_at=timezone.now())
+        self.assertEqual([job.pk for job in claim('w2', 10)], [later.pk])
+
+    def test_execute_success(self):
+        job = record.enqueue('hello')
+        claim('w1', 1)
+        self.assertEqual(execute(job.pk, 'w1'), 'done')
+        self.assertEqual(ran, ['hello'])
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.finished_at)
+
+    @override_settings(JOBS_RETRY_BASE=30)
+    def test_failures_retry_with_backoff_then_fail(self):
+        job = enqueue('tests.explode', max_attempts=2)
+        claim('w1', 1)
+        self.assertEqual(execute(job.pk, 'w1'), 'queued')
+        job.refresh_from_db()
+        self.assertIn("boom", job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=25))
+        self.assertEqual(claim('w1', 1), [])
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        claim('w1', 1)
+        self.assertEqual(execute(job.pk, 'w1'), 'failed')
+
+    @override_settings(JOBS_LEASE_TIMEOUT=60)
+    def test_jobs_of_dead_workers_are_reclaimed(self):
+        job = record.enqueue('orphan')
+        claim('dead', 1)
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(seconds=120))
+
+        self.assertEqual([j.pk for j in claim('alive', 1)], [job.pk])
+        # The dead worker can no longer complete it
+        self.assertEqual(execute(job.pk, 'dead'), 'running')
+        self.assertEqual(execute(job.pk, 'alive'), 'done')
+
+    @override_settings(JOBS_LEASE_TIMEOUT=60)
+    def test_claiming_counts_the_attempt_so_crashing_jobs_fail(self):
+        job = record.enqueue('poison', max_attempts=2)
+        for worker in ('w1', 'w2'):
+            # Each worker dies mid-task; only the lease expiry tells anyone
+            self.assertEqual([j.attempts for j in claim(worker, 1)], [int(worker[1])])
+            Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(seconds=120))
+
+        claim('w3', 1)
+        self.assertEqual(execute(job.pk, 'w3'), 'failed')
+        self.assertEqual(ran, []) # Not run a third time
+        job.refresh_from_db()
+        self.assertIn("final attempt", job.last_error)
+        self.assertEqual(claim('w4', 1), [])
+
+    @override_settings(JOBS_LEASE_TIMEOUT=60)
+    def test_outcome_of_an_expired_lease_is_dropped(self):
+        job = record.enqueue('slow')
+        claim('slow-worker', 1)
+
+        def reclaimed_meanwhile(value):
+            ran.append(value)
+            Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(seconds=120))
+            claim('other', 1)
+
+        with mock.patch.dict(registry, {record.task_name: reclaimed_meanwhile}):
+            self.assertEqual(execute(job.pk, 'slow-worker'), 'running')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), ('running', 'other'))
+        self.assertEqual(execute(job.pk, 'other'), 'done')
+
+    def test_metrics(self):
+        record.enqueue('a')
+        Job.objects.update(run_at=timezone.now() - timedelta(seconds=30))
+        done = record.enqueue('b')
+        claim('w1', 10)
+        execute(done.pk, 'w1')
+
+        stats = metrics(window=60)
+        self.assertEqual(stats['done'], 1)
+        self.assertEqual(stats['running'], 1)
+        self.assertEqual(stats['throughput_per_second'], round(1 / 60, 3))
+
+        record.enqueue('c')
+        Job.objects.filter(status='queued').update(run_at=timezone.now() - timedelta(seconds=30))
+        self.assertGreaterEqual(metrics()['lag_seconds'], 29)
+
+
+class RunWorkerTests(TransactionTestCase):
+    """
+    The runworker command drains the queue on a thread pool.
+    """
+    def setUp(self):
+        ran.clear()
+
+    def test_runworker_once(self):
+        for i in range(6):
+            record.enqueue(i)
+        out = StringIO()
+        call_command('runworker', '--once', '--concurrency', '3', '--poll-interval', '0.05', stdout=out)
+        self.assertEqual(sorted(ran), list(range(6)))
+        self.assertEqual(Job.objects.filter(status='done').count(), 6)
+        self.assertIn("after 6 job(s)", out.getvalue())
+
+    def test_process_pool_children_can_be_spawned(self):
+        # A spawned child imports the worker module before Django is set up
+        with Worker(concurrency=1, mode='process', start_method='spawn').make_pool() as pool:
+            self.assertIsInstance(pool.submit(os.getpid).result(timeout=120), int)
+
+
+class JobStatsEndpointTests(APITestCase):
+    def test_staff_only(self):
+        url = reverse('job-stats')
+        user = CustomUser.objects.create_user(username='jobuser', email='jobuser@ex.com', password='pass')
+        self.client.force_authenticate(user=user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        user.is_staff = True
+        user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('lag_seconds', response.data)
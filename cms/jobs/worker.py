@@ -0,0 +1,100 @@
+"""
+Worker loop behind `manage.py runworker`.
+
+In process mode the pool's children may be forked or spawned (macOS and Windows spawn by
+default). A spawned child starts with nothing set up, so _child_init runs django.setup()
+before any job, and this module imports the queue (and with it the models) only when used.
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import django
+from django.db import close_old_connections, connections
+
+logger = logging.getLogger(__name__)
+
+
+def run_job(job_id, worker_id):
+    """
+    Pool entry point: run one job on this thread/process's own database connection.
+    """
+    from . import queue
+    close_old_connections()
+    try:
+        return queue.execute(job_id, worker_id)
+    finally:
+        close_old_connections()
+
+
+def _child_init():
+    django.setup() # Needed under spawn; a no-op in a forked child
+    # Connections inherited over fork belong to the parent; drop them without closing the socket
+    for conn in connections.all():
+        conn.connection = None
+
+
+class Worker:
+    """
+    Claims jobs and runs them on a thread or process pool of `concurrency` slots.
+    """
+    def __init__(self, concurrency=4, mode='thread', poll_interval=1.0, worker_id=None, start_method=None):
+        self.concurrency = concurrency
+        self.mode = mode
+        self.start_method = start_method # 'fork', 'spawn' or 'forkserver'; None for the platform default
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.stopping = threading.Event()
+        self.processed = 0
+
+    def make_pool(self):
+        if self.mode == 'process':
+            connections.close_all() # Never fork with open connections
+            context = multiprocessing.get_context(self.start_method)
+            return ProcessPoolExecutor(max_workers=self.concurrency, mp_context=context, initializer=_child_init)
+        return ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='job')
+
+    def stop(self, *args):
+        self.stopping.set()
+
+    def install_signal_handlers(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+    def run(self, once=False):
+        """
+        Process jobs until stopped. With `once`, stop as soon as nothing is due.
+        """
+        from . import queue
+        in_flight = set()
+        with self.make_pool() as pool:
+            while not self.stopping.is_set():
+                free = self.concurrency - len(in_flight)
+                jobs = queue.claim(self.worker_id, free) if free else []
+                for job in jobs:
+                    in_flight.add(pool.submit(run_job, job.pk, self.worker_id))
+
+                if not in_flight:
+                    if once:
+                        break
+                    self.stopping.wait(self.poll_interval)
+                    continue
+
+                # Wake up when a slot frees, or poll again for newly due jobs
+                done, in_flight = wait(in_flight, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.processed += 1
+                    if future.exception() is not None:
+                        logger.error("Worker slot crashed", exc_info=future.exception())
+                in_flight = set(in_flight)
+
+            # Let running jobs finish before exiting
+            for future in in_flight:
+                future.result()
+                self.processed += 1
+        return self.processed
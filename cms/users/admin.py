@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from .forms import CustomUserCreationForm, CustomUserChangeForm
-from .models import CustomUser
+from .models import CustomUser, RefreshToken
 
 class CustomUserAdmin(UserAdmin):
     """
@@ -50,3 +50,12 @@ class CustomUserAdmin(UserAdmin):
 
 
 admin.site.register(CustomUser, CustomUserAdmin)
+
+@admin.register(RefreshToken)
+class RefreshTokenAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for refresh tokens; only digests are stored, so they can be revoked but not read.
+    """
+    list_display = ('user', 'created_at', 'expires_at', 'revoked_at')
+    search_fields = ('user__email',)
+    readonly_fields = ('user', 'digest', 'session_hash', 'created_at', 'expires_at')
@@ -0,0 +1,76 @@
+"""
+Transactional email, delivered by the job queue.
+
+Views call queue_mail() instead of send_mail(). It enqueues a send_email job (users/tasks.py)
+in the same transaction as the data the message refers to, so the message exists exactly
+when that change commits, and the request never waits on the mail server. `manage.py
+runworker` delivers it; a failed send is retried with the queue's backoff (JOBS_RETRY_*)
+up to EMAIL_MAX_ATTEMPTS times, and a worker killed mid-send still uses up the attempt.
+
+Each worker thread keeps its mail connection open between jobs, so a burst of messages goes
+out over one SMTP session. A connection left unused for EMAIL_CONNECTION_IDLE seconds, or
+one that just failed, is closed and a fresh one is opened for the next message.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+from jobs.queue import enqueue
+
+logger = logging.getLogger(__name__)
+
+SEND_TASK = 'users.tasks.send_email'
+
+_local = threading.local()
+
+
+def queue_mail(subject, message, from_email, recipient_list):
+    """
+    Queue a message for delivery; takes the same arguments as send_mail().
+    """
+    return enqueue(
+        SEND_TASK, subject, message, from_email, list(recipient_list),
+        max_attempts=getattr(settings, 'EMAIL_MAX_ATTEMPTS', 5),
+    )
+
+
+def connection():
+    """
+    This thread's open mail connection, (re)opened when missing or idle for too long.
+    """
+    backend = getattr(_local, 'backend', None)
+    if backend is not None and time.monotonic() - _local.used > getattr(settings, 'EMAIL_CONNECTION_IDLE', 30):
+        close_connection() # The server has probably dropped it by now
+        backend = None
+    if backend is None:
+        backend = get_connection(fail_silently=False)
+        backend.open()
+        _local.backend = backend
+    _local.used = time.monotonic()
+    return backend
+
+
+def close_connection():
+    backend, _local.backend = getattr(_local, 'backend', None), None
+    if backend is None:
+        return
+    try:
+        backend.close()
+    except Exception:
+        logger.warning("Closing the mail connection failed", exc_info=True)
+
+
+def deliver(subject, body, from_email, to):
+    """
+    Send one message over this thread's connection. Raises when it cannot be sent, so the
+    job is retried.
+    """
+    try:
+        EmailMessage(subject, body, from_email, to, connection=connection()).send()
+    except Exception:
+        # The SMTP session may be unusable after an error; the retry starts a fresh one
+        close_connection()
+        raise
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from users import tokens
+
+
+class Command(BaseCommand):
+    help = "Delete refresh tokens past their expiry. Run it daily, e.g. from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows deleted per statement.")
+
+    def handle(self, *args, **options):
+        deleted = tokens.prune(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired refresh token(s)."))
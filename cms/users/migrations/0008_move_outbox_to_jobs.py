@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def queue_as_jobs(apps, schema_editor):
+    # Messages still waiting in the outbox become send_email jobs (users/tasks.py)
+    EmailOutbox = apps.get_model('users', 'EmailOutbox')
+    Job = apps.get_model('jobs', 'Job')
+    Job.objects.bulk_create([
+        Job(
+            task='users.tasks.send_email',
+            args=[message.subject, message.body, message.from_email, message.to],
+            run_at=message.next_attempt_at,
+            attempts=message.attempts,
+            max_attempts=max(5, message.attempts + 1),
+            last_error=message.last_error,
+        )
+        for message in EmailOutbox.objects.filter(status='queued')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_refreshtoken'),
+        ('jobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(queue_as_jobs, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='EmailOutbox',
+        ),
+    ]
@@ -59,6 +59,7 @@ class CustomUser(AbstractUser):
     bio = models.TextField(blank=True, null=True)
     occupation = models.CharField(max_length=100, blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profile_pictures/', blank=True, null=True)
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False) # Filled in by the image job
     is_verified = models.BooleanField(
         ("verified"),
         default=False,
@@ -103,3 +104,24 @@ class CustomUser(AbstractUser):
 
     def __str__(self):
         return self.email
+
+
+class RefreshToken(models.Model):
+    """
+    A refresh token issued at login, stored only as a SHA-256 digest (users/tokens.py).
+    Exchanging it rotates it; logging out, or presenting it again after rotation, revokes it.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='refresh_tokens')
+    digest = models.CharField(max_length=64, unique=True)
+    session_hash = models.CharField(max_length=128, help_text="The user's session auth hash at issue; changes with the password")
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True) # prune_refresh_tokens deletes by it
+    revoked_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = ("refresh token")
+        verbose_name_plural = ("refresh tokens")
+
+    def __str__(self):
+        return f"{self.user} ({'revoked' if self.revoked_at else 'active'})"
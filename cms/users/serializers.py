@@ -1,16 +1,25 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from articles.images import variant_urls
 
 CustomUser = get_user_model()
 
 class LoginSerializer(serializers.Serializer):
     email = serializers.EmailField()
     password = serializers.CharField(style={'input_type': 'password'}, write_only=True)
+
+class RefreshTokenSerializer(serializers.Serializer):
+    refresh = serializers.CharField(write_only=True)
     
 class CustomUserSerializer(serializers.ModelSerializer):
+    profile_picture_variants = serializers.SerializerMethodField()
+
     class Meta:
         model= CustomUser
-        fields = ('id','username','email','first_name','last_name','other_name', 'occupation','bio', 'profile_picture')
+        fields = ('id','username','email','first_name','last_name','other_name', 'occupation','bio', 'profile_picture', 'profile_picture_variants')
+
+    def get_profile_picture_variants(self, obj):
+        return variant_urls(obj, 'profile_picture', self.context.get('request'))
 
 class CustomUserSearchSerializer(serializers.ModelSerializer):
     class Meta:
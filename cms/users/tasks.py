@@ -0,0 +1,10 @@
+from jobs.queue import task
+from . import mail
+
+
+@task
+def send_email(subject, body, from_email, to):
+    """
+    Deliver one message queued by mail.queue_mail().
+    """
+    mail.deliver(subject, body, from_email, to)
@@ -1,2 +1,122 @@
-from django.test import TestCase
+from django.test import override_settings
+from django.urls import reverse
+from django.core import mail
+from django.core.cache import cache
+from django.utils import timezone
+from datetime import timedelta
+from unittest import mock
+from rest_framework.test import APITestCase
+from rest_framework import status
+from django.core.mail import get_connection
+from .models import CustomUser
+from .mail import close_connection, queue_mail
+from jobs.models import Job
+from jobs.queue import claim, execute
+from apis import metrics, throttling
+import os
+import tempfile
 
+
+def setUpModule():
+    # Rate-limit counters, request metrics and cache version stamps live in SQLite files
+    # (apis/throttling.py, apis/metrics.py, apis/shared_state.py); give this run its own,
+    # and flush metrics only when a test asks
+    global throttle_dir, throttle_settings
+    throttle_dir = tempfile.TemporaryDirectory()
+    throttle_settings = override_settings(
+        THROTTLE_DATABASE=os.path.join(throttle_dir.name, 'throttle.sqlite3'),
+        METRICS_DATABASE=os.path.join(throttle_dir.name, 'metrics.sqlite3'),
+        SHARED_STATE_DATABASE=os.path.join(throttle_dir.name, 'shared_state.sqlite3'),
+        METRICS_FLUSH_INTERVAL=3600,
+    )
+    throttle_settings.enable()
+
+def tearDownModule():
+    metrics.reset() # Nothing left for the exit-time flush to write to the default file
+    throttle_settings.disable()
+    throttle_dir.cleanup()
+
+
+class EmailDeliveryTests(APITestCase):
+    """
+    Tests for queued email: a job written with the change, delivered by the job worker.
+    """
+    def setUp(self):
+        cache.clear()
+        throttling.reset() # Rate-limit counts from earlier tests
+        self.register_url = reverse("create-user")
+        self.addCleanup(close_connection)
+
+    def register(self):
+        return self.client.post(self.register_url, {
+            "username": "outboxuser",
+            "email": "outbox@example.com",
+            "password": "string",
+            "password2": "string",
+        }, format='json')
+
+    def run_jobs(self):
+        return [execute(job.pk, 'mail-test') for job in claim('mail-test', 100)]
+
+    def test_registration_queues_instead_of_sending(self):
+        response = self.register()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(mail.outbox), 0) # Nothing sent during the request
+
+        job = Job.objects.get()
+        user = CustomUser.objects.get(email="outbox@example.com")
+        self.assertEqual(job.task, 'users.tasks.send_email')
+        subject, body, from_email, to = job.args
+        self.assertEqual(to, ["outbox@example.com"])
+        self.assertIn(reverse('verify-email', kwargs={'user_id': user.pk, 'token': user.email_verification_token}), body)
+
+        self.assertEqual(self.run_jobs(), ['done'])
+        self.assertEqual(mail.outbox[0].to, ["outbox@example.com"])
+
+    def test_failed_registration_queues_nothing(self):
+        with mock.patch('apis.views.queue_mail', side_effect=RuntimeError("db down")):
+            with self.assertRaises(RuntimeError):
+                self.register()
+        # User row and job row share a transaction
+        self.assertFalse(CustomUser.objects.filter(email="outbox@example.com").exists())
+        self.assertFalse(Job.objects.exists())
+
+    def test_worker_sends_over_one_connection(self):
+        for i in range(3):
+            queue_mail("Hello", "Body", "noreply@example.com", [f"user{i}@example.com"])
+
+        with mock.patch('users.mail.get_connection', wraps=get_connection) as opened:
+            self.assertEqual(self.run_jobs(), ['done'] * 3)
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+
+    @override_settings(JOBS_RETRY_BASE=60, EMAIL_MAX_ATTEMPTS=2)
+    def test_failures_back_off_then_give_up(self):
+        job = queue_mail("Hello", "Body", "noreply@example.com", ["user@example.com"])
+
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError("connection refused")):
+            self.assertEqual(self.run_jobs(), ['queued'])
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, 1)
+            self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=50))
+            self.assertEqual(self.run_jobs(), []) # Not due yet
+
+            Job.objects.update(run_at=timezone.now())
+            self.assertEqual(self.run_jobs(), ['failed'])
+            job.refresh_from_db()
+            self.assertIn("connection refused", job.last_error)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_unreachable_server_backs_off(self):
+        queue_mail("Hello", "Body", "noreply@example.com", ["user@example.com"])
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open', side_effect=OSError("no route to host")):
+            self.assertEqual(self.run_jobs(), ['queued']) # The worker keeps going
+        self.assertIn("no route to host", Job.objects.get().last_error)
+
+    def test_a_failed_connection_is_replaced(self):
+        for i in range(2):
+            queue_mail("Hello", "Body", "noreply@example.com", [f"user{i}@example.com"])
+        with mock.patch('users.mail.get_connection', wraps=get_connection) as opened, \
+                mock.patch('django.core.mail.EmailMessage.send', side_effect=[OSError("reset"), 1]):
+            self.assertEqual(self.run_jobs(), ['queued', 'done'])
+        self.assertEqual(opened.call_count, 2)
@@ -0,0 +1,127 @@
+"""
+Signed access tokens and revocable refresh tokens issued at login.
+
+An access token is the user's id and verified/staff flags signed with django.core.signing
+(HMAC-SHA256 over SECRET_KEY, with a timestamp), so checking one is pure CPU: no table is
+read. Signatures made with a key listed in SECRET_KEY_FALLBACKS still verify, so SECRET_KEY
+can be rotated without signing everyone out. An access token cannot be revoked; it simply
+expires after ACCESS_TOKEN_LIFETIME seconds, and its flags are as of when it was issued.
+
+A refresh token is a random string stored only as a digest. Exchanging it for a new access
+token also replaces it with a new refresh token. Presenting one that was already exchanged
+means it leaked, so the user's other refresh tokens are revoked too. Changing the password
+or deactivating the user makes every existing refresh token useless. Each exchange adds a
+row, so `manage.py prune_refresh_tokens` deletes the expired ones.
+"""
+import secrets
+from datetime import timedelta
+from hashlib import sha256
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db import transaction
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from .models import RefreshToken
+
+CustomUser = get_user_model()
+
+SALT = 'users.tokens.access' # Keeps access tokens from verifying as any other signed value
+
+
+def access_lifetime():
+    return getattr(settings, 'ACCESS_TOKEN_LIFETIME', 300)
+
+
+def refresh_lifetime():
+    return getattr(settings, 'REFRESH_TOKEN_LIFETIME', 14 * 24 * 3600)
+
+
+def access_token(user):
+    return signing.dumps({'uid': user.pk, 'ver': user.is_verified, 'staff': user.is_staff}, salt=SALT)
+
+
+def read_access_token(token):
+    """
+    The claims signed into `token`. Raises signing.SignatureExpired once it is too old and
+    signing.BadSignature if it was not signed with SECRET_KEY or one of its fallbacks.
+    """
+    return signing.loads(token, salt=SALT, max_age=access_lifetime())
+
+
+def token_user(claims):
+    """
+    A user built from access token claims alone. Only id, is_verified and is_staff are
+    known, so it must never be saved.
+    """
+    return CustomUser(id=claims['uid'], is_verified=claims['ver'], is_staff=claims['staff'], is_active=True)
+
+
+def digest(raw):
+    return sha256(raw.encode('utf-8')).hexdigest()
+
+
+def session_hash_matches(token, user):
+    if constant_time_compare(token.session_hash, user.get_session_auth_hash()):
+        return True
+    # Issued before SECRET_KEY was rotated
+    return any(constant_time_compare(token.session_hash, fallback) for fallback in user.get_session_auth_fallback_hash())
+
+
+def issue_pair(user):
+    """
+    A new access token and refresh token for `user`, as returned by the login endpoint.
+    """
+    raw = secrets.token_urlsafe(32)
+    RefreshToken.objects.create(
+        user=user,
+        digest=digest(raw),
+        session_hash=user.get_session_auth_hash(),
+        expires_at=timezone.now() + timedelta(seconds=refresh_lifetime()),
+    )
+    return {'access': access_token(user), 'refresh': raw, 'expires_in': access_lifetime()}
+
+
+def rotate(raw):
+    """
+    Exchange a refresh token for a new pair. Returns None if it is unknown, expired,
+    revoked or no longer matches its user.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        token = RefreshToken.objects.select_for_update().select_related('user').filter(digest=digest(raw)).first()
+        if token is None:
+            return None
+        if token.revoked_at is not None:
+            # A rotated token came back: whoever holds the chain now may not be the user
+            RefreshToken.objects.filter(user_id=token.user_id, revoked_at__isnull=True).update(revoked_at=now)
+            return None
+        if token.expires_at <= now or not token.user.is_active or not session_hash_matches(token, token.user):
+            return None
+        token.revoked_at = now
+        token.save(update_fields=['revoked_at'])
+        return issue_pair(token.user)
+
+
+def revoke(raw):
+    """
+    Revoke a refresh token (logout). Returns whether an active one was found.
+    """
+    return RefreshToken.objects.filter(digest=digest(raw), revoked_at__isnull=True).update(revoked_at=timezone.now()) > 0
+
+
+def prune(batch_size=1000):
+    """
+    Delete refresh tokens past their expiry, `batch_size` rows per statement. Returns the
+    number deleted. Revoked tokens are kept until then: presenting a rotated one must still
+    revoke the user's other tokens.
+    """
+    now = timezone.now()
+    deleted = 0
+    while True:
+        ids = list(RefreshToken.objects.filter(expires_at__lte=now).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += RefreshToken.objects.filter(pk__in=ids).delete()[0]